@@ -0,0 +1,237 @@
+"""Warm-restart adoption of an already provisioned host.
+
+On a warm restart the bridges, ports and container interfaces created by a
+previous orchestrator run are left in place. This part rebuilds the state
+store from the live system before the first reconcile, so the reconciler
+only touches objects that are missing or differ from the config instead of
+provisioning everything again.
+
+OVS container ports are found through their ``container_id`` and
+``container_iface`` external IDs, Linux bridge ports through the veth name
+``lxbr-docker`` derives from them. Addresses are read back from the bridge
+and from inside the container network namespaces. Only settings that match
+the config are adopted, anything else is left for the reconciler to fix.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+from typing import TYPE_CHECKING, Any
+
+from app.attach import netns_path
+from app.docker_api import DockerError, get_docker
+from app.ipam import get_ip_pool, set_ip_range
+from app.model import compile_config
+from app.netlink import get_netlink
+from app.ovsdb import get_ovsdb
+from app.reconciler import (
+    container_iface_state,
+    container_port_attached,
+    parent_port,
+    port_in_sync,
+    take_snapshot,
+)
+from app.store import BRIDGE_PORT, get_store
+from app.utils import USE_LINUX_BRIDGE, ContainerInfoDict, get_logger
+
+if TYPE_CHECKING:
+    from app.model import BridgeSpec, ContainerIfaceSpec, VethPairSpec
+    from app.reconciler import HostSnapshot
+
+_LOGGER = get_logger("adopt")
+
+
+def _lease_address(bridge: str, family: str, owner: str, address: str) -> bool:
+    """Record a live address as leased to its owner.
+
+    :param bridge: bridge name
+    :type bridge: str
+    :param family: "ip" for IPv4 or "ip6" for IPv6
+    :type family: str
+    :param owner: container or bridge name
+    :type owner: str
+    :param address: address with prefix length
+    :type address: str
+    :return: True if the lease was recorded
+    :rtype: bool
+    """
+    if (pool := get_ip_pool(bridge, family)) is None:
+        get_store().set_lease(bridge, family, owner, address)
+        return True
+    if ipaddress.ip_interface(address).ip not in ipaddress.ip_network(pool.ip_range):
+        return False
+    try:
+        pool.reserve(owner, address)
+    except ValueError:
+        _LOGGER.warning("Not adopting %s of %s on %s", address, owner, bridge)
+        return False
+    return True
+
+
+def _adopt_bridge(spec: BridgeSpec, snap: HostSnapshot) -> int:
+    """Recover the IP ranges, address and parent VLANs of a live bridge.
+
+    :param spec: compiled bridge entry
+    :type spec: BridgeSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: number of adopted objects
+    :rtype: int
+    """
+    bridge = spec.name
+    if bridge not in snap.links.links:
+        return 0
+    if snap.ovs is not None and bridge not in snap.ovs.bridges:
+        return 0
+
+    store = get_store()
+    adopted = 1
+    addresses = snap.links.addresses_of(bridge)
+    for prefix in ("ip", "ip6"):
+        ip_range = spec.ranges[prefix]
+        if ip_range and store.get_range(bridge, prefix) is None:
+            set_ip_range(bridge, prefix, ip_range)
+        if (ip_addr := spec.addresses[prefix]) and ip_addr in addresses:
+            adopted += _lease_address(bridge, prefix, bridge, ip_addr)
+    return adopted + _adopt_parents(spec, snap)
+
+
+def _adopt_parents(spec: BridgeSpec, snap: HostSnapshot) -> int:
+    """Recover the VLAN settings of the parents attached to a bridge.
+
+    :param spec: compiled bridge entry
+    :type spec: BridgeSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: number of adopted parents
+    :rtype: int
+    """
+    adopted = 0
+    for parent in spec.parents:
+        try:
+            port = parent_port(parent)
+        except ValueError:
+            continue
+        if not port_in_sync(spec.name, port, parent.vlans, snap):
+            continue
+        get_store().set_iface(spec.name, BRIDGE_PORT, port, **parent.settings)
+        adopted += 1
+    return adopted
+
+
+def _container_addresses(pid: int, iface: str) -> list[str]:
+    """Return the addresses of an interface inside a container.
+
+    :param pid: PID of the container init process
+    :type pid: int
+    :param iface: interface name inside the container
+    :type iface: str
+    :return: addresses with prefix length
+    :rtype: list[str]
+    """
+    with get_netlink().netns(netns_path(pid)) as netlink:
+        return netlink.dump().addresses_of(iface)
+
+
+def _adopt_container_iface(spec: ContainerIfaceSpec, snap: HostSnapshot) -> int:
+    """Recover an attached container interface, its VLANs and addresses.
+
+    :param spec: compiled container interface entry
+    :type spec: ContainerIfaceSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: number of adopted objects
+    :rtype: int
+    """
+    container, info = spec.container, spec.info
+    if (cc := snap.containers.get(container)) is None or not cc.running:
+        return 0
+    if not container_port_attached(container, info, snap):
+        return 0
+
+    store = get_store()
+    store.set_iface(spec.bridge, container, spec.iface)
+    adopted = 1
+    if container_iface_state(spec, snap) == "ok":
+        for vlan_mode in ("vlan", "trunk"):
+            if value := info.get(vlan_mode):
+                store.set_iface(spec.bridge, container, spec.iface, vlan_mode=value)
+
+    return adopted + _adopt_container_addresses(container, info)
+
+
+def _adopt_container_addresses(container: str, info: ContainerInfoDict) -> int:
+    """Recover the addresses configured on a container interface.
+
+    :param container: container name
+    :type container: str
+    :param info: container interface details from the config
+    :type info: ContainerInfoDict
+    :return: number of adopted leases
+    :rtype: int
+    """
+    bridge, iface = info["bridge"], info["iface"]
+    try:
+        addresses = _container_addresses(get_docker().pid(container), iface)
+    except (DockerError, OSError):
+        _LOGGER.warning("Cannot read addresses of %s:%s", container, iface)
+        return 0
+    adopted = 0
+    for prefix, version in (("ip", 4), ("ip6", 6)):
+        wanted = info.get(f"{prefix}address")
+        for address in addresses:
+            ip_iface = ipaddress.ip_interface(address)
+            if ip_iface.version != version or ip_iface.is_link_local:
+                continue
+            if wanted and wanted != address:
+                continue
+            adopted += _lease_address(bridge, prefix, container, address)
+            break
+    return adopted
+
+
+def _adopt_veth_pair(spec: VethPairSpec, snap: HostSnapshot) -> int:
+    """Recover the VLAN settings of the ends of a live veth pair.
+
+    :param spec: compiled veth pair entry
+    :type spec: VethPairSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: number of adopted objects
+    :rtype: int
+    """
+    adopted = 0
+    for end in spec.ends:
+        if end.vlans is None:
+            continue
+        if not port_in_sync(spec.bridge, end.name, end.vlans, snap):
+            continue
+        settings = {spec.key: end.vlan} if end.vlan else {}
+        get_store().set_iface(spec.bridge, BRIDGE_PORT, end.name, **settings)
+        adopted += 1
+    return adopted
+
+
+def adopt_host_state(config: dict[str, Any]) -> int:
+    """Rebuild the state store from what is already provisioned on the host.
+
+    This blocks and switches namespaces, run it in a worker thread.
+
+    :param config: desired state, as returned by get_config()
+    :type config: dict[str, Any]
+    :return: number of adopted bridges, ports, interfaces and leases
+    :rtype: int
+    """
+    state = compile_config(config)
+    ovs = None if USE_LINUX_BRIDGE else get_ovsdb().dump()
+    snap = take_snapshot(ovs)
+    adopted = 0
+    with get_store().transaction():
+        for spec in state.bridges.values():
+            adopted += _adopt_bridge(spec, snap)
+        for cspec in state.container_ifaces:
+            adopted += _adopt_container_iface(cspec, snap)
+        for vspec in state.veth_pairs.values():
+            adopted += _adopt_veth_pair(vspec, snap)
+    _LOGGER.info("Adopted %d objects from the running host", adopted)
+    return adopted
@@ -0,0 +1,246 @@
+"""In-process attach engine for container interfaces.
+
+This part replaces the ``add-port`` command of ``ovs-docker`` and
+``lxbr-docker``. The veth peer is created straight inside the container
+network namespace, with its final name, MTU and MAC address. The namespace
+is then entered once to bring the interface up and to add its addresses
+and default routes.
+
+Any network namespace file works, e.g. ``/proc/<pid>/ns/net`` for a
+container or ``/var/run/netns/<name>`` for one created with ``ip netns``.
+"""
+
+from __future__ import annotations
+
+import errno
+import uuid
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from app.model import lxbr_port_name
+from app.netlink import get_netlink
+from app.ovsdb import get_ovsdb
+from app.utils import USE_LINUX_BRIDGE, get_logger
+
+if TYPE_CHECKING:
+    from app.netlink import Netlink
+
+_LOGGER = get_logger("attach")
+
+
+@dataclass(slots=True)
+class AttachSpec:
+    """Interface to attach to a bridge and push into a network namespace."""
+
+    bridge: str
+    iface: str
+    container: str
+    netns: str  # network namespace file
+    ipaddress: str = ""
+    ip6address: str = ""
+    macaddress: str = ""
+    gateway: str = ""
+    gateway6: str = ""
+    mtu: int = 0
+    # VLAN settings of the OVS port, a Linux bridge port gets them afterwards
+    tag: int | None = None
+    trunks: list[int] | None = None
+    # host side veth of an earlier attach that is no longer on the bridge
+    stale_port: str = ""
+
+
+def _port_name(spec: AttachSpec) -> str:
+    """Return a host side veth name the helper scripts would also use.
+
+    :param spec: interface details
+    :type spec: AttachSpec
+    :return: host side veth name
+    :rtype: str
+    """
+    if USE_LINUX_BRIDGE:
+        return lxbr_port_name(spec.container, spec.iface)
+    return f"{uuid.uuid4().hex[:13]}_l"
+
+
+def netns_path(pid: int) -> str:
+    """Return the network namespace file of a process.
+
+    :param pid: process ID, e.g. of a container init process
+    :type pid: int
+    :return: namespace file path
+    :rtype: str
+    """
+    return f"/proc/{pid}/ns/net"
+
+
+def _attach_host_side(spec: AttachSpec, port: str) -> None:
+    """Create the veth pair and add the host end to the bridge.
+
+    :param spec: interface details
+    :type spec: AttachSpec
+    :param port: host side veth name
+    :type port: str
+    """
+    netlink = get_netlink()
+
+    def _create_veth() -> None:
+        netlink.create_veth(
+            port,
+            spec.iface,
+            peer_netns=spec.netns,
+            peer_mtu=spec.mtu,
+            peer_address=spec.macaddress,
+        )
+
+    try:
+        _create_veth()
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+        # The container kept the interface of an attach the bridge lost
+        # track of, e.g. after OVS was restarted.
+        _remove_netns_leftover(spec)
+        _create_veth()
+
+    try:
+        if USE_LINUX_BRIDGE:
+            netlink.set_master(port, spec.bridge)
+        else:
+            with get_ovsdb().batch() as txn:
+                txn.add_port(
+                    spec.bridge,
+                    port,
+                    external_ids={
+                        "container_id": spec.container,
+                        "container_iface": spec.iface,
+                    },
+                    tag=spec.tag,
+                    trunks=spec.trunks,
+                )
+    except Exception:
+        _LOGGER.exception("Failed to add %s port to bridge %s", port, spec.bridge)
+        netlink.delete_link(port)
+        raise
+
+    netlink.set_link_up(port)
+
+
+def _remove_netns_leftover(spec: AttachSpec) -> None:
+    """Delete the interface from the namespace, taking its veth peer along.
+
+    :param spec: interface details
+    :type spec: AttachSpec
+    """
+    with get_netlink().netns(spec.netns) as netlink:
+        if netlink.link(spec.iface) is not None:
+            _LOGGER.debug(
+                "Interface %s exists inside %s, but not on bridge. Removing...",
+                spec.iface,
+                spec.container,
+            )
+            netlink.delete_link(spec.iface)
+
+
+def _remove_stale_port(port: str) -> None:
+    """Remove the host side of an earlier attach, whatever is left of it.
+
+    :param port: host side veth name
+    :type port: str
+    """
+    if not USE_LINUX_BRIDGE:
+        with get_ovsdb().batch() as txn:
+            txn.del_port(port)
+    if get_netlink().link(port) is not None:
+        get_netlink().delete_link(port)
+    _LOGGER.debug("Removed stale port %s", port)
+
+
+def detach_interface(port: str) -> None:
+    """Remove the host end from OVS and delete the veth pair.
+
+    The container end goes away together with the host end.
+
+    :param port: host side veth name
+    :type port: str
+    """
+    if not USE_LINUX_BRIDGE:
+        with get_ovsdb().batch() as txn:
+            txn.del_port(port)
+    get_netlink().delete_link(port)
+
+
+def _configure_netns_side(spec: AttachSpec) -> None:
+    """Bring up the interface inside the namespace and add addresses and routes.
+
+    :param spec: interface details
+    :type spec: AttachSpec
+    """
+    with get_netlink().netns(spec.netns) as netlink:
+        netlink.set_link_up(spec.iface)
+        if spec.ipaddress:
+            netlink.add_address(spec.iface, spec.ipaddress)
+        if spec.ip6address:
+            netlink.enable_ipv6(spec.iface)
+            netlink.add_address(spec.iface, spec.ip6address)
+        for gateway in (spec.gateway, spec.gateway6):
+            if gateway:
+                _add_default_route(netlink, spec, gateway)
+
+
+def _add_default_route(netlink: Netlink, spec: AttachSpec, gateway: str) -> None:
+    """Add a default route inside the namespace, never failing the attach.
+
+    A container with a gateway on several interfaces gets a single default
+    route per family, from the first interface attached, like the add-port
+    scripts which ignored a failing route.
+
+    :param netlink: client inside the namespace
+    :type netlink: Netlink
+    :param spec: interface details
+    :type spec: AttachSpec
+    :param gateway: IPv4 or IPv6 gateway address
+    :type gateway: str
+    """
+    try:
+        netlink.add_default_route(gateway)
+    except OSError as exc:
+        if exc.errno == errno.EEXIST:
+            _LOGGER.debug(
+                "%s already has a default route, not adding one via %s",
+                spec.container,
+                gateway,
+            )
+        else:
+            _LOGGER.warning(
+                "Failed to add default route via %s in %s: %s",
+                gateway,
+                spec.container,
+                exc,
+            )
+
+
+def attach_interface(spec: AttachSpec) -> str:
+    """Attach an interface to a bridge and push it into a network namespace.
+
+    This blocks and switches namespaces, run it in a worker thread.
+
+    :param spec: interface details
+    :type spec: AttachSpec
+    :return: host side veth name
+    :rtype: str
+    :raises NetlinkError: if the kernel rejects a link or an address
+    """
+    if spec.stale_port:
+        _remove_stale_port(spec.stale_port)
+    port = _port_name(spec)
+    _attach_host_side(spec, port)
+    try:
+        _configure_netns_side(spec)
+    except OSError:
+        _LOGGER.exception(
+            "Failed to configure %s inside %s, removing it", spec.iface, spec.netns
+        )
+        detach_interface(port)
+        raise
+    _LOGGER.debug("Attached %s:%s via %s", spec.container, spec.iface, port)
+    return port
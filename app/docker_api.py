@@ -0,0 +1,241 @@
+"""Docker Engine API client.
+
+This part talks to the Docker daemon over ``DOCKER_SOCKET`` with a small
+pool of keep-alive HTTP connections instead of forking the docker CLI.
+A single ``/containers/json`` call per reconcile cycle answers every
+container lookup of that cycle.
+"""
+
+from __future__ import annotations
+
+import json
+import queue
+import socket
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import cache
+from http.client import HTTPConnection, HTTPException
+from pathlib import Path
+from typing import Any
+
+from app.utils import DOCKER_SOCKET, SIMULATED_HOST, get_logger, record_request
+
+_LOGGER = get_logger("docker_api")
+
+
+class DockerError(Exception):
+    """Raised when the Docker Engine API returns an error."""
+
+
+@dataclass(slots=True)
+class ContainerInfo:
+    """Container details used by the orchestrator."""
+
+    id: str
+    name: str
+    state: str
+    pid: int = 0
+
+    @property
+    def running(self) -> bool:
+        """Return True if the container is running.
+
+        :return: container run state
+        :rtype: bool
+        """
+        return self.state == "running"
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """HTTP connection over a unix domain socket."""
+
+    def __init__(self, path: Path, timeout: float) -> None:
+        """Initialise the connection.
+
+        :param path: unix socket path
+        :type path: Path
+        :param timeout: socket timeout in seconds
+        :type timeout: float
+        """
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self) -> None:
+        """Connect to the unix socket."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(str(self._path))
+        self.sock = sock
+
+
+class DockerClient:
+    """Pooled Docker Engine API client with a per-cycle container snapshot."""
+
+    def __init__(
+        self,
+        path: Path = DOCKER_SOCKET,
+        pool_size: int = 4,
+        timeout: float = 10.0,
+        max_age: float = 1.0,
+    ) -> None:
+        """Initialise the client, connections are opened on demand.
+
+        :param path: Docker daemon unix socket
+        :type path: Path
+        :param pool_size: number of idle connections kept open
+        :type pool_size: int
+        :param timeout: socket timeout in seconds
+        :type timeout: float
+        :param max_age: minimum age in seconds of the snapshot before a lookup
+                        miss triggers a refresh
+        :type max_age: float
+        """
+        self._path = path
+        self._timeout = timeout
+        self._max_age = max_age
+        self._pool: queue.LifoQueue[UnixHTTPConnection] = queue.LifoQueue(pool_size)
+        self._containers: dict[str, ContainerInfo] = {}
+        self._refreshed = 0.0
+
+    @contextmanager
+    def _connection(self) -> Iterator[UnixHTTPConnection]:
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = UnixHTTPConnection(self._path, self._timeout)
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _request(self, method: str, url: str) -> Any:  # noqa: ANN401
+        with self._connection() as conn:
+            conn.request(method, url)
+            response = conn.getresponse()
+            body = response.read()
+        if response.status >= 400:  # noqa: PLR2004
+            msg = f"{method} {url} failed with {response.status}: {body.decode()}"
+            raise DockerError(msg)
+        return json.loads(body) if body else None
+
+    def request(self, method: str, url: str) -> Any:  # noqa: ANN401
+        """Send an API request and return the decoded JSON body.
+
+        A pooled connection closed by the daemon is retried once on a new one.
+
+        :param method: HTTP method
+        :type method: str
+        :param url: API path including query string
+        :type url: str
+        :return: decoded response body
+        :rtype: Any
+        """
+        start = time.perf_counter()
+        failed = True
+        try:
+            try:
+                result = self._request(method, url)
+            except (HTTPException, ConnectionError):
+                result = self._request(method, url)
+            failed = False
+            return result
+        finally:
+            record_request("docker-api", method, start, failed)
+
+    def refresh(self) -> dict[str, ContainerInfo]:
+        """Reload all containers with a single ``/containers/json`` call.
+
+        Already known PIDs are kept as long as the container ID and state
+        do not change and no start, restart or die event forgot them.
+
+        :return: containers keyed by name
+        :rtype: dict[str, ContainerInfo]
+        """
+        previous = self._containers
+        containers: dict[str, ContainerInfo] = {}
+        for entry in self.request("GET", "/containers/json?all=1"):
+            for name in entry["Names"]:
+                info = ContainerInfo(
+                    id=entry["Id"], name=name.lstrip("/"), state=entry["State"]
+                )
+                if (
+                    (old := previous.get(info.name))
+                    and old.id == info.id
+                    and old.state == info.state
+                ):
+                    info.pid = old.pid
+                containers[info.name] = info
+        self._containers = containers
+        self._refreshed = time.monotonic()
+        _LOGGER.debug("Loaded %s containers from the Docker API", len(containers))
+        return containers
+
+    def forget_pid(self, name: str) -> None:
+        """Drop the known PID of a container that started, restarted or died.
+
+        ``docker restart`` keeps the container ID and ends in the same
+        state, so only the event tells that the PID changed.
+
+        :param name: container name
+        :type name: str
+        """
+        if (info := self._containers.get(name)) is not None:
+            info.pid = 0
+
+    def container(self, name: str) -> ContainerInfo | None:
+        """Look up a container by name in the current snapshot.
+
+        A miss reloads the snapshot if it is older than ``max_age``, so
+        containers started since the last cycle are still found.
+
+        :param name: container name
+        :type name: str
+        :return: container details or None if it does not exist
+        :rtype: ContainerInfo | None
+        """
+        info = self._containers.get(name)
+        stale = time.monotonic() - self._refreshed > self._max_age
+        if (info is None or not info.running) and stale:
+            info = self.refresh().get(name)
+        return info
+
+    def pid(self, name: str) -> int:
+        """Return the PID of a running container.
+
+        :param name: container name
+        :type name: str
+        :return: PID of the container init process
+        :rtype: int
+        :raises DockerError: if the container is not running
+        """
+        if (info := self.container(name)) is None or not info.running:
+            msg = f"Container {name} is not running"
+            raise DockerError(msg)
+        if not info.pid:
+            info.pid = self.request("GET", f"/containers/{info.id}/json")["State"][
+                "Pid"
+            ]
+        return info.pid
+
+
+@cache
+def get_docker() -> DockerClient:
+    """Return the shared Docker Engine API client.
+
+    :return: Docker client bound to ``DOCKER_SOCKET``, or to the simulated
+             host if SIMULATED_HOST is set
+    :rtype: DockerClient
+    """
+    if SIMULATED_HOST:
+        # app.sim builds on this module, import it on demand
+        from app.sim import SimDockerClient, get_sim_host  # noqa: PLC0415
+
+        return SimDockerClient(get_sim_host())
+    return DockerClient()
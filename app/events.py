@@ -0,0 +1,301 @@
+"""Host event watchers driving targeted reconciliation.
+
+This part listens to the Docker ``/events`` stream, to rtnetlink link
+notifications and to changes of the config file, and feeds the affected
+container, link, bridge and veth pair names into a queue the main loop
+waits on.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import suppress
+from typing import Any
+from urllib.parse import quote
+
+from app.docker_api import get_docker
+from app.inotify import (
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_MODIFY,
+    IN_MOVED_TO,
+    add_watch,
+    open_inotify,
+    parse_inotify_events,
+)
+from app.netlink import open_link_monitor, parse_link_events
+from app.reconciler import WorkSet, config_changes
+from app.utils import (
+    CONFIG_PATH,
+    DOCKER_SOCKET,
+    TOPOLOGY_LOCK,
+    get_config,
+    get_logger,
+)
+
+_LOGGER = get_logger("events")
+
+_DOCKER_FILTERS = json.dumps(
+    {"type": ["container"], "event": ["start", "restart", "die"]}
+)
+_RETRY_DELAY = 5
+
+
+async def _read_docker_events(
+    reader: asyncio.StreamReader, events: asyncio.Queue[tuple[str, str]]
+) -> None:
+    while (await reader.readline()).strip():
+        pass  # skip response headers
+    while line := await reader.readline():
+        event = json.loads(line)
+        if name := event.get("Actor", {}).get("Attributes", {}).get("name"):
+            _LOGGER.debug("Docker event %s for %s", event.get("Action"), name)
+            get_docker().forget_pid(name)
+            await events.put(("container", name))
+
+
+async def watch_docker_events(events: asyncio.Queue[tuple[str, str]]) -> None:
+    """Queue the name of every container that starts, restarts or dies.
+
+    Events missed while the stream was down are covered by queueing a full
+    sweep after every reconnect.
+
+    :param events: queue of (kind, name) events
+    :type events: asyncio.Queue[tuple[str, str]]
+    """
+    # HTTP/1.0 makes the daemon stream the events without chunked encoding.
+    request = (
+        f"GET /events?filters={quote(_DOCKER_FILTERS)} HTTP/1.0\r\n"
+        "Host: localhost\r\n\r\n"
+    ).encode()
+    connected_before = False
+    while True:
+        writer = None
+        try:
+            reader, writer = await asyncio.open_unix_connection(DOCKER_SOCKET)
+            writer.write(request)
+            await writer.drain()
+            if b" 200 " not in (status := await reader.readline()):
+                _LOGGER.error("Docker events request failed: %s", status.decode())
+            else:
+                if connected_before:
+                    await events.put(("sweep", ""))
+                connected_before = True
+                await _read_docker_events(reader, events)
+        except (OSError, ValueError):
+            _LOGGER.exception("Docker event stream failed, reconnecting")
+        finally:
+            if writer is not None:
+                writer.close()
+        await asyncio.sleep(_RETRY_DELAY)
+
+
+async def watch_link_events(events: asyncio.Queue[tuple[str, str]]) -> None:
+    """Queue the name of every link that is added, changed or removed.
+
+    :param events: queue of (kind, name) events
+    :type events: asyncio.Queue[tuple[str, str]]
+    """
+    loop = asyncio.get_running_loop()
+    sock = open_link_monitor()
+    try:
+        while True:
+            try:
+                data = await loop.sock_recv(sock, 1 << 16)
+            except OSError:
+                # Notifications were dropped (ENOBUFS), fall back to a sweep.
+                _LOGGER.exception("Link monitor overrun")
+                await events.put(("sweep", ""))
+                continue
+            for _, link in parse_link_events(data):
+                await events.put(("link", link.name))
+    finally:
+        sock.close()
+
+
+def _read_config() -> tuple[str, dict[str, Any] | None]:
+    """Read and parse the config file.
+
+    :return: SHA-256 of the content, parsed config or None if unusable
+    :rtype: tuple[str, dict[str, Any] | None]
+    """
+    try:
+        data = CONFIG_PATH.read_bytes()
+    except OSError:
+        _LOGGER.exception("Cannot read %s", CONFIG_PATH)
+        return "", None
+    digest = hashlib.sha256(data).hexdigest()
+    try:
+        return digest, json.loads(data)
+    except ValueError as e:
+        # Possibly caught halfway through a write, the next event retries.
+        _LOGGER.warning("Ignoring invalid config file %s: %s", CONFIG_PATH, e)
+        return digest, None
+
+
+async def _reload_config(
+    digest: str, loaded: dict[str, Any]
+) -> tuple[str, dict[str, Any], list[tuple[str, str]]]:
+    """Apply the edits made to the config file since it was last loaded.
+
+    Only what changed in the file is merged into the desired state, so
+    entries added through the API are kept, and the result is applied like
+    a PUT /topology, tearing down the entries removed from the file. The
+    caller holds TOPOLOGY_LOCK.
+
+    :param digest: SHA-256 of the content last loaded
+    :type digest: str
+    :param loaded: content last loaded
+    :type loaded: dict[str, Any]
+    :return: digest and content now loaded, events for the
+             added or changed entries
+    :rtype: tuple[str, dict[str, Any], list[tuple[str, str]]]
+    """
+    # Importing the planner at the top would import the orchestrator first.
+    from app.topology import (  # noqa: PLC0415
+        apply_topology,
+        check_topology,
+        merge_topology,
+        normalize_topology,
+        plan_topology,
+    )
+
+    new_digest, config = _read_config()
+    if config is None or new_digest == digest:
+        return digest, loaded, []
+    current = normalize_topology(get_config())
+    desired = merge_topology(
+        current, normalize_topology(loaded), normalize_topology(config)
+    )
+    if errors := check_topology(desired):
+        _LOGGER.warning("Ignoring config file %s: %s", CONFIG_PATH, "; ".join(errors))
+        return digest, loaded, []
+
+    changes = config_changes(current, desired)
+    plan = plan_topology(current, desired)
+    failed = await apply_topology(plan, current, desired)
+    _LOGGER.info(
+        "Reloaded %s: %d changes, %d failed", CONFIG_PATH, len(plan), len(failed)
+    )
+    return new_digest, config, changes
+
+
+async def watch_config(events: asyncio.Queue[tuple[str, str]]) -> None:
+    """Reload the config file whenever its content changes.
+
+    The file and its directory are watched through inotify, so both in
+    place writes and editors replacing the file are seen. Every bridge,
+    container and veth pair entry that was added or changed is also queued,
+    so the reconciler retries what the apply could not do.
+
+    :param events: queue of (kind, name) events
+    :type events: asyncio.Queue[tuple[str, str]]
+    """
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    fd = open_inotify()
+    loop.add_reader(fd, readable.set)
+    file_mask = IN_CLOSE_WRITE | IN_MODIFY
+    # Edits are diffed against the file as loaded at startup, not get_config().
+    digest, config = _read_config()
+    loaded = config or {}
+    try:
+        add_watch(fd, CONFIG_PATH.parent, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        with suppress(OSError):
+            add_watch(fd, CONFIG_PATH, file_mask)
+        while True:
+            await readable.wait()
+            readable.clear()
+            try:
+                data = os.read(fd, 1 << 16)
+            except BlockingIOError:
+                continue
+            if all(
+                name not in ("", CONFIG_PATH.name)
+                for _, _, name in parse_inotify_events(data)
+            ):
+                continue
+            # A replaced file is a new inode, move the watch over to it.
+            with suppress(OSError):
+                add_watch(fd, CONFIG_PATH, file_mask)
+            # Do not overwrite the config a topology apply is replacing.
+            async with TOPOLOGY_LOCK:
+                digest, loaded, changes = await _reload_config(digest, loaded)
+            for change in changes:
+                await events.put(change)
+    finally:
+        loop.remove_reader(fd)
+        os.close(fd)
+
+
+def start_watchers(events: asyncio.Queue[tuple[str, str]]) -> list[asyncio.Task]:
+    """Start the Docker, link and config file watchers.
+
+    :param events: queue of (kind, name) events
+    :type events: asyncio.Queue[tuple[str, str]]
+    :return: watcher tasks, to be cancelled on shutdown
+    :rtype: list[asyncio.Task]
+    """
+    return [
+        asyncio.create_task(watch_docker_events(events)),
+        asyncio.create_task(watch_link_events(events)),
+        asyncio.create_task(watch_config(events)),
+    ]
+
+
+async def stop_watchers(tasks: list[asyncio.Task]) -> None:
+    """Cancel the event watchers and wait for them to finish.
+
+    :param tasks: watcher tasks
+    :type tasks: list[asyncio.Task]
+    """
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+async def collect_work(
+    events: asyncio.Queue[tuple[str, str]],
+    interval: float,
+    settle: float = 0.2,
+    last_full: float | None = None,
+) -> WorkSet:
+    """Wait for events and gather them into a work set.
+
+    Events arriving within ``settle`` seconds of the first one are handled
+    together, so a burst of container starts costs a single cycle. A full
+    sweep is returned once ``interval`` seconds passed since the last one,
+    even under a steady stream of events, which then ride along with it.
+
+    :param events: queue of (kind, name) events
+    :type events: asyncio.Queue[tuple[str, str]]
+    :param interval: seconds between two full sweeps at most
+    :type interval: float
+    :param settle: seconds to wait for further events after the first one
+    :type settle: float
+    :param last_full: time.monotonic() of the last full sweep, defaults to now
+    :type last_full: float | None
+    :return: work set for the next cycle
+    :rtype: WorkSet
+    """
+    due = (time.monotonic() if last_full is None else last_full) + interval
+    work = WorkSet()
+    try:
+        timeout = max(due - time.monotonic(), 0)
+        work.add(*await asyncio.wait_for(events.get(), timeout))
+    except TimeoutError:
+        work.full = True
+        return work
+
+    await asyncio.sleep(settle)
+    while not events.empty():
+        work.add(*events.get_nowait())
+    if time.monotonic() >= due:
+        work.full = True
+    return work
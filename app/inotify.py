@@ -0,0 +1,84 @@
+"""Minimal inotify bindings.
+
+The standard library does not expose inotify, so this part calls
+``inotify_init1``/``inotify_add_watch`` from the C library and decodes the
+event records read from the inotify file descriptor.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import struct
+from functools import cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+# event masks, see linux/inotify.h
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+
+_EVENT = struct.Struct("=iIII")
+
+
+@cache
+def _libc() -> ctypes.CDLL:
+    return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+
+def _check(result: int) -> int:
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+
+def open_inotify() -> int:
+    """Open a non-blocking inotify file descriptor.
+
+    :return: inotify file descriptor, to be closed with os.close()
+    :rtype: int
+    :raises OSError: if the kernel refuses a new inotify instance
+    """
+    return _check(_libc().inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC))
+
+
+def add_watch(fd: int, path: Path, mask: int) -> int:
+    """Watch a file or directory, or update the mask of an existing watch.
+
+    :param fd: inotify file descriptor
+    :type fd: int
+    :param path: file or directory to watch
+    :type path: Path
+    :param mask: IN_* events to report
+    :type mask: int
+    :return: watch descriptor
+    :rtype: int
+    :raises OSError: if the path cannot be watched, e.g. it does not exist
+    """
+    return _check(_libc().inotify_add_watch(fd, os.fsencode(path), mask))
+
+
+def parse_inotify_events(data: bytes) -> list[tuple[int, int, str]]:
+    """Parse the event records read from an inotify file descriptor.
+
+    :param data: bytes read from the descriptor
+    :type data: bytes
+    :return: (watch descriptor, mask, name) for every event, the name is
+             empty for events on the watched path itself
+    :rtype: list[tuple[int, int, str]]
+    """
+    events = []
+    offset = 0
+    while offset + _EVENT.size <= len(data):
+        wd, mask, _, length = _EVENT.unpack_from(data, offset)
+        offset += _EVENT.size
+        name = data[offset : offset + length].rstrip(b"\0")
+        events.append((wd, mask, os.fsdecode(name)))
+        offset += length
+    return events
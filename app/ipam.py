@@ -0,0 +1,246 @@
+"""Indexed IP address allocation for bridge IP ranges.
+
+This part keeps an in-memory index over the address leases of a bridge
+range, so allocating, reserving and releasing an address does not scan the
+range or the existing leases. The leases themselves are kept in the state
+store as ``{owner: "address/prefix"}``.
+"""
+
+from __future__ import annotations
+
+import heapq
+import ipaddress
+from collections.abc import Iterator, MutableMapping
+
+from app.metrics import Gauge
+from app.store import get_store
+from app.utils import get_logger
+
+_LOGGER = get_logger("ipam")
+
+# The first host addresses of every range are kept for gateways and the like.
+RESERVED_HOSTS = 5
+
+
+class IpPool:
+    """Allocator for one bridge IP range.
+
+    Fresh addresses are handed out from a cursor walking up the range,
+    released ones are kept in a heap so the lowest free address is always
+    allocated first. A reverse index maps every reserved address to its
+    owner for conflict checks.
+    """
+
+    def __init__(self, ip_range: str, hosts: MutableMapping[str, str]) -> None:
+        """Index the existing reservations of a range.
+
+        :param ip_range: IP network, e.g. "192.168.1.0/24"
+        :type ip_range: str
+        :param hosts: reservations of the range, updated in place
+        :type hosts: MutableMapping[str, str]
+        """
+        network = ipaddress.ip_network(ip_range)
+        self.ip_range = ip_range
+        self.hosts = hosts
+        self._prefix = network.prefixlen
+
+        # Same bounds as ip_network().hosts()
+        first = int(network.network_address)
+        last = first + network.num_addresses - 1
+        if network.num_addresses > 2:  # noqa: PLR2004
+            first += 1
+            last -= 1 if network.version == 4 else 0  # noqa: PLR2004
+        self._start = first + RESERVED_HOSTS
+        self._last = last
+        self._cursor = self._start
+        self._released: list[int] = []
+
+        self._owners: dict[int, str] = {}
+        self._values: dict[str, int] = {}
+        for owner, address in hosts.items():
+            self._values[owner] = value = self._to_int(address)
+            self._owners[value] = owner
+
+    @staticmethod
+    def _to_int(address: str) -> int:
+        return int(ipaddress.ip_interface(address).ip)
+
+    def _to_str(self, value: int) -> str:
+        return f"{ipaddress.ip_address(value)}/{self._prefix}"
+
+    def __len__(self) -> int:
+        """Return the number of reserved addresses.
+
+        :return: reservation count
+        :rtype: int
+        """
+        return len(self._owners)
+
+    @property
+    def size(self) -> int:
+        """Return the number of addresses available for allocation.
+
+        :return: allocatable address count
+        :rtype: int
+        """
+        return max(self._last - self._start + 1, 0)
+
+    def owner_of(self, address: str) -> str | None:
+        """Return the owner of an address.
+
+        :param address: address with or without prefix length
+        :type address: str
+        :return: owner name or None if the address is free
+        :rtype: str | None
+        """
+        return self._owners.get(self._to_int(address))
+
+    def allocate(self, owner: str) -> str:
+        """Allocate the lowest free address of the range to an owner.
+
+        An address already held by the owner is released afterwards.
+
+        :param owner: container or bridge name
+        :type owner: str
+        :return: address with prefix length
+        :rtype: str
+        :raises IndexError: If no available IP addresses remain in the range.
+        """
+        value = None
+        while self._released:
+            candidate = heapq.heappop(self._released)
+            if candidate not in self._owners:
+                value = candidate
+                break
+        if value is None:
+            while self._cursor <= self._last and self._cursor in self._owners:
+                self._cursor += 1
+            if self._cursor > self._last:
+                msg = f"Failed to automatically allocate an IP to container: {owner}"
+                raise IndexError(msg)
+            value = self._cursor
+            self._cursor += 1
+
+        self.release(owner)
+        self._owners[value] = owner
+        self._values[owner] = value
+        self.hosts[owner] = address = self._to_str(value)
+        return address
+
+    def reserve(self, owner: str, address: str) -> None:
+        """Reserve a specific address for an owner.
+
+        :param owner: container or bridge name
+        :type owner: str
+        :param address: address with prefix length
+        :type address: str
+        :raises ValueError: If the address is already allocated to someone else.
+        """
+        value = self._to_int(address)
+        if (current := self._owners.get(value)) is not None and current != owner:
+            msg = f"IP {address} already allocated to {current}"
+            raise ValueError(msg)
+        if self._values.get(owner) != value:
+            self.release(owner)
+        self._owners[value] = owner
+        self._values[owner] = value
+        self.hosts[owner] = address
+
+    def release(self, owner: str) -> None:
+        """Release the address held by an owner, if any.
+
+        :param owner: container or bridge name
+        :type owner: str
+        """
+        if (value := self._values.pop(owner, None)) is None:
+            return
+        del self.hosts[owner]
+        if self._owners.get(value) == owner:
+            del self._owners[value]
+            if self._start <= value < self._cursor:
+                heapq.heappush(self._released, value)
+
+
+_POOLS: dict[tuple[str, str], IpPool] = {}
+
+
+def get_ip_pool(bridge_name: str, family: str = "ip") -> IpPool | None:
+    """Return the allocator of a bridge IP range.
+
+    The index is built from the stored leases on first use and rebuilt
+    whenever the range changes.
+
+    :param bridge_name: bridge name
+    :type bridge_name: str
+    :param family: "ip" for IPv4 or "ip6" for IPv6
+    :type family: str
+    :return: the allocator, or None if the bridge has no such range
+    :rtype: IpPool | None
+    """
+    store = get_store()
+    if not (ip_range := store.get_range(bridge_name, family)):
+        _POOLS.pop((bridge_name, family), None)
+        return None
+    pool = _POOLS.get((bridge_name, family))
+    if pool is None or pool.ip_range != ip_range:
+        hosts = store.leases(bridge_name, family)
+        pool = _POOLS[bridge_name, family] = IpPool(ip_range, hosts)
+    return pool
+
+
+def set_ip_range(bridge_name: str, family: str, ip_range: str | None) -> None:
+    """Change the IP range of a bridge, dropping all of its leases.
+
+    :param bridge_name: bridge name
+    :type bridge_name: str
+    :param family: "ip" for IPv4 or "ip6" for IPv6
+    :type family: str
+    :param ip_range: IP network, None removes the range
+    :type ip_range: str | None
+    """
+    get_store().set_range(bridge_name, family, ip_range)
+    _POOLS.pop((bridge_name, family), None)
+
+
+def _pool_usage() -> Iterator[tuple[tuple[str, str, str], float]]:
+    for bridge, family, ip_range, leases in get_store().range_usage():
+        size = IpPool(ip_range, {}).size
+        yield (bridge, family, ip_range), leases / size if size else 1.0
+
+
+Gauge(
+    "raikou_ip_pool_utilisation_ratio",
+    "Share of the allocatable addresses of a bridge range that are leased.",
+    ("bridge", "family", "range"),
+    _pool_usage,
+)
+Gauge(
+    "raikou_ip_pool_leases",
+    "Addresses leased from a bridge range.",
+    ("bridge", "family", "range"),
+    lambda: (((b, f, r), n) for b, f, r, n in get_store().range_usage()),
+)
+
+
+def auto_allocate_ip(bridge_name: str, container_name: str, family: str = "ip") -> str:
+    """Automatically allocate an IP address from the bridge's IP range.
+
+    :param bridge_name: The brigde name to allocate IP from for the container.
+    :type bridge_name: str
+    :param container_name: Name of the container to assign the IP to.
+    :type container_name: str
+    :param family: The IP family to allocate from ("ip" for IPv4 or "ip6" for IPv6).
+                   Default is "ip".
+    :type family: str
+    :raises IndexError: If no available IP addresses remain in the range.
+    :return: The allocated IP address with the correct prefix.
+    :rtype: str
+    """
+    if (pool := get_ip_pool(bridge_name, family)) is None:
+        msg = f"Bridge {bridge_name} has no {family}range to allocate from"
+        raise IndexError(msg)
+    ipaddr = pool.allocate(container_name)
+    _LOGGER.debug(
+        "Automatic IP allocation (%s) to container: %s", ipaddr, container_name
+    )
+    return ipaddr
@@ -0,0 +1,297 @@
+"""Prometheus metrics.
+
+A small in-process registry that renders the Prometheus text format, so
+the image needs no client library. Recording a sample costs a bisect and a
+few additions under a lock. Values that are cheap to read on demand, like
+the failure counter or the IP pool usage, are gauges collected only when
+``/metrics`` is scraped.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from collections import Counter as Tally
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import contextmanager
+
+# Seconds, from a netlink request to a slow docker exec
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Backends always reported per cycle, even when a cycle did not use them
+COMMAND_BINARIES = ("ip", "ovs-vsctl", "docker", "ovs-docker")
+
+_REGISTRY: list[Metric] = []
+
+GaugeSamples = Iterable[tuple[Sequence[str], float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base of all metrics, registered for rendering on creation."""
+
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> None:
+        """Create and register a metric.
+
+        :param name: metric name
+        :type name: str
+        :param documentation: HELP text
+        :type documentation: str
+        :param labels: label names, values are passed in the same order
+        :type labels: Sequence[str]
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _labels(self, values: Sequence[str], extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(value)}"'
+            for name, value in zip(self.labels, values, strict=True)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        """Return the sample lines of the metric.
+
+        :yield: lines in the Prometheus text format
+        """
+        yield from ()
+
+    def render(self) -> Iterator[str]:
+        """Return the HELP, TYPE and sample lines of the metric.
+
+        :yield: lines in the Prometheus text format
+        """
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self.samples()
+
+
+class Histogram(Metric):
+    """Histogram with fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """Create and register a histogram.
+
+        :param name: metric name
+        :type name: str
+        :param documentation: HELP text
+        :type documentation: str
+        :param labels: label names
+        :type labels: Sequence[str]
+        :param buckets: sorted upper bounds, +Inf is added
+        :type buckets: Sequence[float]
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # label values -> per bucket counts (last one is +Inf), sum
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record a sample.
+
+        :param value: observed value
+        :type value: float
+        :param labels: label values
+        :type labels: str
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if (entry := self._values.get(labels)) is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def samples(self) -> Iterator[str]:
+        """Return the bucket, sum and count lines of the histogram.
+
+        :yield: lines in the Prometheus text format
+        """
+        with self._lock:
+            values = [(k, list(v[0]), v[1][0]) for k, v in self._values.items()]
+        for labels, counts, total in sorted(values):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts, strict=True):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{self._labels(labels, le)} {cumulative}"
+            yield f"{self.name}_sum{self._labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{self._labels(labels)} {cumulative}"
+
+
+class Gauge(Metric):
+    """Gauge whose samples are collected when the metrics are rendered."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str],
+        collect: Callable[[], GaugeSamples],
+    ) -> None:
+        """Create and register a gauge.
+
+        :param name: metric name
+        :type name: str
+        :param documentation: HELP text
+        :type documentation: str
+        :param labels: label names
+        :type labels: Sequence[str]
+        :param collect: returns (label values, value) pairs
+        :type collect: Callable[[], GaugeSamples]
+        """
+        super().__init__(name, documentation, labels)
+        self._collect = collect
+
+    def samples(self) -> Iterator[str]:
+        """Return the sample lines of the gauge.
+
+        :yield: lines in the Prometheus text format
+        """
+        for labels, value in self._collect():
+            yield f"{self.name}{self._labels(labels)} {_format_value(value)}"
+
+
+RECONCILE_SECONDS = Histogram(
+    "raikou_reconcile_duration_seconds",
+    "Duration of reconcile cycles.",
+    ("scope",),
+)
+CYCLE_COMMANDS = Histogram(
+    "raikou_reconcile_commands",
+    "Host commands and API requests issued per reconcile cycle.",
+    ("command",),
+    COUNT_BUCKETS,
+)
+COMMAND_SECONDS = Histogram(
+    "raikou_command_duration_seconds",
+    "Latency of host commands and API requests.",
+    ("command",),
+)
+LOCK_WAIT_SECONDS = Histogram(
+    "raikou_lock_wait_seconds",
+    "Time spent waiting for bridge, container and topology locks.",
+    ("lock",),
+)
+LOCK_HOLD_SECONDS = Histogram(
+    "raikou_lock_hold_seconds",
+    "Time bridge, container and topology locks are held.",
+    ("lock",),
+)
+
+
+class _Cycle:
+    """Commands counted for the reconcile cycle in progress."""
+
+    def __init__(self) -> None:
+        self.tally: Tally[str] | None = None
+
+
+_CYCLE = _Cycle()
+
+
+def record_command(binary: str, action: str, seconds: float) -> None:
+    """Record a host command or an OVSDB, netlink or Docker API request.
+
+    Cycles do not overlap, so everything issued while one is running,
+    including API requests served meanwhile, counts towards it.
+
+    :param binary: executable or backend, e.g. "ovs-vsctl" or "ovsdb"
+    :type binary: str
+    :param action: subcommand or request type, e.g. "add-port"
+    :type action: str
+    :param seconds: latency
+    :type seconds: float
+    """
+    COMMAND_SECONDS.observe(seconds, f"{binary} {action}" if action else binary)
+    if (tally := _CYCLE.tally) is not None:
+        tally[binary] += 1
+
+
+def command_type(args: Sequence[str]) -> tuple[str, str]:
+    """Split a command line into its binary and subcommand.
+
+    :param args: command line
+    :type args: Sequence[str]
+    :return: binary name and first argument that is not an option
+    :rtype: tuple[str, str]
+    """
+    binary = args[0].rsplit("/", maxsplit=1)[-1] if args else ""
+    action = next((arg for arg in args[1:] if not arg.startswith("-")), "")
+    return binary, action
+
+
+@contextmanager
+def reconcile_cycle(scope: str) -> Iterator[Tally[str]]:
+    """Time a reconcile cycle and count the commands it issues.
+
+    :param scope: "full" for a sweep, "events" for a cycle scoped to events
+    :type scope: str
+    :yield: commands issued so far, per binary or backend
+    """
+    _CYCLE.tally = tally = Tally()
+    start = time.perf_counter()
+    try:
+        yield tally
+    finally:
+        _CYCLE.tally = None
+        RECONCILE_SECONDS.observe(time.perf_counter() - start, scope)
+        for binary in {*COMMAND_BINARIES, *tally}:
+            CYCLE_COMMANDS.observe(tally[binary], binary)
+
+
+def render_metrics() -> str:
+    """Render every registered metric.
+
+    Gauges may read the state store, run this in a worker thread.
+
+    :return: metrics in the Prometheus text format
+    :rtype: str
+    """
+    lines = [line for metric in _REGISTRY for line in metric.render()]
+    return "\n".join(lines) + "\n"
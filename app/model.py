@@ -0,0 +1,277 @@
+"""Compiled desired state.
+
+The config is a tree of plain dicts. This part compiles every bridge,
+container interface and veth pair into a typed object validated by the
+``app.schemas`` models, with the VLANs expected on its ports and its
+addresses derived once. Each object keeps a private copy of its config
+entry: an unchanged entry is reused from the previous compile, together
+with the host fingerprint recorded when it was last found in sync, so the
+reconciler can skip it as long as the host did not change either.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, cast
+
+from pydantic import BaseModel, ValidationError
+
+from app.schemas import ContainerInfo, TopologyBridgeInfo, VethPairInfo
+from app.vlans import VlanRanges, parse_vlans
+
+if TYPE_CHECKING:
+    from app.utils import BridgeInfoDict, ContainerInfoDict
+
+_LOCK = threading.Lock()
+# (kind, name) -> compiled object of the previous compile
+_COMPILED: dict[tuple[str, str], Any] = {}
+
+
+def private_copy(entry: Any) -> Any:  # noqa: ANN401
+    """Return a private copy of a config entry.
+
+    The copy lets a later compile spot a changed entry with a plain
+    comparison, even if the config was modified in place.
+
+    :param entry: JSON serialisable config entry
+    :type entry: Any
+    :return: deep copy of the entry
+    :rtype: Any
+    """
+    return json.loads(json.dumps(entry))
+
+
+def lxbr_port_name(container: str, iface: str) -> str:
+    """Return the host side veth name lxbr-docker uses for an interface.
+
+    :param container: container name
+    :type container: str
+    :param iface: interface name inside the container
+    :type iface: str
+    :return: host side veth name
+    :rtype: str
+    """
+    # Mirrors `echo "$CONTAINER""$INTERFACE" | sha1sum` in lxbr-docker
+    digest = hashlib.sha1(f"{container}{iface}\n".encode())  # noqa: S324
+    return f"{digest.hexdigest()[:13]}_l"
+
+
+@dataclass(slots=True, frozen=True)
+class PortVlans:
+    """VLANs expected on an OVS port."""
+
+    tag: int | None = None
+    trunks: VlanRanges = ()
+
+    @classmethod
+    def of(
+        cls,
+        vlan: str | None = None,
+        native: str | None = None,
+        trunk: str | None = None,
+    ) -> PortVlans:
+        """Build the expected port VLANs from config values.
+
+        :param vlan: access VLAN
+        :type vlan: str | None
+        :param native: native VLAN of a trunk
+        :type native: str | None
+        :param trunk: comma separated trunk VLANs and ranges
+        :type trunk: str | None
+        :return: expected port VLANs
+        :rtype: PortVlans
+        """
+        tag = vlan or native
+        return cls(int(tag) if tag else None, parse_vlans(trunk))
+
+
+@dataclass(slots=True)
+class ParentSpec:
+    """Parent interface of a bridge."""
+
+    iface: str  # as configured, may be "usb:<port>"
+    settings: dict[str, str]  # trunk/native/vlan values that are set
+    vlans: PortVlans
+
+
+@dataclass(slots=True)
+class BridgeSpec:
+    """Compiled bridge entry."""
+
+    name: str
+    info: BridgeInfoDict  # copy of the config entry
+    ranges: dict[str, str | None]  # "ip"/"ip6" -> range
+    addresses: dict[str, str | None]  # "ip"/"ip6" -> address
+    parents: tuple[ParentSpec, ...]
+    # host fingerprint of the last cycle that found the bridge in sync
+    observed: int | None = None
+
+
+@dataclass(slots=True)
+class ContainerIfaceSpec:
+    """Compiled container interface entry."""
+
+    container: str
+    iface: str
+    bridge: str
+    info: ContainerInfoDict
+    vlan: int | None
+    trunks: VlanRanges | None  # None if no trunk is configured
+    lxbr_port: str  # host side veth name on a Linux bridge
+    observed: int | None = None
+
+
+@dataclass(slots=True)
+class VethEnd:
+    """One end of a veth pair."""
+
+    name: str
+    vlan: str
+    vlans: PortVlans | None  # None if the end is not attached to the bridge
+
+
+@dataclass(slots=True)
+class VethPairSpec:
+    """Compiled veth pair entry."""
+
+    prefix: str
+    bridge: str
+    info: dict[str, Any]
+    key: str  # "trunk" or "vlan"
+    ends: tuple[VethEnd, ...]
+    observed: int | None = None
+
+
+@dataclass(slots=True)
+class DesiredState:
+    """Compiled config."""
+
+    bridges: dict[str, BridgeSpec] = field(default_factory=dict)
+    container_ifaces: list[ContainerIfaceSpec] = field(default_factory=list)
+    veth_pairs: dict[str, VethPairSpec] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        """Return the number of compiled objects.
+
+        :return: object count
+        :rtype: int
+        """
+        return len(self.bridges) + len(self.container_ifaces) + len(self.veth_pairs)
+
+
+def _validate(model: type[BaseModel], what: str, entry: Any) -> None:  # noqa: ANN401
+    try:
+        model.model_validate(entry)
+    except ValidationError as exc:
+        msg = f"Invalid config for {what}: {exc}"
+        raise ValueError(msg) from exc
+
+
+def _compile_bridge(name: str, entry: BridgeInfoDict) -> BridgeSpec:
+    _validate(TopologyBridgeInfo, f"bridge {name}", entry)
+    info = private_copy(entry)
+    parents = tuple(
+        ParentSpec(
+            iface=parent["iface"],
+            settings={
+                key: value
+                for key in ("trunk", "native", "vlan")
+                if (value := parent.get(key))
+            },
+            vlans=PortVlans.of(
+                parent.get("vlan"), parent.get("native"), parent.get("trunk")
+            ),
+        )
+        for parent in info.get("parents") or []
+        if parent.get("iface") is not None
+    )
+    return BridgeSpec(
+        name=name,
+        info=info,
+        ranges={p: info.get(f"{p}range") for p in ("ip", "ip6")},
+        addresses={p: info.get(f"{p}address") for p in ("ip", "ip6")},
+        parents=parents,
+    )
+
+
+def _compile_container_iface(
+    container: str, entry: ContainerInfoDict
+) -> ContainerIfaceSpec:
+    _validate(ContainerInfo, f"container {container}", entry)
+    info = private_copy(entry)
+    vlan, trunk = info.get("vlan"), info.get("trunk")
+    return ContainerIfaceSpec(
+        container=container,
+        iface=info["iface"],
+        bridge=info["bridge"],
+        info=info,
+        vlan=int(vlan) if vlan else None,
+        trunks=parse_vlans(trunk) if trunk else None,
+        lxbr_port=lxbr_port_name(container, info["iface"]),
+    )
+
+
+def _compile_veth_pair(prefix: str, entry: dict[str, Any]) -> VethPairSpec:
+    _validate(VethPairInfo, f"veth pair {prefix}", entry)
+    translation = private_copy(entry)
+    source_vlan, dest_vlan = (translation.get("map") or ":").split(":")
+    key = "trunk" if translation.get("trunk", "no") == "yes" else "vlan"
+    ends = (
+        VethEnd(f"v0_{prefix}", source_vlan, PortVlans.of(**{key: source_vlan})),
+        VethEnd(
+            f"v1_{prefix}",
+            dest_vlan,
+            PortVlans.of(**{key: dest_vlan}) if dest_vlan else None,
+        ),
+    )
+    return VethPairSpec(
+        prefix=prefix,
+        bridge=translation["on"],
+        info=translation,
+        key=key,
+        ends=ends,
+    )
+
+
+def compile_config(config: dict[str, Any]) -> DesiredState:
+    """Compile the config, reusing the objects of unchanged entries.
+
+    :param config: desired state, as returned by get_config()
+    :type config: dict[str, Any]
+    :return: compiled desired state
+    :rtype: DesiredState
+    :raises ValueError: if an entry fails the schema validation
+    """
+    state = DesiredState()
+    compiled: dict[tuple[str, str], Any] = {}
+
+    def _reuse(kind: str, name: str, entry: Any) -> Any:  # noqa: ANN401
+        previous = _COMPILED.get((kind, name))
+        return previous if previous is not None and previous.info == entry else None
+
+    with _LOCK:
+        for name, info in config["bridge"].items():
+            spec = _reuse("bridge", name, info) or _compile_bridge(name, info)
+            state.bridges[name] = compiled["bridge", name] = spec
+
+        for container, iface_info in config["container"].items():
+            for info in iface_info:
+                key = f"{container}:{info['iface']}:{info.get('bridge')}"
+                spec = _reuse("container", key, info) or _compile_container_iface(
+                    container, cast("ContainerInfoDict", info)
+                )
+                state.container_ifaces.append(spec)
+                compiled["container", key] = spec
+
+        for prefix, translation in config.get("veth_pairs", {}).items():
+            spec = _reuse("veth", prefix, translation) or _compile_veth_pair(
+                prefix, translation
+            )
+            state.veth_pairs[prefix] = compiled["veth", prefix] = spec
+
+        _COMPILED.clear()
+        _COMPILED.update(compiled)
+    return state
@@ -0,0 +1,619 @@
+"""In-process rtnetlink backend.
+
+This part queries and changes links and addresses over a single
+NETLINK_ROUTE socket instead of forking ``ip link``/``ip addr`` and
+parsing their text output.
+"""
+
+from __future__ import annotations
+
+import errno
+import os
+import socket
+import struct
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from functools import cache
+from itertools import count
+from pathlib import Path
+
+from app.utils import SIMULATED_HOST, get_logger, record_request
+
+_LOGGER = get_logger("netlink")
+
+# netlink message types and flags, see linux/netlink.h and linux/rtnetlink.h
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+_MESSAGE_NAMES = {
+    RTM_NEWLINK: "newlink",
+    RTM_DELLINK: "dellink",
+    RTM_GETLINK: "getlink",
+    RTM_NEWADDR: "newaddr",
+    RTM_DELADDR: "deladdr",
+    RTM_GETADDR: "getaddr",
+    RTM_NEWROUTE: "newroute",
+}
+
+# link and address attributes, see linux/if_link.h and linux/if_addr.h
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_MASTER = 10
+IFLA_LINKINFO = 18
+IFLA_NET_NS_FD = 28
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+IFLA_BR_VLAN_FILTERING = 7
+VETH_INFO_PEER = 1
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RTA_GATEWAY = 5
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RTN_UNICAST = 1
+IFF_UP = 0x1
+RTMGRP_LINK = 0x1
+
+_NLMSGHDR = struct.Struct("=LHHLL")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_IFADDRMSG = struct.Struct("=BBBBI")
+_RTMSG = struct.Struct("=BBBBBBBBI")
+_RTATTR = struct.Struct("=HH")
+
+
+class NetlinkError(OSError):
+    """Raised when the kernel rejects a netlink request."""
+
+
+@dataclass(slots=True)
+class Link:
+    """Link details reported by RTM_GETLINK."""
+
+    index: int
+    name: str
+    flags: int = 0
+    mtu: int = 0
+    master: int = 0
+    kind: str = ""
+    address: str = ""
+    vlan_filtering: bool = False  # bridges only
+
+    @property
+    def up(self) -> bool:
+        """Return True if the link is administratively up.
+
+        :return: link admin state
+        :rtype: bool
+        """
+        return bool(self.flags & IFF_UP)
+
+
+@dataclass(slots=True)
+class NetlinkState:
+    """Snapshot of all links and their addresses."""
+
+    links: dict[str, Link] = field(default_factory=dict)
+    addresses: dict[int, list[str]] = field(default_factory=dict)
+
+    def addresses_of(self, name: str) -> list[str]:
+        """Return the addresses configured on a link.
+
+        :param name: link name
+        :type name: str
+        :return: addresses with prefix length
+        :rtype: list[str]
+        """
+        if (link := self.links.get(name)) is None:
+            return []
+        return self.addresses.get(link.index, [])
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _attr(kind: int, data: bytes) -> bytes:
+    length = _RTATTR.size + len(data)
+    return _RTATTR.pack(length, kind) + data + b"\0" * (_align(length) - length)
+
+
+def _name_attr(kind: int, name: str) -> bytes:
+    return _attr(kind, name.encode() + b"\0")
+
+
+def _parse_attrs(data: bytes) -> dict[int, bytes]:
+    attrs: dict[int, bytes] = {}
+    offset = 0
+    while offset + _RTATTR.size <= len(data):
+        length, kind = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[kind & 0x3FFF] = data[offset + _RTATTR.size : offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _parse_link(body: bytes) -> Link:
+    _, _, index, flags, _ = _IFINFOMSG.unpack_from(body)
+    attrs = _parse_attrs(body[_IFINFOMSG.size :])
+    kind, data = b"", {}
+    if info := attrs.get(IFLA_LINKINFO):
+        info_attrs = _parse_attrs(info)
+        kind = info_attrs.get(IFLA_INFO_KIND, b"")
+        data = _parse_attrs(info_attrs.get(IFLA_INFO_DATA, b""))
+    return Link(
+        index=index,
+        name=attrs.get(IFLA_IFNAME, b"").rstrip(b"\0").decode(),
+        flags=flags,
+        mtu=struct.unpack("=I", attrs[IFLA_MTU])[0] if IFLA_MTU in attrs else 0,
+        master=struct.unpack("=I", attrs[IFLA_MASTER])[0]
+        if IFLA_MASTER in attrs
+        else 0,
+        kind=kind.rstrip(b"\0").decode(),
+        address=attrs.get(IFLA_ADDRESS, b"").hex(":"),
+        vlan_filtering=data.get(IFLA_BR_VLAN_FILTERING, b"\0")[:1] == b"\1",
+    )
+
+
+def _parse_address(body: bytes) -> tuple[int, str]:
+    family, prefixlen, _, _, index = _IFADDRMSG.unpack_from(body)
+    attrs = _parse_attrs(body[_IFADDRMSG.size :])
+    # For IPv4 IFA_LOCAL is the address, IFA_ADDRESS may be a peer address.
+    raw = attrs.get(IFA_LOCAL) or attrs[IFA_ADDRESS]
+    return index, f"{socket.inet_ntop(family, raw)}/{prefixlen}"
+
+
+@contextmanager
+def enter_netns(path: str) -> Iterator[None]:
+    """Move the calling thread into a network namespace and back.
+
+    Only the calling thread changes namespace, so this must run in a
+    worker thread and never on the event loop.
+
+    :param path: network namespace file
+    :type path: str
+    :yield: inside the namespace
+    """
+    host = os.open("/proc/thread-self/ns/net", os.O_RDONLY)
+    target = os.open(path, os.O_RDONLY)
+    try:
+        os.setns(target, os.CLONE_NEWNET)
+        try:
+            yield
+        finally:
+            os.setns(host, os.CLONE_NEWNET)
+    finally:
+        os.close(target)
+        os.close(host)
+
+
+def open_link_monitor() -> socket.socket:
+    """Open a non-blocking socket subscribed to link change notifications.
+
+    :return: netlink socket bound to the RTMGRP_LINK multicast group
+    :rtype: socket.socket
+    """
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    sock.bind((0, RTMGRP_LINK))
+    sock.setblocking(False)
+    return sock
+
+
+def parse_link_events(data: bytes) -> list[tuple[bool, Link]]:
+    """Parse link notifications read from a link monitor socket.
+
+    :param data: datagram read from the socket
+    :type data: bytes
+    :return: (deleted, link) for every RTM_NEWLINK/RTM_DELLINK message
+    :rtype: list[tuple[bool, Link]]
+    """
+    events = []
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, kind, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            break
+        if kind in (RTM_NEWLINK, RTM_DELLINK):
+            body = data[offset + _NLMSGHDR.size : offset + length]
+            events.append((kind == RTM_DELLINK, _parse_link(body)))
+        offset += _align(length)
+    return events
+
+
+class Netlink:
+    """rtnetlink client keeping a single NETLINK_ROUTE socket open."""
+
+    def __init__(self) -> None:
+        """Initialise the client, the socket is opened on first use."""
+        self._sock: socket.socket | None = None
+        self._seq = count(1)
+        self._lock = threading.Lock()
+
+    def _socket(self) -> socket.socket:
+        if self._sock is None:
+            self._sock = socket.socket(
+                socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE
+            )
+            self._sock.bind((0, 0))
+        return self._sock
+
+    def close(self) -> None:
+        """Close the netlink socket."""
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    @contextmanager
+    def netns(self, path: str) -> Iterator[Netlink]:
+        """Enter a network namespace and return a client bound to it.
+
+        The calling thread stays in the namespace until the block exits,
+        so this must run in a worker thread and never on the event loop.
+
+        :param path: network namespace file
+        :type path: str
+        :yield: client for the namespace, closed when the block exits
+        """
+        with enter_netns(path):
+            # The socket stays bound to the namespace it was opened in.
+            netlink = Netlink()
+            try:
+                yield netlink
+            finally:
+                netlink.close()
+
+    @contextmanager
+    def _netns_fd(self, path: str) -> Iterator[int]:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            yield fd
+        finally:
+            os.close(fd)
+
+    def request(self, msg_type: int, flags: int, payload: bytes) -> list[bytes]:
+        """Send a netlink request and collect the reply messages.
+
+        :param msg_type: netlink message type, e.g. RTM_GETLINK
+        :type msg_type: int
+        :param flags: NLM_F_* flags, NLM_F_REQUEST is always set
+        :type flags: int
+        :param payload: message body
+        :type payload: bytes
+        :return: bodies of the reply messages
+        :rtype: list[bytes]
+        :raises NetlinkError: if the kernel reports an error
+        """
+        start = time.perf_counter()
+        replies = None
+        try:
+            replies = self._request(msg_type, flags, payload)
+            return replies
+        finally:
+            record_request(
+                "netlink",
+                _MESSAGE_NAMES.get(msg_type, str(msg_type)),
+                start,
+                replies is None,
+                sum(map(len, replies or ())),
+            )
+
+    def _request(self, msg_type: int, flags: int, payload: bytes) -> list[bytes]:
+        with self._lock:
+            sock = self._socket()
+            seq = next(self._seq)
+            flags |= NLM_F_REQUEST
+            header = _NLMSGHDR.pack(
+                _NLMSGHDR.size + len(payload), msg_type, flags, seq, 0
+            )
+            sock.send(header + payload)
+
+            replies: list[bytes] = []
+            while True:
+                data = sock.recv(1 << 20)
+                offset = 0
+                while offset + _NLMSGHDR.size <= len(data):
+                    length, kind, _, reply_seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                    if length < _NLMSGHDR.size:
+                        break
+                    body = data[offset + _NLMSGHDR.size : offset + length]
+                    offset += _align(length)
+                    if reply_seq != seq:
+                        continue
+                    if kind == NLMSG_DONE:
+                        return replies
+                    if kind == NLMSG_ERROR:
+                        (code,) = struct.unpack_from("=i", body)
+                        if code:
+                            raise NetlinkError(-code, os.strerror(-code))
+                        return replies
+                    replies.append(body)
+                if not flags & (NLM_F_ACK | NLM_F_DUMP):
+                    return replies
+
+    def dump_links(self) -> dict[str, Link]:
+        """Return all links keyed by name.
+
+        :return: links
+        :rtype: dict[str, Link]
+        """
+        replies = self.request(
+            RTM_GETLINK, NLM_F_DUMP, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        )
+        return {link.name: link for link in map(_parse_link, replies)}
+
+    def dump_addresses(self, family: int = socket.AF_UNSPEC) -> dict[int, list[str]]:
+        """Return all addresses keyed by link index.
+
+        :param family: address family filter, defaults to all families
+        :type family: int
+        :return: addresses with prefix length
+        :rtype: dict[int, list[str]]
+        """
+        replies = self.request(
+            RTM_GETADDR, NLM_F_DUMP, _IFADDRMSG.pack(family, 0, 0, 0, 0)
+        )
+        addresses: dict[int, list[str]] = {}
+        for index, address in map(_parse_address, replies):
+            addresses.setdefault(index, []).append(address)
+        return addresses
+
+    def dump(self) -> NetlinkState:
+        """Return all links and addresses.
+
+        :return: links and addresses snapshot
+        :rtype: NetlinkState
+        """
+        return NetlinkState(links=self.dump_links(), addresses=self.dump_addresses())
+
+    def link(self, name: str) -> Link | None:
+        """Return a single link by name.
+
+        :param name: link name
+        :type name: str
+        :return: the link or None if it does not exist
+        :rtype: Link | None
+        """
+        payload = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        try:
+            replies = self.request(
+                RTM_GETLINK, NLM_F_ACK, payload + _name_attr(IFLA_IFNAME, name)
+            )
+        except NetlinkError as exc:
+            if exc.errno == errno.ENODEV:
+                return None
+            raise
+        return _parse_link(replies[0]) if replies else None
+
+    def _index(self, name: str) -> int:
+        if (link := self.link(name)) is None:
+            raise NetlinkError(errno.ENODEV, f"Cannot find device {name}")
+        return link.index
+
+    def addresses(self, name: str, family: int = socket.AF_UNSPEC) -> list[str]:
+        """Return the addresses configured on a link.
+
+        :param name: link name
+        :type name: str
+        :param family: address family filter, defaults to all families
+        :type family: int
+        :return: addresses with prefix length
+        :rtype: list[str]
+        """
+        return self.dump_addresses(family).get(self._index(name), [])
+
+    def create_veth(
+        self,
+        name: str,
+        peer: str,
+        peer_netns: str | None = None,
+        peer_mtu: int = 0,
+        peer_address: str = "",
+    ) -> None:
+        """Create a veth pair.
+
+        The peer can be created straight inside another network namespace,
+        with its final MTU and MAC address.
+
+        :param name: name of the first end
+        :type name: str
+        :param peer: name of the peer end
+        :type peer: str
+        :param peer_netns: network namespace file of the peer
+        :type peer_netns: str | None
+        :param peer_mtu: MTU of the peer end, 0 keeps the default
+        :type peer_mtu: int
+        :param peer_address: MAC address of the peer end, empty for a random one
+        :type peer_address: str
+        """
+        ifinfo = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        peer_attrs = _name_attr(IFLA_IFNAME, peer)
+        if peer_mtu:
+            peer_attrs += _attr(IFLA_MTU, struct.pack("=I", peer_mtu))
+        if peer_address:
+            peer_attrs += _attr(
+                IFLA_ADDRESS, bytes.fromhex(peer_address.replace(":", ""))
+            )
+        with ExitStack() as stack:
+            if peer_netns is not None:
+                fd = stack.enter_context(self._netns_fd(peer_netns))
+                peer_attrs += _attr(IFLA_NET_NS_FD, struct.pack("=I", fd))
+            peer_info = _attr(VETH_INFO_PEER, ifinfo + peer_attrs)
+            linkinfo = _attr(
+                IFLA_LINKINFO,
+                _name_attr(IFLA_INFO_KIND, "veth") + _attr(IFLA_INFO_DATA, peer_info),
+            )
+            self.request(
+                RTM_NEWLINK,
+                NLM_F_ACK | NLM_F_CREATE | NLM_F_EXCL,
+                ifinfo + _name_attr(IFLA_IFNAME, name) + linkinfo,
+            )
+
+    def create_bridge(self, name: str) -> None:
+        """Create a Linux bridge.
+
+        :param name: bridge name
+        :type name: str
+        """
+        ifinfo = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        linkinfo = _attr(IFLA_LINKINFO, _name_attr(IFLA_INFO_KIND, "bridge"))
+        self.request(
+            RTM_NEWLINK,
+            NLM_F_ACK | NLM_F_CREATE | NLM_F_EXCL,
+            ifinfo + _name_attr(IFLA_IFNAME, name) + linkinfo,
+        )
+
+    def delete_link(self, name: str) -> None:
+        """Delete a link.
+
+        :param name: link name
+        :type name: str
+        """
+        ifinfo = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, self._index(name), 0, 0)
+        self.request(RTM_DELLINK, NLM_F_ACK, ifinfo)
+
+    def set_link_up(self, name: str, up: bool = True) -> None:
+        """Set the admin state of a link.
+
+        :param name: link name
+        :type name: str
+        :param up: bring the link up if True, down otherwise
+        :type up: bool
+        """
+        ifinfo = _IFINFOMSG.pack(
+            socket.AF_UNSPEC, 0, self._index(name), IFF_UP if up else 0, IFF_UP
+        )
+        self.request(RTM_NEWLINK, NLM_F_ACK, ifinfo)
+
+    def set_master(self, name: str, master: str | None) -> None:
+        """Enslave a link to a bridge, or release it when master is None.
+
+        :param name: link name
+        :type name: str
+        :param master: bridge name or None for nomaster
+        :type master: str | None
+        """
+        ifinfo = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, self._index(name), 0, 0)
+        master_index = self._index(master) if master else 0
+        self.request(
+            RTM_NEWLINK,
+            NLM_F_ACK,
+            ifinfo + _attr(IFLA_MASTER, struct.pack("=I", master_index)),
+        )
+
+    def set_vlan_filtering(self, bridge: str, enabled: bool = True) -> None:
+        """Turn VLAN filtering of a Linux bridge on or off.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param enabled: filter on the port VLANs if True
+        :type enabled: bool
+        """
+        ifinfo = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, self._index(bridge), 0, 0)
+        data = _attr(IFLA_BR_VLAN_FILTERING, struct.pack("=B", enabled))
+        linkinfo = _name_attr(IFLA_INFO_KIND, "bridge") + _attr(IFLA_INFO_DATA, data)
+        self.request(RTM_NEWLINK, NLM_F_ACK, ifinfo + _attr(IFLA_LINKINFO, linkinfo))
+
+    def enable_ipv6(self, name: str) -> None:
+        """Enable IPv6 on a link.
+
+        /proc/sys/net follows the network namespace of the calling thread,
+        call this on the host client or inside the block of netns().
+
+        :param name: link name
+        :type name: str
+        """
+        Path(f"/proc/sys/net/ipv6/conf/{name}/disable_ipv6").write_text(
+            "0", encoding="utf-8"
+        )
+
+    def add_address(self, name: str, address: str) -> None:
+        """Add an address with prefix length to a link.
+
+        :param name: link name
+        :type name: str
+        :param address: address, e.g. "192.168.1.1/24"
+        :type address: str
+        """
+        ip, _, prefix = address.partition("/")
+        family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+        default_prefix = 128 if family == socket.AF_INET6 else 32
+        raw = socket.inet_pton(family, ip)
+        ifaddr = _IFADDRMSG.pack(
+            family, int(prefix or default_prefix), 0, 0, self._index(name)
+        )
+        self.request(
+            RTM_NEWADDR,
+            NLM_F_ACK | NLM_F_CREATE | NLM_F_EXCL,
+            ifaddr + _attr(IFA_LOCAL, raw) + _attr(IFA_ADDRESS, raw),
+        )
+
+    def add_default_route(self, gateway: str) -> None:
+        """Add a default route via a gateway to the main table.
+
+        :param gateway: IPv4 or IPv6 gateway address
+        :type gateway: str
+        """
+        family = socket.AF_INET6 if ":" in gateway else socket.AF_INET
+        rtmsg = _RTMSG.pack(
+            family,
+            0,
+            0,
+            0,
+            RT_TABLE_MAIN,
+            RTPROT_BOOT,
+            RT_SCOPE_UNIVERSE,
+            RTN_UNICAST,
+            0,
+        )
+        self.request(
+            RTM_NEWROUTE,
+            NLM_F_ACK | NLM_F_CREATE | NLM_F_EXCL,
+            rtmsg + _attr(RTA_GATEWAY, socket.inet_pton(family, gateway)),
+        )
+
+    def flush_addresses(self, name: str, family: int) -> None:
+        """Remove all addresses of a family from a link.
+
+        :param name: link name
+        :type name: str
+        :param family: socket.AF_INET or socket.AF_INET6
+        :type family: int
+        """
+        index = self._index(name)
+        for address in self.dump_addresses(family).get(index, []):
+            ip, _, prefix = address.partition("/")
+            raw = socket.inet_pton(family, ip)
+            ifaddr = _IFADDRMSG.pack(family, int(prefix), 0, 0, index)
+            self.request(RTM_DELADDR, NLM_F_ACK, ifaddr + _attr(IFA_LOCAL, raw))
+
+
+@cache
+def get_netlink() -> Netlink:
+    """Return the shared rtnetlink client.
+
+    :return: rtnetlink client, on the simulated host if SIMULATED_HOST is set
+    :rtype: Netlink
+    """
+    if SIMULATED_HOST:
+        # app.sim builds on this module, import it on demand
+        from app.sim import SimNetlink, get_sim_host  # noqa: PLC0415
+
+        return SimNetlink(get_sim_host())
+    return Netlink()
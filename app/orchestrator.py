@@ -8,42 +8,112 @@ from __future__ import annotations
 
 import asyncio
 import ipaddress
+import socket
 import sys
+import time
 import traceback
-from subprocess import CalledProcessError
-from typing import Literal, cast
-
+from collections.abc import AsyncIterator, Awaitable, Callable, Coroutine
+from contextlib import (
+    AbstractAsyncContextManager,
+    asynccontextmanager,
+    nullcontext,
+    suppress,
+)
+from subprocess import CalledProcessError, TimeoutExpired
+from typing import Any, Literal
+
+from app.adopt import adopt_host_state
+from app.attach import AttachSpec, attach_interface, detach_interface, netns_path
+from app.docker_api import DockerError, get_docker
+from app.events import collect_work, start_watchers, stop_watchers
+from app.ipam import auto_allocate_ip, get_ip_pool, set_ip_range
+from app.metrics import Gauge, reconcile_cycle
+from app.model import compile_config, lxbr_port_name
+from app.netlink import NetlinkError, get_netlink
 from app.ovs_lib import (
     add_iface_to_linux_bridge,
     add_iface_to_ovs_bridge,
-    check_interface_exists,
+    bridge_vlan_batch,
     check_sys_module,
     configure_container_vlan,
     create_bridge,
     get_interface_ip,
     veth_exists,
 )
+from app.ovsdb import OvsdbError, get_ovsdb
+from app.reconciler import (
+    HostSnapshot,
+    WorkSet,
+    container_port_attached,
+    container_stale_port,
+    find_drift,
+    scope_state,
+    take_snapshot,
+)
+from app.store import BRIDGE_PORT, get_store
 from app.utils import (
+    BRIDGE_LOCKS,
+    CONTAINER_LOCKS,
     DOCKER_SOCKET,
-    EVENT_LOCK,
     MAX_FAIL_COUNT,
+    RECONCILE_INTERVAL,
     USE_LINUX_BRIDGE,
+    WARM_RESTART,
     BridgeInfoDict,
     ContainerInfoDict,
     IfaceInfoDict,
-    auto_allocate_ip,
-    check_container_exists,
     get_config,
-    get_db,
     get_logger,
+    get_tracer,
     get_usb_interface,
-    run_command,
+    run_blocking,
 )
+from app.vlans import parse_vlans, vlan_ids
 
 _LOGGER = get_logger("orchestrator")
 
 
-def _add_iface_to_bridge(bridge_name: str, parent_info: IfaceInfoDict) -> None:
+def _ovs_batch() -> AbstractAsyncContextManager:
+    """Return a context collecting OVS changes into a single transaction.
+
+    :return: an OVSDB batch, or a no-op context for Linux bridges
+    :rtype: AbstractAsyncContextManager
+    """
+    return nullcontext() if USE_LINUX_BRIDGE else get_ovsdb().async_batch()
+
+
+@asynccontextmanager
+async def _bridge_batch() -> AsyncIterator[None]:
+    """Collect the port changes of a bridge, applied when the block exits.
+
+    OVS changes go into a single transaction, Linux bridge VLAN changes
+    into a single ``bridge -batch`` run.
+
+    :yield: while the changes are collected
+    """
+    if USE_LINUX_BRIDGE:
+        async with bridge_vlan_batch():
+            yield
+    else:
+        async with get_ovsdb().async_batch():
+            yield
+
+
+async def _attach_to_bridge(bridge_name: str, iface_info: IfaceInfoDict) -> None:
+    """Add a host interface to the OVS or Linux bridge.
+
+    :param bridge_name: The name of the bridge.
+    :type bridge_name: str
+    :param iface_info: Host interface details.
+    :type iface_info: IfaceInfoDict
+    """
+    if USE_LINUX_BRIDGE:
+        await add_iface_to_linux_bridge(bridge_name, iface_info)
+    else:
+        add_iface_to_ovs_bridge(bridge_name, iface_info)
+
+
+async def _add_iface_to_bridge(bridge_name: str, parent_info: IfaceInfoDict) -> None:
     """Add a network interface to an OVS bridge.
 
     :param bridge_name: The name of the OVS bridge.
@@ -56,18 +126,14 @@ def _add_iface_to_bridge(bridge_name: str, parent_info: IfaceInfoDict) -> None:
         return
 
     if "usb:" in parent:
-        parent_info["iface"] = get_usb_interface(parent.split(":")[-1])
+        parent = parent_info["iface"] = get_usb_interface(parent.split(":")[-1])
 
     _LOGGER.debug("Trying to bring up parent %s for bridge %s", parent, bridge_name)
-    run_command(f"ip link set {parent} up")
-
-    if USE_LINUX_BRIDGE:
-        add_iface_to_linux_bridge(bridge_name, parent_info)
-    else:
-        add_iface_to_ovs_bridge(bridge_name, parent_info)
+    get_netlink().set_link_up(parent)
+    await _attach_to_bridge(bridge_name, parent_info)
 
 
-def init_bridge(bridge_name: str, info: BridgeInfoDict) -> None:
+async def init_bridge(bridge_name: str, info: BridgeInfoDict) -> None:
     """Create an OVS/Linux bridge if it does not exist.
 
     If a parent interface is provided as part of the OVS bridge info,
@@ -82,43 +148,65 @@ def init_bridge(bridge_name: str, info: BridgeInfoDict) -> None:
     :raises ValueError: If IP address is already allocated/incorrect.
     """
     _LOGGER.debug("################## OVS BRIDGES #####################")
-    db_cache = get_db(bridge_name)
 
     # Create the Linux/OVS bridge
-    create_bridge(bridge_name)
+    await create_bridge(bridge_name)
 
     # Update bridge specific IP address range and Host details
-    for range_key, ip_addr in (
-        ("iprange", info.get("ipaddress")),
-        ("ip6range", info.get("ip6address")),
+    _update_bridge_ip(bridge_name, info)
+
+    # Add parent interfaces
+    async with _bridge_batch():
+        for parent_info in info.get("parents", []):
+            await _add_iface_to_bridge(bridge_name=bridge_name, parent_info=parent_info)
+
+
+def _update_bridge_ip(bridge_name: str, info: BridgeInfoDict) -> None:  # noqa: C901
+    """Update the bridge IP address ranges and the bridge address.
+
+    :param bridge_name: OVS bridge name
+    :type bridge_name: str
+    :param info: OVS/Linux bridge details
+    :type info: BridgeInfoDict
+    :raises ValueError: If IP address is already allocated/incorrect.
+    """
+    store = get_store()
+    for prefix, ip_addr in (
+        ("ip", info.get("ipaddress")),
+        ("ip6", info.get("ip6address")),
     ):
-        if (ip_range := info.get(range_key)) != db_cache.get(range_key):
+        if (ip_range := info.get(f"{prefix}range")) != store.get_range(
+            bridge_name, prefix
+        ):
             # Since IP range in cache is getting updated,
             # remove all previous host reservations.
 
             _LOGGER.debug("Updating IP range for %s to %s", bridge_name, ip_range)
-            db_cache[range_key] = ip_range
-            db_cache[f"{range_key}_hosts"] = {}
+            set_ip_range(bridge_name, prefix, ip_range)
 
-        hosts = db_cache.setdefault(f"{range_key}_hosts", {})
-        family = "-4" if range_key == "iprange" else "-6"
+        pool = get_ip_pool(bridge_name, prefix)
+        family = socket.AF_INET if prefix == "ip" else socket.AF_INET6
 
         if not ip_addr:
             # If ip_addr is not requested, simply flush and continue
             _LOGGER.debug("Flusing IP address for %s", bridge_name)
 
-            hosts.pop(bridge_name, None)
-            run_command(f"ip {family} addr flush dev {bridge_name}", check=False)
+            if pool is not None:
+                pool.release(bridge_name)
+            with suppress(NetlinkError):
+                get_netlink().flush_addresses(bridge_name, family)
             continue
 
         set_ip, cache_changed = False, False
 
-        if ip_addr != hosts.get(bridge_name):
+        if ip_addr != store.lease(bridge_name, prefix, bridge_name):
             # If ipaddress has changed, update the the cache.
             # Will check if the new IP is not in conflict with any other host
             # before assigning to the bridge.
-            hosts.pop(bridge_name, None)
-            run_command(f"ip {family} addr flush dev {bridge_name}", check=False)
+            if pool is not None:
+                pool.release(bridge_name)
+            with suppress(NetlinkError):
+                get_netlink().flush_addresses(bridge_name, family)
             set_ip, cache_changed = True, True
 
         elif ip_addr not in get_interface_ip(bridge_name):
@@ -127,31 +215,27 @@ def init_bridge(bridge_name: str, info: BridgeInfoDict) -> None:
             set_ip = True
 
         if set_ip:
-            if cache_changed and ip_addr in hosts.values():
+            if pool is None or ipaddress.ip_interface(
+                ip_addr
+            ) not in ipaddress.ip_network(str(ip_range)):
+                # Ensure that IP address provided by user is always
+                # part of the same range as that being maintained by the bridge.
+                msg = f"{ip_addr} does not fall under the range {ip_range}"
+                raise ValueError(msg)
+
+            if cache_changed and pool.owner_of(ip_addr) is not None:
                 msg_set_ip_err = (
                     f"IP {ip_addr} already allocated to someone else. ",
                     f"Cannot assign request address to bridge {bridge_name}",
                 )
                 raise ValueError(msg_set_ip_err)
 
-            if ipaddress.ip_interface(ip_addr) not in ipaddress.ip_network(
-                str(ip_range)
-            ):
-                # Ensure that IP address provided by user is always
-                # part of the same range as that being maintained by the bridge.
-                msg = f"{ip_addr} does not fall under the range {ip_range}"
-                raise ValueError(msg)
-
-            hosts[bridge_name] = ip_addr
-            run_command(f"ip addr add {ip_addr} dev {bridge_name}")
+            pool.reserve(bridge_name, ip_addr)
+            get_netlink().add_address(bridge_name, ip_addr)
             _LOGGER.info("Updated IP address for %s to %s", bridge_name, ip_addr)
 
-    # Add parent interfaces
-    for parent_info in info.get("parents", []):
-        _add_iface_to_bridge(bridge_name=bridge_name, parent_info=parent_info)
 
-
-def create_veth_pair(
+async def create_veth_pair(
     on_bridge: str, prefix: str, vlan_map: str = ":", trunk: Literal["yes", "no"] = "no"
 ) -> None:
     """Create a veth pair and attach it to OVS bridges.
@@ -192,9 +276,9 @@ def create_veth_pair(
     # We will always check the C-VLAN veth endpoint.
     if not veth_exists(veth0):
         # Create veth pair
-        run_command(f"ip link add {veth0} type veth peer name {veth1}")
-        run_command(f"ip link set dev {veth0} up")
-        run_command(f"ip link set dev {veth1} up")
+        get_netlink().create_veth(veth0, veth1)
+        get_netlink().set_link_up(veth0)
+        get_netlink().set_link_up(veth1)
 
         _LOGGER.info("VETH pair created: %s <--> %s", veth0, veth1)
     else:
@@ -206,75 +290,57 @@ def create_veth_pair(
         _LOGGER.debug("Skipping VLAN endpoint creation.")
         log_method = _LOGGER.debug
 
-    add_function = (
-        add_iface_to_linux_bridge if USE_LINUX_BRIDGE else add_iface_to_ovs_bridge
-    )
-
     # Split the vlan_map to check if VLAN needs to be configured
     source_vlan, dest_vlan = vlan_map.split(":")
     _LOGGER.debug("VLAN mapping %s on %s", vlan_map, on_bridge)
 
-    # Always attach the first veth (veth0) to the bridge
-    _LOGGER.debug("Attaching %s to bridge %s", veth0, on_bridge)
-    if trunk == "yes":
-        add_function(on_bridge, {"iface": veth0, "trunk": source_vlan})
-    else:
-        add_function(on_bridge, {"iface": veth0, "vlan": source_vlan})
-    log_method("VETH %s attached to bridge %s", veth0, on_bridge)
-
-    if dest_vlan:
-        _LOGGER.debug("Attaching %s to bridge %s", veth1, on_bridge)
+    async with _bridge_batch():
+        # Always attach the first veth (veth0) to the bridge
+        _LOGGER.debug("Attaching %s to bridge %s", veth0, on_bridge)
         if trunk == "yes":
-            add_function(on_bridge, {"iface": veth1, "trunk": dest_vlan})
+            await _attach_to_bridge(on_bridge, {"iface": veth0, "trunk": source_vlan})
         else:
-            add_function(on_bridge, {"iface": veth1, "vlan": dest_vlan})
-        log_method("VETH %s attached to bridge %s", veth1, on_bridge)
-    else:
-        _LOGGER.debug("No VLAN configuration for veth1: %s", veth1)
-        log_method("VETH %s is dangling!", veth1)
+            await _attach_to_bridge(on_bridge, {"iface": veth0, "vlan": source_vlan})
+        log_method("VETH %s attached to bridge %s", veth0, on_bridge)
+
+        if dest_vlan:
+            _LOGGER.debug("Attaching %s to bridge %s", veth1, on_bridge)
+            if trunk == "yes":
+                await _attach_to_bridge(on_bridge, {"iface": veth1, "trunk": dest_vlan})
+            else:
+                await _attach_to_bridge(on_bridge, {"iface": veth1, "vlan": dest_vlan})
+            log_method("VETH %s attached to bridge %s", veth1, on_bridge)
+        else:
+            _LOGGER.debug("No VLAN configuration for veth1: %s", veth1)
+            log_method("VETH %s is dangling!", veth1)
 
 
-def add_iface_to_container(  # noqa: C901
-    container_name: str,
-    info: ContainerInfoDict,
-) -> None:
-    """Attach a container to a target OVS bridge.
+def _reserve_container_ips(
+    container_name: str, info: ContainerInfoDict
+) -> dict[str, str]:
+    """Reserve the container addresses in the bridge IP ranges.
 
     :param container_name: Target container to push the interface at
     :type container_name: str
     :param info: Container interface details
     :type info: ContainerInfoDict
+    :return: "ipaddress"/"ip6address" to configure inside the container
+    :rtype: dict[str, str]
     :raises ValueError: If ipaddress syntax is incorrect.
     """
-    _LOGGER.debug("###################ADD IFACE TO CONTAINERS######################")
-
-    util = "ovs-docker" if not USE_LINUX_BRIDGE else "lxbr-docker"
-    bridge = info["bridge"]  # Mandatory
-    iface = info["iface"]  # Mandatory
-    db_cache = get_db(bridge)
-    cc_cache = db_cache.setdefault(container_name, {})
-    cmd = f"{util} add-port {bridge} {iface} {container_name}"
-    cc_cache.setdefault(iface, {})
-
-    # Check if container exists, skip if it does not exist.
-    if (not check_container_exists(container_name)) or check_interface_exists(
-        bridge, container_name, iface, util
-    ):
-        # If interface already exists, we exit
-        # Note: Need to add checks for IP address too before exiting.
-        return
+    bridge = info["bridge"]
+    store = get_store()
+    addresses: dict[str, str] = {}
 
     for prefix in ("ip", "ip6"):
         address_key = f"{prefix}address"
-        range_key = f"{prefix}range"
-        hosts = db_cache.get(f"{range_key}_hosts", {})
         if not (ipaddr := info.get(address_key)):
             # If ipaddress is not provided, but the bridge has an iprange defined
             # The container will be provided with an IP address from  bridge's
             # ip range.
-            if db_cache.get(range_key):
+            if store.get_range(bridge, prefix):
                 ip = auto_allocate_ip(bridge, container_name, prefix)
-                cmd = f"{cmd} --{address_key}={ip}"
+                addresses[address_key] = ip
             continue
 
         if ipaddr == "No-IP":  # If the user explicitly specifies "No-IP"
@@ -284,79 +350,373 @@ def add_iface_to_container(  # noqa: C901
             msg_no_prefix = f"{container_name}: ip {ipaddr} must have a prefix mask"
             raise ValueError(msg_no_prefix)
 
-        if ipaddr != hosts.get(container_name):
-            hosts.pop(container_name, None)
-            if ipaddr in hosts.values():
-                msg_ip_exists = (
-                    f"IP {ipaddr} already allocated to someone else.",
-                    f"Failed to assign addr to container: {container_name}",
-                )
-                raise ValueError(msg_ip_exists)
+        if (pool := get_ip_pool(bridge, prefix)) is None:
+            # No range on the bridge, nothing to check against.
+            store.set_lease(bridge, prefix, container_name, ipaddr)
+        elif pool.owner_of(ipaddr) not in (None, container_name):
+            msg_ip_exists = (
+                f"IP {ipaddr} already allocated to someone else.",
+                f"Failed to assign addr to container: {container_name}",
+            )
+            raise ValueError(msg_ip_exists)
+        else:
+            pool.reserve(container_name, ipaddr)
+        addresses[address_key] = ipaddr
 
-        hosts[container_name] = ipaddr
-        cmd = f"{cmd} --{address_key}={ipaddr}"
+    return addresses
 
-    for key in ["macaddress", "gateway", "gateway6"]:
-        # Note: add a check here to ensure that
-        if value := info.get(key, ""):
-            cmd = f"{cmd} --{key}={value}"
 
-    run_command(cmd)
+async def add_iface_to_container(
+    container_name: str,
+    info: ContainerInfoDict,
+    snap: HostSnapshot | None = None,
+) -> None:
+    """Attach a container to a target OVS bridge.
+
+    :param container_name: Target container to push the interface at
+    :type container_name: str
+    :param info: Container interface details
+    :type info: ContainerInfoDict
+    :param snap: Host snapshot to check the container and its port against,
+                 None to take one
+    :type snap: HostSnapshot | None
+    :raises ValueError: If ipaddress syntax is incorrect.
+    """
+    _LOGGER.debug("###################ADD IFACE TO CONTAINERS######################")
+
+    bridge = info["bridge"]  # Mandatory
+    iface = info["iface"]  # Mandatory
+    get_store().set_iface(bridge, container_name, iface)
+
+    if snap is None:
+        snap = await snapshot_host()
+    # Check if container exists, skip if it does not exist.
+    cc = snap.containers.get(container_name)
+    if (
+        cc is None
+        or not cc.running
+        or container_port_attached(container_name, info, snap)
+    ):
+        # If interface already exists, we exit
+        # Note: Need to add checks for IP address too before exiting.
+        return
+
+    # A PID not known yet is inspected over the Docker socket.
+    pid = await run_blocking(get_docker().pid, container_name)
+    vlan, trunk = info.get("vlan"), info.get("trunk")
+    spec = AttachSpec(
+        bridge=bridge,
+        iface=iface,
+        container=container_name,
+        netns=netns_path(pid),
+        macaddress=info.get("macaddress", ""),
+        gateway=info.get("gateway", ""),
+        gateway6=info.get("gateway6", ""),
+        stale_port=container_stale_port(container_name, iface, snap),
+        tag=int(vlan) if vlan else None,
+        trunks=vlan_ids(parse_vlans(trunk)) if trunk else None,
+        **_reserve_container_ips(container_name, info),
+    )
+    # Switches network namespace, so it must not run on the event loop.
+    await run_blocking(attach_interface, spec)
     _LOGGER.info(
         "Interface %s connected to bridge:%s added to container %s",
         iface,
         bridge,
         container_name,
     )
-    configure_container_vlan(container_name, info)
+    await configure_container_vlan(container_name, info, attached=True)
+
+
+def _release_container_ips(bridge: str, container_name: str) -> None:
+    """Release the addresses of a container on a bridge.
+
+    :param bridge: bridge name
+    :type bridge: str
+    :param container_name: container name
+    :type container_name: str
+    """
+    store = get_store()
+    for prefix in ("ip", "ip6"):
+        if (pool := get_ip_pool(bridge, prefix)) is not None:
+            pool.release(container_name)
+        else:
+            store.set_lease(bridge, prefix, container_name, None)
+
+
+async def remove_iface_from_container(
+    container_name: str, info: ContainerInfoDict, snap: HostSnapshot
+) -> None:
+    """Detach a container interface from its bridge and forget it.
+
+    The addresses of the container are released once it has no other
+    interface on the bridge.
+
+    :param container_name: container the interface belongs to
+    :type container_name: str
+    :param info: Container interface details
+    :type info: ContainerInfoDict
+    :param snap: Host snapshot used to find the host side veth
+    :type snap: HostSnapshot
+    """
+    bridge, iface = info["bridge"], info["iface"]
+    if container_port_attached(container_name, info, snap):
+        if USE_LINUX_BRIDGE:
+            port = lxbr_port_name(container_name, iface)
+        else:
+            port = snap.container_ports[container_name, iface]
+        await run_blocking(detach_interface, port)
+        _LOGGER.info(
+            "Interface %s of container %s removed from bridge %s",
+            iface,
+            container_name,
+            bridge,
+        )
+
+    store = get_store()
+    store.remove_iface(bridge, container_name, iface)
+    if all(b != bridge for b, _ in store.container_ifaces(container_name)):
+        _release_container_ips(bridge, container_name)
+
+
+async def remove_veth_pair(on_bridge: str, prefix: str) -> None:
+    """Detach a veth pair from its bridge and delete it.
+
+    :param on_bridge: bridge the veth pair is attached to
+    :type on_bridge: str
+    :param prefix: veth pair prefix
+    :type prefix: str
+    """
+    veth0, veth1 = f"v0_{prefix}", f"v1_{prefix}"
+    async with _ovs_batch() as txn:
+        if txn is not None:
+            txn.del_port(veth0)
+            txn.del_port(veth1)
+    if veth_exists(veth0):
+        # Deleting one end deletes the pair.
+        get_netlink().delete_link(veth0)
+    store = get_store()
+    store.remove_iface(on_bridge, BRIDGE_PORT, veth0)
+    store.remove_iface(on_bridge, BRIDGE_PORT, veth1)
+    _LOGGER.info("VETH pair %s <--> %s removed", veth0, veth1)
+
+
+async def remove_parent(bridge_name: str, parent: str) -> None:
+    """Detach a parent interface from a bridge, keeping the interface.
+
+    :param bridge_name: bridge name
+    :type bridge_name: str
+    :param parent: parent interface name
+    :type parent: str
+    """
+    if "usb:" in parent:
+        parent = get_usb_interface(parent.rsplit(":", maxsplit=1)[-1])
+    if USE_LINUX_BRIDGE:
+        with suppress(NetlinkError):
+            get_netlink().set_master(parent, None)
+    else:
+        async with get_ovsdb().async_batch() as txn:
+            if txn.port_to_br(parent) == bridge_name:
+                txn.del_port(parent)
+    get_store().remove_iface(bridge_name, BRIDGE_PORT, parent)
+    _LOGGER.info("Parent %s removed from bridge %s", parent, bridge_name)
 
 
-async def main() -> None:  # noqa: C901
+async def remove_bridge(bridge_name: str) -> None:
+    """Delete a bridge with its ports and forget its ranges and leases.
+
+    Parent interfaces are released, not deleted.
+
+    :param bridge_name: bridge name
+    :type bridge_name: str
+    """
+    if USE_LINUX_BRIDGE:
+        if get_netlink().link(bridge_name) is not None:
+            get_netlink().delete_link(bridge_name)
+    else:
+        async with get_ovsdb().async_batch() as txn:
+            txn.del_bridge(bridge_name)
+    for prefix in ("ip", "ip6"):
+        set_ip_range(bridge_name, prefix, None)
+    get_store().remove_bridge(bridge_name)
+    _LOGGER.info("Bridge %s removed", bridge_name)
+
+
+async def _locked(
+    lock: asyncio.Lock,
+    func: Callable[..., Awaitable[None]],
+    *args: Any,  # noqa: ANN401
+) -> None:
+    async with lock:
+        await func(*args)
+
+
+async def _gather(tasks: list[Coroutine[Any, Any, None]]) -> None:
+    """Run tasks concurrently and re-raise the first failure.
+
+    Every task runs to completion, so one broken container does not
+    leave the others half attached.
+
+    :param tasks: coroutines to run
+    :type tasks: list[Coroutine[Any, Any, None]]
+    """
+    errors = [
+        result
+        for result in await asyncio.gather(*tasks, return_exceptions=True)
+        if isinstance(result, BaseException)
+    ]
+    for error in errors[1:]:
+        _LOGGER.error("Reconcile task failed: %s", error)
+    if errors:
+        raise errors[0]
+
+
+async def snapshot_host() -> HostSnapshot:
+    """Take a bulk snapshot of the host without blocking the event loop.
+
+    :return: host snapshot
+    :rtype: HostSnapshot
+    """
+
+    def _snapshot() -> HostSnapshot:
+        ovs = None if USE_LINUX_BRIDGE else get_ovsdb().dump()
+        return take_snapshot(ovs)
+
+    return await run_blocking(_snapshot)
+
+
+async def reconcile(config: dict[str, Any], work: WorkSet | None = None) -> int:
+    """Apply the config to the host, touching only objects that drifted.
+
+    The config is compiled, reusing the objects of unchanged entries, and
+    reduced to the objects named by the work set. The host is read once
+    through bulk snapshots of OVS, links/addresses and containers. Bridges,
+    container interfaces and veth pairs whose host state already matches
+    the config are skipped.
+
+    Drifted bridges are set up first, each under its own bridge lock.
+    Container interfaces and veth pairs are then configured concurrently,
+    serialised only per container or bridge.
+
+    :param config: desired state, as returned by get_config()
+    :type config: dict[str, Any]
+    :param work: events collected since the last cycle, None for everything
+    :type work: WorkSet | None
+    :return: number of objects that were reconciled
+    :rtype: int
+    """
+    state = await run_blocking(compile_config, config)
+    if work is not None:
+        state = scope_state(state, work)
+    snap = await snapshot_host()
+    drift = await run_blocking(find_drift, state, snap)
+
+    # Initialize all parent bridges
+    await _gather(
+        [
+            _locked(BRIDGE_LOCKS(bridge), init_bridge, bridge, config["bridge"][bridge])
+            for bridge in drift.bridges
+        ]
+    )
+
+    # Attach containers to parent bridges based on config.json
+    tasks = [
+        _locked(
+            CONTAINER_LOCKS(container), add_iface_to_container, container, info, snap
+        )
+        for container, info in drift.missing_ifaces
+    ]
+    tasks += [
+        _locked(CONTAINER_LOCKS(container), configure_container_vlan, container, info)
+        for container, info in drift.vlan_ifaces
+    ]
+
+    # Handle Veth pairs and VLAN translations
+    for prefix in drift.veth_pairs:
+        translation = config["veth_pairs"][prefix]
+        tasks.append(
+            _locked(
+                BRIDGE_LOCKS(translation["on"]),
+                create_veth_pair,
+                translation["on"],
+                prefix,
+                translation.get("map", ":"),
+                translation.get("trunk", "no"),
+            )
+        )
+    await _gather(tasks)
+
+    if drift:
+        _LOGGER.info("Reconciled %s drifted objects", len(drift))
+    return len(drift)
+
+
+Gauge(
+    "raikou_reconcile_failures",
+    "Failed reconcile cycles recorded in the state store.",
+    (),
+    lambda: [((), int(get_store().get_meta("failed", "0")))],
+)
+
+
+async def main() -> None:
     """Runner function that runs in a loop."""
     # Initial Check if docker socket is loaded.
     if not DOCKER_SOCKET.exists():
         _LOGGER.error("Need to mount Docker socket!!")
         sys.exit(1)
 
-    check_sys_module()
-
-    fail_count = cast(int, get_db("failed", 0))
-
-    while True:
-        config = get_config()
-
-        if fail_count > MAX_FAIL_COUNT:
-            sys.exit(1)
-        try:
-            async with EVENT_LOCK:
-                # Initialize all parent bridges
-                for bridge, info in config["bridge"].items():
-                    init_bridge(bridge, info)
-
-                # Attach containers to parent bridges based on config.json
-                for container, iface_info in config["container"].items():
-                    for info in iface_info:
-                        add_iface_to_container(container, info)
-
-                # Handle Veth pairs and VLAN translations
-                for prefix, translation in config.get("veth_pairs", {}).items():
-                    create_veth_pair(
-                        on_bridge=translation["on"],
-                        prefix=prefix,
-                        vlan_map=translation.get("map", ":"),
-                        trunk=translation.get("trunk", "no"),
-                    )
-
-            # Introduce a sleep to wait before the next loop cycle
-            await asyncio.sleep(15)  # This allows cancellation to be checked
-
-        except asyncio.CancelledError:
-            _LOGGER.info("Main loop has been cancelled. Shutting down gracefully.")
-
-        except (CalledProcessError, ValueError, IndexError):
-            _LOGGER.exception("Exiting core due to exception")
-            traceback.print_exc()
-            get_db()["failed"] = fail_count + 1
+    await check_sys_module()
+
+    if WARM_RESTART:
+        await run_blocking(adopt_host_state, get_config())
+
+    fail_count = int(get_store().get_meta("failed", "0"))
+
+    events: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+    watchers = start_watchers(events)
+    work = WorkSet(full=True)
+    last_full = time.monotonic()
+
+    try:
+        while True:
+            config = get_config()
+            if work.full:
+                last_full = time.monotonic()
+
             if fail_count > MAX_FAIL_COUNT:
-                _LOGGER.exception("Orchestrator keeps failing! Exiting.")
                 sys.exit(1)
+            try:
+                scope = "full" if work.full else "events"
+                with reconcile_cycle(scope), get_tracer().cycle(scope):
+                    await reconcile(config, work)
+
+            except (
+                CalledProcessError,
+                TimeoutExpired,
+                DockerError,
+                NetlinkError,
+                OSError,
+                OvsdbError,
+                ValueError,
+                IndexError,
+            ):
+                _LOGGER.exception("Exiting core due to exception")
+                traceback.print_exc()
+                fail_count += 1
+                get_store().set_meta("failed", str(fail_count))
+                if fail_count > MAX_FAIL_COUNT:
+                    _LOGGER.exception("Orchestrator keeps failing! Exiting.")
+                    sys.exit(1)
+                # Retry with a full sweep
+                await events.put(("sweep", ""))
+
+            # Wait for host events, or for the periodic safety-net sweep
+            work = await collect_work(events, RECONCILE_INTERVAL, last_full=last_full)
+
+    except asyncio.CancelledError:
+        _LOGGER.info("Main loop has been cancelled. Shutting down gracefully.")
+        raise
+
+    finally:
+        await stop_watchers(watchers)
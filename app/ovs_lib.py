@@ -4,22 +4,48 @@ This part contains public helper functions for command execution, IP retrieval,
 and OVS database management.
 """
 
+import json
 import re
 import sys
-from subprocess import CalledProcessError, run
-
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+
+from app.model import lxbr_port_name
+from app.netlink import NetlinkError, get_netlink
+from app.ovsdb import OvsdbError, get_ovsdb
+from app.store import BRIDGE_PORT, get_store
 from app.utils import (
     USE_LINUX_BRIDGE,
     ContainerInfoDict,
     IfaceInfoDict,
-    get_db,
     get_logger,
+    run_blocking,
     run_command,
 )
+from app.vlans import (
+    VlanRanges,
+    format_range,
+    format_vlans,
+    merge_ranges,
+    parse_vlans,
+    subtract_ranges,
+    vlan_ids,
+    vlan_ranges,
+)
 
 # Initialize logger
 _LOGGER = get_logger("ovs_lib")
 
+# Linux bridge VLAN changes collected by the current task, see bridge_vlan_batch()
+_VLAN_BATCH: ContextVar["BridgeVlanBatch | None"] = ContextVar(
+    "bridge_vlan_batch", default=None
+)
+# VLANs the kernel gives a new Linux bridge port: all, tagged only, port VLAN
+_NEW_PORT_VLANS: tuple[VlanRanges, VlanRanges, int | None] = (((1, 1),), (), 1)
+
 
 def get_interface_ip(interface: str) -> list[str | None]:
     """Get the IP address of a network interface.
@@ -30,13 +56,9 @@ def get_interface_ip(interface: str) -> list[str | None]:
     :rtype: list[str | None]
     """
     try:
-        command = ["ip", "-o", "addr", "show", interface]
-        result = run(command, check=True, capture_output=True, text=True)
-        return re.findall(r"inet\d*\s+(\S+)", result.stdout.strip())
-    except CalledProcessError as exc:
-        _LOGGER.exception("Subprocess error:\nCommand failed: %s", exc.cmd)
-        stderr_output = exc.stderr.strip()
-        _LOGGER.exception("Command stderr output:\n%s", stderr_output)
+        return list(get_netlink().addresses(interface))
+    except NetlinkError:
+        _LOGGER.exception("Failed to read addresses of %s", interface)
     return []
 
 
@@ -48,8 +70,7 @@ def veth_exists(veth_end: str) -> bool:
     :return: True if the veth or veth pair exists, False otherwise.
     :rtype: bool
     """
-    result = run_command(f"ip link show {veth_end}", check=False)
-    return result.returncode == 0
+    return get_netlink().link(veth_end) is not None
 
 
 def configure_ovs_vlan_port(port_name: str, vlan_type: str, vid: str) -> None:
@@ -62,97 +83,160 @@ def configure_ovs_vlan_port(port_name: str, vlan_type: str, vid: str) -> None:
     :type port_name: str
     :param vlan_type: VLAN configuration key ('trunk' or 'native' or 'vlan').
     :type vlan_type: str
-    :param vid: The VLAN ID(s) associated with the parent interface.
+    :param vid: The VLAN ID, or trunk VLAN ids and ranges, of the parent interface.
     :type vid: str
     """
-    if vlan_type == "trunk":
-        run_command(f"ovs-vsctl set port {port_name} vlan_mode=trunk trunks={vid}")
-    elif vlan_type == "vlan":
-        run_command(f"ovs-vsctl set port {port_name} vlan_mode=access tag={vid}")
-    elif vlan_type == "native":
-        run_command(
-            f"ovs-vsctl set port {port_name} vlan_mode=native-untagged tag={vid}"
-        )
+    with get_ovsdb().batch() as txn:
+        if vlan_type == "trunk":
+            trunks = vlan_ids(parse_vlans(vid))
+            txn.set_port(port_name, vlan_mode="trunk", trunks=trunks)
+        elif vlan_type == "vlan":
+            txn.set_port(port_name, vlan_mode="access", tag=int(vid))
+        elif vlan_type == "native":
+            txn.set_port(port_name, vlan_mode="native-untagged", tag=int(vid))
+
+
+class BridgeVlanBatch:
+    """VLAN changes of Linux bridge ports, applied by one ``bridge -batch``."""
+
+    def __init__(self) -> None:
+        """Create an empty batch."""
+        self.bridges: set[str] = set()
+        self._commands: list[str] = []
+
+    def add(self, port: str, vlans: VlanRanges, pvid: bool = False) -> None:
+        """Queue adding VLANs to a port, or updating their flags.
+
+        :param port: bridge port name
+        :type port: str
+        :param vlans: VLAN intervals
+        :type vlans: VlanRanges
+        :param pvid: make the VLAN the untagged port VLAN, a single VLAN only
+        :type pvid: bool
+        """
+        flags = " pvid untagged" if pvid else ""
+        self._commands += [
+            f"vlan add dev {port} vid {format_range(*span)}{flags}" for span in vlans
+        ]
+
+    def delete(self, port: str, vlans: VlanRanges) -> None:
+        """Queue removing VLANs from a port.
+
+        :param port: bridge port name
+        :type port: str
+        :param vlans: VLAN intervals
+        :type vlans: VlanRanges
+        """
+        self._commands += [
+            f"vlan del dev {port} vid {format_range(*span)}" for span in vlans
+        ]
+
+    async def apply(self) -> None:
+        """Enable VLAN filtering on the bridges and run the queued commands."""
+        netlink = get_netlink()
+        for bridge in sorted(self.bridges):
+            link = netlink.link(bridge)
+            if link is not None and not link.vlan_filtering:
+                netlink.set_vlan_filtering(bridge)
+        if self._commands:
+            commands, self._commands = self._commands, []
+            await run_command("bridge -batch -", stdin="\n".join(commands) + "\n")
+
+
+@asynccontextmanager
+async def bridge_vlan_batch() -> AsyncIterator[BridgeVlanBatch]:
+    """Collect Linux bridge VLAN changes and apply them in one go.
+
+    Nested calls from the same task join the outermost batch, which is
+    applied when it exits cleanly and discarded on error.
+
+    :yield: the active batch
+    """
+    if (batch := _VLAN_BATCH.get()) is not None:
+        yield batch
+        return
+    batch = BridgeVlanBatch()
+    token = _VLAN_BATCH.set(batch)
+    try:
+        yield batch
+    finally:
+        _VLAN_BATCH.reset(token)
+    await batch.apply()
 
 
-def configure_lxbr_vlan_port(
-    bridge_name: str, port_name: str, vlan_type: str, vid: str
+async def _lxbr_port_vlans(port_name: str) -> tuple[VlanRanges, VlanRanges, int | None]:
+    """Read the VLANs of a Linux bridge port.
+
+    :param port_name: bridge port name
+    :type port_name: str
+    :return: all VLANs, the VLANs without flags and the untagged port VLAN
+    :rtype: tuple[VlanRanges, VlanRanges, int | None]
+    """
+    check = await run_command(f"bridge -j -c vlan show dev {port_name}", check=False)
+    every, tagged, pvid = [], [], None
+    for port in json.loads(check.stdout or "[]"):
+        for entry in port.get("vlans", []):
+            span = (entry["vlan"], entry.get("vlanEnd", entry["vlan"]))
+            every.append(span)
+            if not (flags := entry.get("flags")):
+                tagged.append(span)
+            elif "PVID" in flags and "Egress Untagged" in flags:
+                pvid = span[0]
+    return merge_ranges(every), merge_ranges(tagged), pvid
+
+
+async def configure_lxbr_vlan_port(
+    bridge_name: str,
+    port_name: str,
+    iface_info: IfaceInfoDict,
+    current: tuple[VlanRanges, VlanRanges, int | None] | None = None,
 ) -> None:
-    """Configure VLAN settings for a Linux bridge.
+    """Configure VLAN settings for a Linux bridge port.
 
-    This function sets up VLAN filtering and adds VLANs to the specified parent interface
-    in a Linux bridge.
+    The port gets the trunk VLANs tagged and the native or access VLAN as
+    untagged port VLAN, any other VLAN, like the default VLAN 1, is
+    removed. Only the differences are queued into the current
+    bridge_vlan_batch(), or into a batch of their own.
 
     :param bridge_name: Name of the Linux bridge.
     :type bridge_name: str
-    :param port_name: Name of the parent interface attached to Linux Bridge.
+    :param port_name: Name of the interface attached to the Linux bridge.
     :type port_name: str
-    :param vlan_type: VLAN configuration key ('trunk' or 'native' or 'vlan').
-    :type vlan_type: str
-    :param vid: The VLAN ID(s) associated with the parent interface.
-    :type vid: str
-    """
-    run_command(f"ip link set {bridge_name} type bridge vlan_filtering 1")
-    run_command(f"bridge vlan delete dev {port_name} vid 1")
-
-    for vlan_id in str(vid).split(","):
-        cmd = f"bridge vlan add dev {port_name} vid {vlan_id}"
-        if vlan_type in ["native", "vlan"]:
-            cmd += " pvid untagged"
-        run_command(cmd)
-
-
-def remove_linux_bridge_vlan(iface: str, vid: str) -> bool:
-    """Remove or reset the specified VLAN setting from a Linux bridge interface.
-
-    This function checks the current VLAN setting on a Linux bridge interface. If the
-    current value does not match the provided `vid`, it removes or resets
-    the VLAN settings (trunk, native, or tagged VLAN) for the specified interface.
-
-    :param iface: The network interface from which to remove the VLAN setting.
-    :type iface: str
-    :param vid: The VLAN ID to be removed.
-    :type vid: str
-    :return: True if VLAN settings were removed, False if there was no change.
-    :rtype: bool
+    :param iface_info: Interface details with the trunk, native and vlan settings.
+    :type iface_info: IfaceInfoDict
+    :param current: VLANs of the port if known, as _lxbr_port_vlans() returns
+                    them, None to read them
+    :type current: tuple[VlanRanges, VlanRanges, int | None] | None
     """
-    # Determine the current VLAN settings on the interface using `bridge vlan`
-    check = run_command(f"bridge vlan show dev {iface}", check=False)
-
-    if not check.stdout.strip():
-        _LOGGER.debug("No VLAN settings found on iface %s", iface)
-        return True
-
-    # Split the expected and actual VLANs
-    expected_values = set(vid.split(","))
-    actual_values = [
-        re.findall(r"\d+", li).pop()
-        for li in check.stdout.strip().splitlines()[1:]
-        if re.findall(r"\d+", li)
-    ]
-
-    # Find any VLANs that exist but aren't expected
-    actual_value_set = set(actual_values)
-    to_remove = actual_value_set - expected_values
-
-    # If all actual values are as expected, no need to remove anything
-    if not to_remove:
+    untagged = iface_info.get("vlan") or iface_info.get("native")
+    pvid = int(untagged) if untagged else None
+    pvid_range = vlan_ranges([pvid] if pvid is not None else [])
+    trunks = subtract_ranges(parse_vlans(iface_info.get("trunk")), pvid_range)
+    actual, actual_tagged, actual_pvid = current or await _lxbr_port_vlans(port_name)
+    to_remove = subtract_ranges(actual, merge_ranges(trunks + pvid_range))
+    to_add = subtract_ranges(trunks, actual_tagged)
+    set_pvid = pvid is not None and pvid != actual_pvid
+    if not (to_remove or to_add or set_pvid):
         _LOGGER.info(
             "Current VLAN settings for iface %s match the expected: %s",
-            iface,
-            actual_values,
+            port_name,
+            format_vlans(actual),
         )
-        return False
-
-    _LOGGER.info("VLAN settings to be removed from iface %s: %s", iface, to_remove)
-
-    # Remove any VLANs that are not in the expected values
-    for vlan_id in to_remove:
-        _LOGGER.info("Removing VLAN: %s from iface %s", vlan_id, iface)
-        cmd = f"bridge vlan del vid {vlan_id} dev {iface}"
-        run_command(cmd)
+        return
 
-    return True
+    _LOGGER.info(
+        "VLAN settings of iface %s: removing %s, adding %s, untagged %s",
+        port_name,
+        format_vlans(to_remove),
+        format_vlans(to_add),
+        pvid if set_pvid else None,
+    )
+    async with bridge_vlan_batch() as batch:
+        batch.bridges.add(bridge_name)
+        batch.delete(port_name, to_remove)
+        batch.add(port_name, to_add)
+        if set_pvid:
+            batch.add(port_name, pvid_range, pvid=True)
 
 
 def remove_ovs_vlan_port(parent: str, vlan_type: str, vid: str) -> bool:
@@ -172,81 +256,93 @@ def remove_ovs_vlan_port(parent: str, vlan_type: str, vid: str) -> bool:
     :return: True if VLAN settings were removed.
     :rtype: bool
     """
-    # Get the current configuration for the port
-    if vlan_type == "trunk":
-        check = run_command(f"ovs-vsctl get port {parent} trunks", check=False)
-        current_value = re.findall(r"\d+", check.stdout.strip())
-        _LOGGER.debug("Current trunk VLAN for port %s is %s", parent, current_value)
-    elif vlan_type in ("vlan"):
-        check = run_command(f"ovs-vsctl get port {parent} tag", check=False)
-        current_value = re.findall(r"\d+", check.stdout.strip())
-        _LOGGER.debug("Current tag VLAN for port %s is %s", parent, current_value)
-    else:
-        return True
-    # if there is no setting, then there was nothing to remove.
-    if not current_value:
+    if vlan_type not in ("trunk", "vlan"):
         return True
 
-    # Check if the current value differs from the one we want to remove
-    if set(current_value) == set(re.findall(r"\d+", vid)):
+    with get_ovsdb().batch() as txn:
+        # Get the current configuration for the port
+        if (row := txn.port(parent)) is None:
+            return True
+        if vlan_type == "trunk":
+            current_value = row.trunks
+        else:
+            current_value = vlan_ranges([row.tag] if row.tag is not None else [])
         _LOGGER.debug(
-            "No need to remove %s VLAN setting %s for port %s, already set",
+            "Current %s VLAN for port %s is %s",
             vlan_type,
-            vid,
             parent,
+            format_vlans(current_value),
         )
-        return False
+        # if there is no setting, then there was nothing to remove.
+        if not current_value:
+            return True
 
-    # Remove the VLAN configuration only if it doesn't match
-    if vlan_type == "trunk":
-        _LOGGER.debug("Removing trunk VLAN setting from port %s", parent)
-        run_command(f"ovs-vsctl remove port {parent} trunks {','.join(current_value)}")
-    elif vlan_type in ("native", "vlan"):
-        _LOGGER.debug("Removing VLAN tag setting from port %s", parent)
-        run_command(f"ovs-vsctl remove port {parent} tag {','.join(current_value)}")
+        # Check if the current value differs from the one we want to remove
+        if current_value == parse_vlans(vid):
+            _LOGGER.debug(
+                "No need to remove %s VLAN setting %s for port %s, already set",
+                vlan_type,
+                vid,
+                parent,
+            )
+            return False
+
+        # Remove the VLAN configuration only if it doesn't match
+        if vlan_type == "trunk":
+            _LOGGER.debug("Removing trunk VLAN setting from port %s", parent)
+            txn.set_port(parent, trunks=None)
+        else:
+            _LOGGER.debug("Removing VLAN tag setting from port %s", parent)
+            txn.set_port(parent, tag=None)
 
     _LOGGER.info(
         "%s VLAN setting %s removed from port %s",
         vlan_type.capitalize(),
-        current_value,
+        format_vlans(current_value),
         parent,
     )
     return True
 
 
-def create_bridge(bridge_name: str) -> None:
+async def create_bridge(bridge_name: str) -> None:
     """Create an OVS or Linux bridge.
 
     :param bridge_name: Name of the bridge to create.
     :type bridge_name: str
     """
-    bridge_exists_cmd = (
-        f"ovs-vsctl br-exists {bridge_name}"
-        if not USE_LINUX_BRIDGE
-        else f"brctl show {bridge_name}"
-    )
-    bridge_check = run_command(bridge_exists_cmd, check=False)
+    link = get_netlink().link(bridge_name)
+    if USE_LINUX_BRIDGE:
+        bridge_exists = link is not None and link.kind == "bridge"
+    else:
+        async with get_ovsdb().async_batch() as txn:
+            bridge_exists = txn.bridge_exists(bridge_name)
 
     # If the bridge exists, no need to create it again
-    if bridge_check.returncode == 0:
+    if bridge_exists:
         _LOGGER.debug("Bridge %s already exists", bridge_name)
         return
 
     # This means that the interface was part of the wrong module
     # eg. if the interface was part of linux when meant to be part of OVS
-    if run_command(f"ip link show dev {bridge_name}", check=False).returncode == 0:
+    if link is not None:
         _LOGGER.debug("Bridge %s already exists but not on right module", bridge_name)
-        run_command(f"ip link set {bridge_name} down")
-        run_command(f"ovs-vsctl del-br {bridge_name}", check=False)
-        run_command(f"brctl delbr {bridge_name}", check=False)
+        get_netlink().set_link_up(bridge_name, up=False)
+        if link.kind == "openvswitch":
+            await run_command(f"ovs-vsctl del-br {bridge_name}", check=False)
+            get_ovsdb().invalidate()
+        else:
+            get_netlink().delete_link(bridge_name)
         _LOGGER.info("Removed redundant Bridge %s", bridge_name)
 
     # Bridge doesn't exist, create it
-    cmd, check = f"ovs-vsctl --may-exist add-br {bridge_name}", True
     if USE_LINUX_BRIDGE:
-        cmd, check = f"brctl addbr {bridge_name}", False
-    run_command(cmd, check)
-    run_command(f"ip link set {bridge_name} up")
+        get_netlink().create_bridge(bridge_name)
+    else:
+        async with get_ovsdb().async_batch() as txn:
+            txn.add_bridge(bridge_name)
+            # The bridge device must exist before it can be brought up.
+            await run_blocking(txn.commit, True)
+    get_netlink().set_link_up(bridge_name)
     _LOGGER.info("Bridge %s created and brought up", bridge_name)
 
 
@@ -264,29 +360,32 @@ def add_iface_to_ovs_bridge(bridge_name: str, iface_info: IfaceInfoDict) -> None
     """
     # Check if the interface already exists
     parent = iface_info.get("iface", "")
-    db_cache = get_db(bridge_name)
-    iface_cache = db_cache.setdefault(parent, {})
-
-    check = run_command(f"ovs-vsctl port-to-br {parent}", check=False)
-    if check.stdout.strip() != bridge_name:
-        _LOGGER.debug("Parent %s not part of OVS bridge %s", parent, bridge_name)
-        run_command(f"ovs-vsctl --if-exists del-port {parent}", check=False)
-        run_command(f"ovs-vsctl --may-exist add-port {bridge_name} {parent}")
-        _LOGGER.debug("parent %s up for OVS bridge %s", parent, bridge_name)
-
-    for key in ["trunk", "native", "vlan"]:
-        value = iface_info.get(key, "")
-        cleaned_something = remove_ovs_vlan_port(parent, key, str(value))
-        if value and value != iface_cache.get(key, ""):
-            iface_cache[key] = value
-            if cleaned_something:
-                configure_ovs_vlan_port(parent, key, str(value))
-                _LOGGER.info(
-                    "New %s %s setting applied for parent %s", key, value, parent
-                )
-
-
-def add_iface_to_linux_bridge(bridge_name: str, iface_info: IfaceInfoDict) -> None:
+    store = get_store()
+    store.set_iface(bridge_name, BRIDGE_PORT, parent)
+
+    with get_ovsdb().batch() as txn:
+        if txn.port_to_br(parent) != bridge_name:
+            _LOGGER.debug("Parent %s not part of OVS bridge %s", parent, bridge_name)
+            txn.add_port(bridge_name, parent)
+            _LOGGER.debug("parent %s up for OVS bridge %s", parent, bridge_name)
+
+        for key in ["trunk", "native", "vlan"]:
+            value = iface_info.get(key, "")
+            # A native VLAN is held in the tag column as well, keep it.
+            expected = value or (iface_info.get("native", "") if key == "vlan" else "")
+            cleaned_something = remove_ovs_vlan_port(parent, key, str(expected))
+            if value:
+                store.set_iface(bridge_name, BRIDGE_PORT, parent, **{key: value})
+                if cleaned_something:
+                    configure_ovs_vlan_port(parent, key, str(value))
+                    _LOGGER.info(
+                        "New %s %s setting applied for parent %s", key, value, parent
+                    )
+
+
+async def add_iface_to_linux_bridge(
+    bridge_name: str, iface_info: IfaceInfoDict
+) -> None:
     """Add a parent/native interface to an Linux bridge.
 
     Use this to allow access to public network via your Linux bridge.
@@ -299,79 +398,36 @@ def add_iface_to_linux_bridge(bridge_name: str, iface_info: IfaceInfoDict) -> No
     :type iface_info: IfaceInfoDict
     """
     parent = iface_info.get("iface", "")
-    db_cache = get_db(bridge_name)
-    iface_cache = db_cache.setdefault(parent, {})
+    store = get_store()
+    store.set_iface(bridge_name, BRIDGE_PORT, parent)
+    iface_cache = store.iface(bridge_name, BRIDGE_PORT, parent) or {}
 
-    check = run_command(f"ip -o link show master {bridge_name}", check=False)
-    if parent not in check.stdout:
+    links = get_netlink().dump_links()
+    bridge, link = links.get(bridge_name), links.get(parent)
+    if not (bridge and link and link.master == bridge.index):
         _LOGGER.debug("Parent %s not part of Linux bridge %s", parent, bridge_name)
-        run_command(f"ip link set dev {parent} nomaster")
-        run_command(f"brctl addif {bridge_name} {parent}")
-
-    for key in ["trunk", "native", "vlan"]:
-        if (value := iface_info.get(key, "")) and value != iface_cache.get(key, ""):
-            _LOGGER.info("New %s %s setting applied for parent %s", key, value, parent)
-            iface_cache[key] = value
-            if remove_linux_bridge_vlan(parent, str(value)):
-                configure_lxbr_vlan_port(bridge_name, parent, key, str(value))
-
-
-def check_interface_exists(
-    bridge: str, container_name: str, iface: str, util: str
-) -> bool:
-    """Check if the interface exists inside the container and handle cleanup if necessary.
-
-    :param bridge: Name of the bridge.
-    :type bridge: str
-    :param container_name: Name of the container.
-    :type container_name: str
-    :param iface: Name of the interface.
-    :type iface: str
-    :param util: Utility command (ovs-docker or lxbr-docker).
-    :type util: str
-    :return: True if the interface exists and was already connected, False otherwise.
-    :rtype: bool
-    """
-    check = run_command(
-        f"docker exec {container_name} ip link show {iface}", check=False
-    )
-    if check.returncode == 0:
-        _LOGGER.debug("Interface %s exists inside container %s.", iface, container_name)
-        check = run_command(f"{util} get-port {container_name} {iface}", check=False)
-        if bool(check.stdout.strip()):
-            _LOGGER.debug("Interface %s exists on bridge.", iface)
-            return True
-
-        # Found a corner case
-        # If OVS orchestrator service is restarted,
-        # previously deployed containers still have their old interfaces.
-        # However, ovs does not have a link to them.
-        _LOGGER.debug(
-            "Interface %s exists inside container %s, but not on bridge. Removing...",
-            iface,
-            container_name,
-        )
-        run_command(f"docker exec {container_name} ip link del {iface}", check=False)
-
-    _LOGGER.info("Container: %s is missing interface %s!!", container_name, iface)
-    run_command(f"{util} del-port {bridge} {iface} {container_name}", check=False)
-    _LOGGER.info(
-        "Removed redundant pair of %s for container: %s from bridge: %s",
-        iface,
-        container_name,
-        bridge,
-    )
-    return False
-
-
-def configure_container_vlan(container_name: str, info: ContainerInfoDict) -> None:
+        get_netlink().set_master(parent, None)
+        get_netlink().set_master(parent, bridge_name)
+
+    changed = {
+        key: value
+        for key in ("trunk", "native", "vlan")
+        if (value := iface_info.get(key, "")) and value != iface_cache.get(key, "")
+    }
+    if changed:
+        _LOGGER.info("New %s settings applied for parent %s", changed, parent)
+        store.set_iface(bridge_name, BRIDGE_PORT, parent, **changed)
+        await configure_lxbr_vlan_port(bridge_name, parent, iface_info)
+
+
+async def configure_container_vlan(
+    container_name: str, info: ContainerInfoDict, *, attached: bool = False
+) -> None:
     """Configure VLAN or trunk settings for a container's interface on a bridge.
 
-    This function configures the VLAN or trunk settings for a container's interface
-    (`iface`) on a given bridge (`bridge`). The settings are determined from the
-    `info` dictionary, which should include the VLAN or trunk configuration. The
-    function will apply the specified VLAN or trunk mode to the interface using the
-    appropriate tool (`ovs-docker` or `lxbr-docker`), depending on the system's bridge setup.
+    The `vlan` of the interface becomes the access VLAN of its bridge port and
+    the `trunk` VLANs its trunk VLANs. An OVS port is updated in one OVSDB
+    transaction, a Linux bridge port through bridge_vlan_batch().
 
     :param container_name: The name of the container whose interface is being configured.
     :type container_name: str
@@ -381,43 +437,52 @@ def configure_container_vlan(container_name: str, info: ContainerInfoDict) -> No
                  - `vlan`: Optional. The VLAN ID to set (str or int).
                  - `trunk`: Optional. The trunk configuration to set (str).
     :type info: ContainerInfoDict
+    :param attached: The interface was just attached, so an OVS port already
+                     got its VLANs from add_port and a Linux bridge port only
+                     has the default VLAN.
+    :type attached: bool
+    :raises OvsdbError: if the interface has no OVS port
     """
-    util = "ovs-docker" if not USE_LINUX_BRIDGE else "lxbr-docker"
     bridge = info["bridge"]  # Mandatory
     iface = info["iface"]  # Mandatory
-    cc_cache = get_db(bridge)[container_name][iface]
-    for vlan_mode in ("vlan", "trunk"):
-        if value := info.get(vlan_mode):
-            _LOGGER.debug(
-                "%s read for %s:%s is %s", vlan_mode, container_name, iface, value
-            )
-            run(
-                f"{util} set-{vlan_mode} {bridge} {iface} {container_name} "
-                f"{value}".split(),
-                check=True,
-                capture_output=True,
-            )
-            cc_cache["vlan_mode"] = value
-            _LOGGER.info(
-                "%s set for %s:%s is %s", vlan_mode, container_name, iface, value
-            )
-
-
-def check_sys_module() -> None:
+    settings = {mode: value for mode in ("vlan", "trunk") if (value := info.get(mode))}
+    if not settings:
+        return
+    _LOGGER.debug(
+        "VLAN settings read for %s:%s are %s", container_name, iface, settings
+    )
+    if USE_LINUX_BRIDGE:
+        await configure_lxbr_vlan_port(
+            bridge,
+            lxbr_port_name(container_name, iface),
+            {"vlan": settings.get("vlan", ""), "trunk": settings.get("trunk", "")},
+            _NEW_PORT_VLANS if attached else None,
+        )
+    elif not attached:
+        async with get_ovsdb().async_batch() as txn:
+            if (port := txn.container_port(container_name, iface)) is None:
+                msg = f"Interface {iface} of {container_name} has no OVS port"
+                raise OvsdbError(msg)
+            columns: dict[str, Any] = {}
+            if vlan := settings.get("vlan"):
+                columns["tag"] = int(vlan)
+            if trunk := settings.get("trunk"):
+                columns["trunks"] = vlan_ids(parse_vlans(trunk))
+            txn.set_port(port, **columns)
+    # Like the per-setting calls of the helper scripts, the last one is kept
+    vlan_mode = settings.get("trunk") or settings["vlan"]
+    get_store().set_iface(bridge, container_name, iface, vlan_mode=vlan_mode)
+    _LOGGER.info("VLAN settings set for %s:%s are %s", container_name, iface, settings)
+
+
+async def check_sys_module() -> None:
     """Check if OVS module is installed."""
     if USE_LINUX_BRIDGE:
-        run_command("sysctl net.bridge.bridge-nf-call-iptables=0")
+        await run_command("sysctl net.bridge.bridge-nf-call-iptables=0")
         return
 
-    lsmod_out = run(["/bin/lsmod"], check=True, capture_output=True)
-    try:
-        run(
-            ["grep", "openvswitch"],
-            check=True,
-            input=lsmod_out.stdout,
-            capture_output=True,
-        )
-
-    except CalledProcessError:
-        _LOGGER.exception("Openvswitch kernel modules need to be mounted from host!!")
+    # Same source as lsmod, without forking lsmod and grep
+    modules = Path("/proc/modules").read_text(encoding="utf-8")  # noqa: ASYNC240
+    if not re.search(r"^openvswitch ", modules, re.MULTILINE):
+        _LOGGER.error("Openvswitch kernel modules need to be mounted from host!!")
         sys.exit(1)
@@ -0,0 +1,804 @@
+"""Native OVSDB JSON-RPC client.
+
+This part talks to ovsdb-server (RFC 7047) over a persistent connection
+instead of forking ``ovs-vsctl`` for every bridge, port and VLAN change.
+All changes queued inside :meth:`OvsdbClient.batch` are sent as a single
+transaction. Coroutines use :meth:`OvsdbClient.async_batch`, which dumps and
+commits in the worker pool.
+
+The client keeps the last known database state: every dump, e.g. the host
+snapshot of a reconcile cycle, refreshes it, and every committed batch
+applies its own changes to it. A batch starts from that state instead of
+dumping the database again, unless it was invalidated by an error, by a
+concurrent batch or by a helper tool writing to OVSDB.
+"""
+
+from __future__ import annotations
+
+import json
+import socket
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
+from functools import cache
+from itertools import count
+from typing import Any
+
+from app.utils import (
+    OVSDB_REMOTE,
+    SIMULATED_HOST,
+    get_logger,
+    record_request,
+    run_blocking,
+)
+from app.vlans import VlanRanges, vlan_ranges
+
+_LOGGER = get_logger("ovsdb")
+
+_DB_NAME = "Open_vSwitch"
+
+
+class OvsdbError(Exception):
+    """Raised when ovsdb-server rejects a request or transaction."""
+
+
+class _NotSentError(ConnectionError):
+    """Raised when a request could not be sent, so the server never saw it."""
+
+
+@dataclass(slots=True)
+class PortRow:
+    """Port columns the orchestrator cares about."""
+
+    uuid: str
+    bridge: str = ""
+    tag: int | None = None
+    trunks: VlanRanges = ()
+    vlan_mode: str | None = None
+
+
+@dataclass(slots=True)
+class InterfaceRow:
+    """Interface columns the orchestrator cares about."""
+
+    uuid: str
+    port: str = ""
+    external_ids: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class OvsdbState:
+    """Snapshot of bridges, ports and interfaces keyed by name."""
+
+    bridges: dict[str, str] = field(default_factory=dict)
+    ports: dict[str, PortRow] = field(default_factory=dict)
+    interfaces: dict[str, InterfaceRow] = field(default_factory=dict)
+
+    def copy(self) -> OvsdbState:
+        """Return a copy to queue changes on.
+
+        Rows are never modified in place, only replaced, so they are shared.
+
+        :return: copy of the snapshot
+        :rtype: OvsdbState
+        """
+        return OvsdbState(dict(self.bridges), dict(self.ports), dict(self.interfaces))
+
+
+def _as_set(value: Any) -> list[Any]:  # noqa: ANN401
+    """Decode an OVSDB <set> into a list of atoms.
+
+    :param value: OVSDB JSON value
+    :type value: Any
+    :return: list of atoms
+    :rtype: list[Any]
+    """
+    if isinstance(value, list) and value and value[0] == "set":
+        return [_as_atom(v) for v in value[1]]
+    return [_as_atom(value)]
+
+
+def _as_atom(value: Any) -> Any:  # noqa: ANN401
+    """Decode an OVSDB atom, unwrapping ``["uuid", ...]`` pairs.
+
+    :param value: OVSDB JSON value
+    :type value: Any
+    :return: decoded atom
+    :rtype: Any
+    """
+    if isinstance(value, list) and len(value) == 2 and value[0] == "uuid":  # noqa: PLR2004
+        return value[1]
+    return value
+
+
+def _as_map(value: Any) -> dict[str, str]:  # noqa: ANN401
+    """Decode an OVSDB <map> into a dict.
+
+    :param value: OVSDB JSON value
+    :type value: Any
+    :return: decoded map
+    :rtype: dict[str, str]
+    """
+    return dict(value[1]) if value else {}
+
+
+class OvsdbTransaction:
+    """Queue of OVSDB operations applied as one transaction.
+
+    The transaction keeps a local view of the database which reflects every
+    queued change, so callers can read back what they have just written
+    before the transaction is committed.
+    """
+
+    def __init__(
+        self, client: OvsdbClient, state: OvsdbState, version: int = 0
+    ) -> None:
+        """Initialise a transaction on top of a database snapshot.
+
+        :param client: client used to commit the transaction
+        :type client: OvsdbClient
+        :param state: database snapshot the transaction starts from, owned
+                      by the transaction
+        :type state: OvsdbState
+        :param version: version of the client state the snapshot is
+        :type version: int
+        """
+        self._client = client
+        self._state = state
+        self._version = version
+        self._ops: list[dict[str, Any]] = []
+        self._names = count()
+
+    @property
+    def state(self) -> OvsdbState:
+        """Return the local view of the database.
+
+        :return: database snapshot including queued changes
+        :rtype: OvsdbState
+        """
+        return self._state
+
+    def _named(self, prefix: str) -> str:
+        return f"{prefix}{next(self._names)}"
+
+    def bridge_exists(self, bridge: str) -> bool:
+        """Check if a bridge exists.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :return: True if the bridge exists
+        :rtype: bool
+        """
+        return bridge in self._state.bridges
+
+    def port(self, port: str) -> PortRow | None:
+        """Return the port row for a port name.
+
+        :param port: port name
+        :type port: str
+        :return: port row or None if the port does not exist
+        :rtype: PortRow | None
+        """
+        return self._state.ports.get(port)
+
+    def port_to_br(self, port: str) -> str:
+        """Return the bridge a port is attached to.
+
+        :param port: port name
+        :type port: str
+        :return: bridge name, empty if the port does not exist
+        :rtype: str
+        """
+        row = self._state.ports.get(port)
+        return row.bridge if row else ""
+
+    def container_port(self, container: str, iface: str) -> str | None:
+        """Return the port of a container interface, like ovs-docker get-port.
+
+        :param container: container name
+        :type container: str
+        :param iface: interface name inside the container
+        :type iface: str
+        :return: port name or None if the interface is not attached
+        :rtype: str | None
+        """
+        for name, row in self._state.interfaces.items():
+            ids = row.external_ids
+            if ids.get("container_id") == container and (
+                ids.get("container_iface") == iface
+            ):
+                return name
+        return None
+
+    def add_bridge(self, bridge: str) -> None:
+        """Queue creation of a bridge with its internal port.
+
+        :param bridge: bridge name
+        :type bridge: str
+        """
+        if self.bridge_exists(bridge):
+            return
+        iface, port, br = (self._named(p) for p in ("iface", "port", "br"))
+        self._ops += [
+            {
+                "op": "insert",
+                "table": "Interface",
+                "row": {"name": bridge, "type": "internal"},
+                "uuid-name": iface,
+            },
+            {
+                "op": "insert",
+                "table": "Port",
+                "row": {"name": bridge, "interfaces": ["named-uuid", iface]},
+                "uuid-name": port,
+            },
+            {
+                "op": "insert",
+                "table": "Bridge",
+                "row": {"name": bridge, "ports": ["named-uuid", port]},
+                "uuid-name": br,
+            },
+            {
+                "op": "mutate",
+                "table": "Open_vSwitch",
+                "where": [],
+                "mutations": [["bridges", "insert", ["named-uuid", br]]],
+            },
+        ]
+        self._state.bridges[bridge] = br
+        self._state.ports[bridge] = PortRow(uuid=port, bridge=bridge)
+        self._state.interfaces[bridge] = InterfaceRow(uuid=iface, port=bridge)
+
+    def add_port(
+        self,
+        bridge: str,
+        port: str,
+        external_ids: dict[str, str] | None = None,
+        tag: int | None = None,
+        trunks: list[int] | None = None,
+    ) -> None:
+        """Queue addition of a system port to a bridge.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param port: port (and interface) name
+        :type port: str
+        :param external_ids: optional external_ids for the interface
+        :type external_ids: dict[str, str] | None
+        :param tag: optional access VLAN of the port
+        :type tag: int | None
+        :param trunks: optional trunk VLANs of the port
+        :type trunks: list[int] | None
+        """
+        if self.port_to_br(port) == bridge:
+            return
+        self.del_port(port)
+        iface, row = self._named("iface"), self._named("port")
+        ids = external_ids or {}
+        port_row: dict[str, Any] = {"name": port, "interfaces": ["named-uuid", iface]}
+        if tag is not None:
+            port_row["tag"] = tag
+        if trunks:
+            port_row["trunks"] = ["set", sorted(trunks)]
+        self._ops += [
+            {
+                "op": "insert",
+                "table": "Interface",
+                "row": {"name": port, "external_ids": ["map", list(ids.items())]},
+                "uuid-name": iface,
+            },
+            {
+                "op": "insert",
+                "table": "Port",
+                "row": port_row,
+                "uuid-name": row,
+            },
+            {
+                "op": "mutate",
+                "table": "Bridge",
+                "where": [["name", "==", bridge]],
+                "mutations": [["ports", "insert", ["named-uuid", row]]],
+            },
+        ]
+        self._state.ports[port] = PortRow(
+            uuid=row, bridge=bridge, tag=tag, trunks=vlan_ranges(trunks or [])
+        )
+        self._state.interfaces[port] = InterfaceRow(
+            uuid=iface, port=port, external_ids=dict(ids)
+        )
+
+    def del_port(self, port: str) -> None:
+        """Queue removal of a port from its bridge, if it exists.
+
+        :param port: port name
+        :type port: str
+        """
+        if (row := self._state.ports.pop(port, None)) is None:
+            return
+        uuid = ["uuid", row.uuid] if "-" in row.uuid else ["named-uuid", row.uuid]
+        self._ops.append(
+            {
+                "op": "mutate",
+                "table": "Bridge",
+                "where": [["name", "==", row.bridge]],
+                "mutations": [["ports", "delete", ["set", [uuid]]]],
+            }
+        )
+        self._state.interfaces = {
+            name: iface
+            for name, iface in self._state.interfaces.items()
+            if iface.port != port
+        }
+
+    def del_bridge(self, bridge: str) -> None:
+        """Queue removal of a bridge and all of its ports, if it exists.
+
+        :param bridge: bridge name
+        :type bridge: str
+        """
+        if (uuid := self._state.bridges.pop(bridge, None)) is None:
+            return
+        ref = ["uuid", uuid] if "-" in uuid else ["named-uuid", uuid]
+        # Unreferenced Port and Interface rows are garbage collected.
+        self._ops.append(
+            {
+                "op": "mutate",
+                "table": "Open_vSwitch",
+                "where": [],
+                "mutations": [["bridges", "delete", ["set", [ref]]]],
+            }
+        )
+        ports = {
+            name for name, row in self._state.ports.items() if row.bridge == bridge
+        }
+        self._state.ports = {
+            name: row for name, row in self._state.ports.items() if name not in ports
+        }
+        self._state.interfaces = {
+            name: iface
+            for name, iface in self._state.interfaces.items()
+            if iface.port not in ports
+        }
+
+    def set_port(self, port: str, **columns: Any) -> None:  # noqa: ANN401
+        """Queue an update of port columns.
+
+        Columns passed as None are cleared, lists are written as sets.
+
+        :param port: port name
+        :type port: str
+        :param columns: column values, e.g. ``vlan_mode="access", tag=100``
+        :type columns: Any
+        """
+        row: dict[str, Any] = {}
+        for column, value in columns.items():
+            if value is None:
+                row[column] = ["set", []]
+            elif isinstance(value, list):
+                row[column] = ["set", sorted(value)]
+            else:
+                row[column] = value
+        self._ops.append(
+            {
+                "op": "update",
+                "table": "Port",
+                "where": [["name", "==", port]],
+                "row": row,
+            }
+        )
+        if port_row := self._state.ports.get(port):
+            if "trunks" in columns:
+                columns["trunks"] = vlan_ranges(columns["trunks"] or [])
+            self._state.ports[port] = replace(port_row, **columns)
+
+    def commit(self, wait: bool = False) -> None:
+        """Send all queued operations as a single transaction.
+
+        :param wait: wait for ovs-vswitchd to apply the change, defaults to False
+        :type wait: bool
+        """
+        if not self._ops:
+            return
+        ops, self._ops = self._ops, []
+        if wait:
+            ops.append(
+                {
+                    "op": "mutate",
+                    "table": "Open_vSwitch",
+                    "where": [],
+                    "mutations": [["next_cfg", "+=", 1]],
+                }
+            )
+            ops.append(
+                {
+                    "op": "select",
+                    "table": "Open_vSwitch",
+                    "where": [],
+                    "columns": ["next_cfg"],
+                }
+            )
+        try:
+            result = self._client.transact(*ops)
+        except Exception:
+            self._client.invalidate()
+            raise
+        _LOGGER.debug("Committed %s OVSDB operations", len(ops))
+        # Named UUIDs are only valid inside their transaction.
+        self._resolve_uuids(
+            {
+                op["uuid-name"]: _as_atom(res["uuid"])
+                for op, res in zip(ops, result, strict=False)
+                if op["op"] == "insert"
+            }
+        )
+        self._client.committed(self._version, self._state)
+        self._version = self._client.version
+        if wait:
+            self._client.wait_for_cfg(result[-1]["rows"][0]["next_cfg"])
+
+    def _resolve_uuids(self, uuids: dict[str, str]) -> None:
+        """Replace the named UUIDs of inserted rows with their real UUIDs.
+
+        :param uuids: real UUID per UUID name
+        :type uuids: dict[str, str]
+        """
+        state = self._state
+        for name, uuid in state.bridges.items():
+            if uuid in uuids:
+                state.bridges[name] = uuids[uuid]
+        for name, row in state.ports.items():
+            if row.uuid in uuids:
+                state.ports[name] = replace(row, uuid=uuids[row.uuid])
+        for name, iface in state.interfaces.items():
+            if iface.uuid in uuids:
+                state.interfaces[name] = replace(iface, uuid=uuids[iface.uuid])
+
+
+class OvsdbClient:
+    """Minimal synchronous OVSDB JSON-RPC client with a persistent connection."""
+
+    def __init__(self, remote: str = OVSDB_REMOTE, timeout: float = 10.0) -> None:
+        """Initialise the client, the connection is opened on first use.
+
+        :param remote: ``unix:<path>`` or ``tcp:<host>:<port>``
+        :type remote: str
+        :param timeout: socket and reconfiguration timeout in seconds
+        :type timeout: float
+        """
+        self._remote = remote
+        self._timeout = timeout
+        self._sock: socket.socket | None = None
+        self._buffer = ""
+        self._decoder = json.JSONDecoder()
+        self._ids = count()
+        self._lock = threading.RLock()
+        # Guards the known state only, never held across socket I/O
+        self._state_lock = threading.Lock()
+        # The open batch is bound to the running task (or thread), so
+        # concurrent coroutines never join each other's transaction.
+        self._txn: ContextVar[OvsdbTransaction | None] = ContextVar(
+            "ovsdb_txn", default=None
+        )
+        # Last known database state, bumping the version on every change
+        self._state: OvsdbState | None = None
+        self.version = 0
+
+    def _connect(self) -> socket.socket:
+        kind, _, address = self._remote.partition(":")
+        if kind == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self._timeout)
+            sock.connect(address)
+        elif kind == "tcp":
+            host, _, port = address.rpartition(":")
+            sock = socket.create_connection((host, int(port)), self._timeout)
+        else:
+            msg = f"Unsupported OVSDB remote: {self._remote}"
+            raise OvsdbError(msg)
+        _LOGGER.debug("Connected to ovsdb-server at %s", self._remote)
+        self._buffer = ""
+        return sock
+
+    def close(self) -> None:
+        """Close the connection to ovsdb-server."""
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+
+    def _send(self, message: dict[str, Any]) -> None:
+        if self._sock is None:
+            self._sock = self._connect()
+        self._sock.sendall(json.dumps(message).encode())
+
+    def _peer_closed(self) -> bool:
+        """Check whether ovsdb-server closed the idle connection, e.g. on restart.
+
+        :return: True if the connection is closed or broken
+        :rtype: bool
+        """
+        if self._sock is None:
+            return False
+        try:
+            return not self._sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def _receive(self) -> dict[str, Any]:
+        while True:
+            text = self._buffer.lstrip()
+            if text:
+                try:
+                    message, end = self._decoder.raw_decode(text)
+                except json.JSONDecodeError:
+                    pass
+                else:
+                    self._buffer = text[end:]
+                    return message
+            chunk = self._sock.recv(65536) if self._sock else b""
+            if not chunk:
+                msg = "Connection to ovsdb-server closed"
+                raise ConnectionError(msg)
+            self._buffer += chunk.decode()
+
+    def _call(self, method: str, params: list[Any]) -> Any:  # noqa: ANN401
+        request_id = next(self._ids)
+        if self._peer_closed():
+            self.close()
+        try:
+            self._send({"method": method, "params": params, "id": request_id})
+        except OSError as exc:
+            raise _NotSentError(str(exc)) from exc
+        while True:
+            message = self._receive()
+            if message.get("method") == "echo":
+                self._send({"result": message["params"], "id": message["id"]})
+                continue
+            if message.get("id") != request_id:
+                continue
+            if message.get("error"):
+                raise OvsdbError(message["error"])
+            return message["result"]
+
+    def request(self, method: str, params: list[Any]) -> Any:  # noqa: ANN401
+        """Send a JSON-RPC request and return its result.
+
+        A request that could not be sent is retried once on a new
+        connection. Once sent, it is never retried: a transaction the server
+        already applied must not run twice.
+
+        :param method: JSON-RPC method
+        :type method: str
+        :param params: JSON-RPC params
+        :type params: list[Any]
+        :return: JSON-RPC result
+        :rtype: Any
+        """
+        start = time.perf_counter()
+        failed = True
+        with self._lock:
+            try:
+                try:
+                    result = self._call(method, params)
+                except _NotSentError:
+                    _LOGGER.debug("Reconnecting to ovsdb-server at %s", self._remote)
+                    self.close()
+                    result = self._call(method, params)
+            except OSError:
+                # The reply may still arrive, start the next request afresh
+                self.close()
+                raise
+            else:
+                failed = False
+                return result
+            finally:
+                record_request("ovsdb", method, start, failed)
+
+    def transact(self, *operations: dict[str, Any]) -> list[dict[str, Any]]:
+        """Run OVSDB operations as one transaction.
+
+        :param operations: OVSDB operations
+        :type operations: dict[str, Any]
+        :return: per-operation results
+        :rtype: list[dict[str, Any]]
+        :raises OvsdbError: if any operation fails
+        """
+        result = self.request("transact", [_DB_NAME, *operations])
+        if errors := [r for r in result if r and "error" in r]:
+            msg = f"OVSDB transaction failed: {errors}"
+            raise OvsdbError(msg)
+        return result
+
+    def dump(self) -> OvsdbState:
+        """Read bridges, ports and interfaces in one round trip.
+
+        :return: database snapshot
+        :rtype: OvsdbState
+        """
+        # Taken first, a batch committing while the dump runs may be missing
+        version = self.version
+        bridges, ports, ifaces = self.transact(
+            {
+                "op": "select",
+                "table": "Bridge",
+                "where": [],
+                "columns": ["_uuid", "name", "ports"],
+            },
+            {
+                "op": "select",
+                "table": "Port",
+                "where": [],
+                "columns": [
+                    "_uuid",
+                    "name",
+                    "tag",
+                    "trunks",
+                    "vlan_mode",
+                    "interfaces",
+                ],
+            },
+            {
+                "op": "select",
+                "table": "Interface",
+                "where": [],
+                "columns": ["_uuid", "name", "external_ids"],
+            },
+        )
+        state = OvsdbState()
+        port_bridge = {
+            port: row["name"]
+            for row in bridges["rows"]
+            for port in _as_set(row["ports"])
+        }
+        iface_port: dict[str, str] = {}
+        for row in bridges["rows"]:
+            state.bridges[row["name"]] = _as_atom(row["_uuid"])
+        for row in ports["rows"]:
+            uuid = _as_atom(row["_uuid"])
+            tag = _as_set(row["tag"])
+            mode = _as_set(row["vlan_mode"])
+            state.ports[row["name"]] = PortRow(
+                uuid=uuid,
+                bridge=port_bridge.get(uuid, ""),
+                tag=tag[0] if tag else None,
+                trunks=vlan_ranges(_as_set(row["trunks"])),
+                vlan_mode=mode[0] if mode else None,
+            )
+            iface_port.update(dict.fromkeys(_as_set(row["interfaces"]), row["name"]))
+        for row in ifaces["rows"]:
+            uuid = _as_atom(row["_uuid"])
+            state.interfaces[row["name"]] = InterfaceRow(
+                uuid=uuid,
+                port=iface_port.get(uuid, ""),
+                external_ids=_as_map(row["external_ids"]),
+            )
+        with self._state_lock:
+            # A batch committed meanwhile is newer than the dump
+            if version == self.version:
+                self._state = state
+                self.version += 1
+        return state.copy()
+
+    def invalidate(self) -> None:
+        """Forget the known database state, the next batch dumps it again.
+
+        Call this after OVSDB was changed behind the client, e.g. by
+        ovs-vsctl or ovs-docker.
+        """
+        with self._state_lock:
+            self._state = None
+            self.version += 1
+
+    def committed(self, version: int, state: OvsdbState) -> None:
+        """Take the state of a committed batch as the known database state.
+
+        :param version: version of the state the batch started from
+        :type version: int
+        :param state: state of the batch, including its committed changes
+        :type state: OvsdbState
+        """
+        with self._state_lock:
+            # Another batch committed meanwhile, the state misses its changes
+            self._state = state.copy() if version == self.version else None
+            self.version += 1
+
+    def wait_for_cfg(self, next_cfg: int) -> None:
+        """Wait until ovs-vswitchd has applied configuration ``next_cfg``.
+
+        :param next_cfg: configuration sequence number to wait for
+        :type next_cfg: int
+        :raises OvsdbError: if ovs-vswitchd does not catch up in time
+        """
+        deadline = time.monotonic() + self._timeout
+        while time.monotonic() < deadline:
+            (result,) = self.transact(
+                {
+                    "op": "select",
+                    "table": "Open_vSwitch",
+                    "where": [],
+                    "columns": ["cur_cfg"],
+                }
+            )
+            if result["rows"][0]["cur_cfg"] >= next_cfg:
+                return
+            time.sleep(0.01)
+        msg = f"ovs-vswitchd did not apply configuration {next_cfg} in time"
+        raise OvsdbError(msg)
+
+    def _begin(self) -> OvsdbTransaction:
+        """Start a transaction on the known state, dumping it if unknown.
+
+        :return: new transaction, not active yet
+        :rtype: OvsdbTransaction
+        """
+        with self._state_lock:
+            state, version = self._state, self.version
+        if state is None:
+            dumped = self.dump()
+            with self._state_lock:
+                state, version = self._state, self.version
+            if state is None:
+                # Changed while dumping, commit must not store the state
+                state, version = dumped, -1
+        return OvsdbTransaction(self, state.copy(), version)
+
+    @contextmanager
+    def batch(self) -> Iterator[OvsdbTransaction]:
+        """Collect OVSDB changes and commit them as one transaction.
+
+        Nested calls from the same task or thread join the outermost batch,
+        which is committed when it exits cleanly and discarded on error.
+
+        :yield: the active transaction
+        """
+        if (txn := self._txn.get()) is not None:
+            yield txn
+            return
+        txn = self._begin()
+        token = self._txn.set(txn)
+        try:
+            yield txn
+            txn.commit()
+        finally:
+            self._txn.reset(token)
+
+    @asynccontextmanager
+    async def async_batch(self) -> AsyncIterator[OvsdbTransaction]:
+        """Collect OVSDB changes from a coroutine, like batch().
+
+        Dumping and committing run in the worker pool, so waiting for
+        ovsdb-server never stalls the event loop.
+
+        :yield: the active transaction
+        """
+        if (txn := self._txn.get()) is not None:
+            yield txn
+            return
+        txn = await run_blocking(self._begin)
+        token = self._txn.set(txn)
+        try:
+            yield txn
+        finally:
+            self._txn.reset(token)
+        await run_blocking(txn.commit)
+
+
+@cache
+def get_ovsdb() -> OvsdbClient:
+    """Return the shared OVSDB client.
+
+    :return: OVSDB client connected to ``OVSDB_REMOTE``, or to the simulated
+             host if SIMULATED_HOST is set
+    :rtype: OvsdbClient
+    """
+    if SIMULATED_HOST:
+        # app.sim builds on this module, import it on demand
+        from app.sim import SimOvsdbClient, get_sim_host  # noqa: PLC0415
+
+        return SimOvsdbClient(get_sim_host())
+    return OvsdbClient()
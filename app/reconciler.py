@@ -0,0 +1,551 @@
+"""Snapshot-and-diff reconciliation helpers.
+
+This part takes one bulk snapshot of the host per cycle (OVS database,
+links and addresses, containers) and compares it with the desired state
+from the config. Only objects that drifted need to be handed to the
+orchestrator functions which probe and fix the host.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from app.docker_api import get_docker
+from app.model import DesiredState, lxbr_port_name
+from app.netlink import get_netlink
+from app.store import BRIDGE_PORT, get_store
+from app.utils import ContainerInfoDict, get_logger, get_usb_interface
+
+if TYPE_CHECKING:
+    from app.docker_api import ContainerInfo
+    from app.model import (
+        BridgeSpec,
+        ContainerIfaceSpec,
+        ParentSpec,
+        PortVlans,
+        VethPairSpec,
+    )
+    from app.netlink import NetlinkState
+    from app.ovsdb import OvsdbState
+
+_LOGGER = get_logger("reconciler")
+
+
+@dataclass(slots=True)
+class HostSnapshot:
+    """Host state collected once per reconcile cycle."""
+
+    links: NetlinkState
+    containers: dict[str, ContainerInfo]
+    ovs: OvsdbState | None = None
+    # (container_id, container_iface) -> OVS interface name
+    container_ports: dict[tuple[str, str], str] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class Drift:
+    """Objects whose host state differs from the desired state."""
+
+    bridges: list[str] = field(default_factory=list)
+    # container name, interface details
+    missing_ifaces: list[tuple[str, ContainerInfoDict]] = field(default_factory=list)
+    vlan_ifaces: list[tuple[str, ContainerInfoDict]] = field(default_factory=list)
+    veth_pairs: list[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        """Return the number of drifted objects.
+
+        :return: drifted object count
+        :rtype: int
+        """
+        return (
+            len(self.bridges)
+            + len(self.missing_ifaces)
+            + len(self.vlan_ifaces)
+            + len(self.veth_pairs)
+        )
+
+
+def take_snapshot(ovs: OvsdbState | None = None) -> HostSnapshot:
+    """Collect the host state with one bulk query per backend.
+
+    :param ovs: OVS database snapshot to reuse, e.g. from an open batch
+    :type ovs: OvsdbState | None
+    :return: host snapshot
+    :rtype: HostSnapshot
+    """
+    snapshot = HostSnapshot(
+        links=get_netlink().dump(),
+        containers=get_docker().refresh(),
+        ovs=ovs,
+    )
+    if ovs is not None:
+        for name, iface in ovs.interfaces.items():
+            ids = iface.external_ids
+            if "container_id" in ids and "container_iface" in ids:
+                key = (ids["container_id"], ids["container_iface"])
+                snapshot.container_ports[key] = name
+    return snapshot
+
+
+def port_in_sync(bridge: str, port: str, vlans: PortVlans, snap: HostSnapshot) -> bool:
+    """Check if a port is attached to a bridge with the expected VLANs.
+
+    :param bridge: bridge name
+    :type bridge: str
+    :param port: port name
+    :type port: str
+    :param vlans: expected VLANs
+    :type vlans: PortVlans
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: True if no change is needed
+    :rtype: bool
+    """
+    if (link := snap.links.links.get(port)) is None or not link.up:
+        return False
+
+    if snap.ovs is None:
+        master = snap.links.links.get(bridge)
+        return master is not None and link.master == master.index
+
+    row = snap.ovs.ports.get(port)
+    if row is None or row.bridge != bridge:
+        return False
+    return row.tag == vlans.tag and row.trunks == vlans.trunks
+
+
+def parent_port(parent: ParentSpec) -> str:
+    """Return the port name of a bridge parent.
+
+    :param parent: parent interface
+    :type parent: ParentSpec
+    :return: interface name, resolved for "usb:<port>" parents
+    :rtype: str
+    :raises ValueError: if a USB parent is not plugged in
+    """
+    if "usb:" in parent.iface:
+        return get_usb_interface(parent.iface.split(":")[-1])
+    return parent.iface
+
+
+def _bridge_address_in_sync(spec: BridgeSpec, snap: HostSnapshot) -> bool:
+    store = get_store()
+    addresses = snap.links.addresses_of(spec.name)
+    for prefix, version in (("ip", 4), ("ip6", 6)):
+        if spec.ranges[prefix] != store.get_range(spec.name, prefix):
+            return False
+        if ip_addr := spec.addresses[prefix]:
+            if (
+                store.lease(spec.name, prefix, spec.name) != ip_addr
+                or ip_addr not in addresses
+            ):
+                return False
+            continue
+        # No address requested, any global address of the family is drift.
+        for address in addresses:
+            iface = ipaddress.ip_interface(address)
+            if iface.version == version and not iface.is_link_local:
+                return False
+    return True
+
+
+def bridge_in_sync(spec: BridgeSpec, snap: HostSnapshot) -> bool:  # noqa: PLR0911
+    """Check if a bridge, its addresses and its parents match the config.
+
+    :param spec: compiled bridge entry
+    :type spec: BridgeSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: True if no change is needed
+    :rtype: bool
+    """
+    link = snap.links.links.get(spec.name)
+    if link is None or not link.up:
+        return False
+    if snap.ovs is not None and spec.name not in snap.ovs.bridges:
+        return False
+    if not _bridge_address_in_sync(spec, snap):
+        return False
+
+    for parent in spec.parents:
+        try:
+            port = parent_port(parent)
+        except ValueError:
+            return False
+        iface_cache = get_store().iface(spec.name, BRIDGE_PORT, port) or {}
+        if any(iface_cache.get(key) != value for key, value in parent.settings.items()):
+            return False
+        if not port_in_sync(spec.name, port, parent.vlans, snap):
+            return False
+    return True
+
+
+def container_port_attached(
+    container: str, info: ContainerInfoDict, snap: HostSnapshot
+) -> bool:
+    """Check if a container interface is attached to its bridge.
+
+    :param container: container name
+    :type container: str
+    :param info: container interface details from the config
+    :type info: ContainerInfoDict
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: True if the host side veth is a port of the bridge
+    :rtype: bool
+    """
+    bridge, iface = info["bridge"], info["iface"]
+    if snap.ovs is None:
+        master = snap.links.links.get(bridge)
+        link = snap.links.links.get(lxbr_port_name(container, iface))
+        return master is not None and link is not None and link.master == master.index
+
+    port = snap.container_ports.get((container, iface), "")
+    row = snap.ovs.ports.get(port)
+    return row is not None and row.bridge == bridge and port in snap.links.links
+
+
+def container_stale_port(container: str, iface: str, snap: HostSnapshot) -> str:
+    """Return the host side veth left by an earlier attach of an interface.
+
+    Call this for an interface container_port_attached() found detached.
+
+    :param container: container name
+    :type container: str
+    :param iface: interface name inside the container
+    :type iface: str
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: OVS port or host link to remove before attaching, empty if none
+    :rtype: str
+    """
+    if snap.ovs is None:
+        port = lxbr_port_name(container, iface)
+        return port if port in snap.links.links else ""
+    return snap.container_ports.get((container, iface), "")
+
+
+def container_iface_state(  # noqa: PLR0911
+    spec: ContainerIfaceSpec, snap: HostSnapshot
+) -> str:
+    """Compare a container interface with the host.
+
+    :param spec: compiled container interface entry
+    :type spec: ContainerIfaceSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: "ok", "skip" if the container is not running, "missing" if the
+             interface must be attached, or "vlan" if only VLANs drifted
+    :rtype: str
+    """
+    if (cc := snap.containers.get(spec.container)) is None or not cc.running:
+        return "skip"
+
+    if get_store().iface(spec.bridge, spec.container, spec.iface) is None:
+        return "missing"
+    if not container_port_attached(spec.container, spec.info, snap):
+        return "missing"
+    if snap.ovs is None:
+        return "ok"
+
+    row = snap.ovs.ports[snap.container_ports[spec.container, spec.iface]]
+    if spec.vlan is not None and row.tag != spec.vlan:
+        return "vlan"
+    if spec.trunks is not None and row.trunks != spec.trunks:
+        return "vlan"
+    return "ok"
+
+
+def veth_pair_in_sync(spec: VethPairSpec, snap: HostSnapshot) -> bool:
+    """Check if a veth pair exists and is attached as configured.
+
+    :param spec: compiled veth pair entry
+    :type spec: VethPairSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: True if no change is needed
+    :rtype: bool
+    """
+    store = get_store()
+    for end in spec.ends:
+        if end.name not in snap.links.links:
+            return False
+        if end.vlans is None:
+            continue
+        if (
+            end.vlan
+            and (store.iface(spec.bridge, BRIDGE_PORT, end.name) or {}).get(spec.key)
+            != end.vlan
+        ):
+            return False
+        if not port_in_sync(spec.bridge, end.name, end.vlans, snap):
+            return False
+    return True
+
+
+def _link_state(snap: HostSnapshot, name: str) -> tuple | None:
+    if (link := snap.links.links.get(name)) is None:
+        return None
+    return link.index, link.flags, link.master
+
+
+def _ports_state(snap: HostSnapshot, ports: list[str]) -> tuple:
+    """Return what the host reports about some ports, as a hashable value.
+
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :param ports: port names
+    :type ports: list[str]
+    :return: link and OVS port state of every port
+    :rtype: tuple
+    """
+    state = []
+    for port in ports:
+        row = None if snap.ovs is None else snap.ovs.ports.get(port)
+        if row is not None:
+            state.append((_link_state(snap, port), row.bridge, row.tag, *row.trunks))
+        else:
+            state.append((_link_state(snap, port), None))
+    return tuple(state)
+
+
+def bridge_fingerprint(spec: BridgeSpec, snap: HostSnapshot) -> int | None:
+    """Fingerprint the host state a bridge entry is checked against.
+
+    :param spec: compiled bridge entry
+    :type spec: BridgeSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: host fingerprint, None if it cannot be taken
+    :rtype: int | None
+    """
+    try:
+        parents = [parent_port(parent) for parent in spec.parents]
+    except ValueError:
+        return None
+    return hash(
+        (
+            _link_state(snap, spec.name),
+            snap.ovs is not None and spec.name in snap.ovs.bridges,
+            *snap.links.addresses_of(spec.name),
+            _ports_state(snap, parents),
+        )
+    )
+
+
+def container_iface_fingerprint(
+    spec: ContainerIfaceSpec, snap: HostSnapshot
+) -> int | None:
+    """Fingerprint the host state a container interface entry is checked against.
+
+    :param spec: compiled container interface entry
+    :type spec: ContainerIfaceSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: host fingerprint, None if the container is not running
+    :rtype: int | None
+    """
+    if (cc := snap.containers.get(spec.container)) is None or not cc.running:
+        return None
+    if snap.ovs is None:
+        port = spec.lxbr_port
+    else:
+        port = snap.container_ports.get((spec.container, spec.iface), "")
+    return hash(
+        (
+            cc.id,
+            cc.pid,
+            _link_state(snap, spec.bridge),
+            port,
+            _ports_state(snap, [port]),
+        )
+    )
+
+
+def veth_pair_fingerprint(spec: VethPairSpec, snap: HostSnapshot) -> int:
+    """Fingerprint the host state a veth pair entry is checked against.
+
+    :param spec: compiled veth pair entry
+    :type spec: VethPairSpec
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: host fingerprint
+    :rtype: int
+    """
+    return hash(
+        (
+            _link_state(snap, spec.bridge),
+            _ports_state(snap, [end.name for end in spec.ends]),
+        )
+    )
+
+
+def _bridge_drift(state: DesiredState, snap: HostSnapshot, drift: Drift) -> int:
+    skipped = 0
+    for spec in state.bridges.values():
+        host = bridge_fingerprint(spec, snap)
+        if host is not None and host == spec.observed:
+            skipped += 1
+            continue
+        in_sync = bridge_in_sync(spec, snap)
+        spec.observed = host if in_sync else None
+        if not in_sync:
+            drift.bridges.append(spec.name)
+    return skipped
+
+
+def _container_iface_drift(
+    state: DesiredState, snap: HostSnapshot, drift: Drift
+) -> int:
+    skipped = 0
+    for spec in state.container_ifaces:
+        host = container_iface_fingerprint(spec, snap)
+        if host is not None and host == spec.observed:
+            skipped += 1
+            continue
+        iface_state = container_iface_state(spec, snap)
+        spec.observed = host if iface_state == "ok" else None
+        if iface_state == "missing":
+            drift.missing_ifaces.append((spec.container, spec.info))
+        elif iface_state == "vlan":
+            drift.vlan_ifaces.append((spec.container, spec.info))
+    return skipped
+
+
+def _veth_pair_drift(state: DesiredState, snap: HostSnapshot, drift: Drift) -> int:
+    skipped = 0
+    for spec in state.veth_pairs.values():
+        host = veth_pair_fingerprint(spec, snap)
+        if host == spec.observed:
+            skipped += 1
+            continue
+        in_sync = veth_pair_in_sync(spec, snap)
+        spec.observed = host if in_sync else None
+        if not in_sync:
+            drift.veth_pairs.append(spec.prefix)
+    return skipped
+
+
+def find_drift(state: DesiredState, snap: HostSnapshot) -> Drift:
+    """Diff the desired state against a host snapshot.
+
+    An object found in sync records the host fingerprint it was checked
+    against. While neither its config entry nor that fingerprint change,
+    later cycles skip the checks and their state store lookups.
+
+    :param state: compiled desired state
+    :type state: DesiredState
+    :param snap: host snapshot
+    :type snap: HostSnapshot
+    :return: drifted objects
+    :rtype: Drift
+    """
+    drift = Drift()
+    skipped = _bridge_drift(state, snap, drift)
+    skipped += _container_iface_drift(state, snap, drift)
+    skipped += _veth_pair_drift(state, snap, drift)
+    _LOGGER.debug(
+        "Drift: bridges=%s missing=%s vlan=%s veth=%s unchanged=%d",
+        drift.bridges,
+        [f"{c}:{i['iface']}" for c, i in drift.missing_ifaces],
+        [f"{c}:{i['iface']}" for c, i in drift.vlan_ifaces],
+        drift.veth_pairs,
+        skipped,
+    )
+    return drift
+
+
+@dataclass(slots=True)
+class WorkSet:
+    """Objects named by host events that need to be reconciled."""
+
+    containers: set[str] = field(default_factory=set)
+    links: set[str] = field(default_factory=set)
+    bridges: set[str] = field(default_factory=set)
+    veth_pairs: set[str] = field(default_factory=set)
+    full: bool = False
+
+    def add(self, kind: str, name: str) -> None:
+        """Record an event.
+
+        :param kind: "container", "link", "bridge" or "veth" for a config
+                     change, or "sweep" for a full reconcile
+        :type kind: str
+        :param name: container, link, bridge or veth pair name
+        :type name: str
+        """
+        if kind == "container":
+            self.containers.add(name)
+        elif kind == "link":
+            self.links.add(name)
+        elif kind == "bridge":
+            self.bridges.add(name)
+        elif kind == "veth":
+            self.veth_pairs.add(name)
+        else:
+            self.full = True
+
+
+def config_changes(old: dict[str, Any], new: dict[str, Any]) -> list[tuple[str, str]]:
+    """Return an event for every config entry that was added or changed.
+
+    :param old: previous desired state
+    :type old: dict[str, Any]
+    :param new: new desired state
+    :type new: dict[str, Any]
+    :return: ("bridge" | "container" | "veth", name) events
+    :rtype: list[tuple[str, str]]
+    """
+    changes = []
+    for section, kind in (
+        ("bridge", "bridge"),
+        ("container", "container"),
+        ("veth_pairs", "veth"),
+    ):
+        before, after = old.get(section, {}), new.get(section, {})
+        changes += [
+            (kind, name) for name in sorted(after) if before.get(name) != after[name]
+        ]
+    return changes
+
+
+def scope_state(state: DesiredState, work: WorkSet) -> DesiredState:
+    """Reduce the desired state to the objects affected by a work set.
+
+    A bridge is affected if the bridge, its config or one of its parents
+    changed. Container interfaces and veth pairs on an affected bridge are
+    included, since they are lost together with the bridge.
+
+    :param state: compiled desired state
+    :type state: DesiredState
+    :param work: events collected since the last cycle
+    :type work: WorkSet
+    :return: desired state holding only the affected objects
+    :rtype: DesiredState
+    """
+    if work.full:
+        return state
+
+    bridges = {
+        bridge: spec
+        for bridge, spec in state.bridges.items()
+        if bridge in work.links
+        or bridge in work.bridges
+        or any(parent.iface in work.links for parent in spec.parents)
+    }
+    veth_pairs = {
+        prefix: spec
+        for prefix, spec in state.veth_pairs.items()
+        if spec.bridge in bridges
+        or prefix in work.veth_pairs
+        or any(end.name in work.links for end in spec.ends)
+    }
+    container_ifaces = [
+        spec
+        for spec in state.container_ifaces
+        if spec.container in work.containers or spec.bridge in bridges
+    ]
+    return DesiredState(bridges, container_ifaces, veth_pairs)
@@ -6,7 +6,12 @@ from fastapi import APIRouter, Body, HTTPException
 
 from app.orchestrator import init_bridge
 from app.schemas import BridgeInfo
-from app.utils import EVENT_LOCK, BridgeInfoDict, get_config, validate_bridge
+from app.store import validate_bridge
+from app.utils import (
+    BRIDGE_LOCKS,
+    BridgeInfoDict,
+    add_bridge_config,
+)
 
 router = APIRouter()
 
@@ -37,17 +42,11 @@ async def init_bridge_api(
 
     # Init Bridge logic
     try:
-        async with EVENT_LOCK:
-            init_bridge(bridge_name, payload)
+        async with BRIDGE_LOCKS(bridge_name):
+            await init_bridge(bridge_name, payload)
 
             # Update runner config only if bridge is added
-            config = get_config()
-            bridge_config = config["bridge"].setdefault(bridge_name, {})
-            for key, value in payload.items():
-                if key in bridge_config and isinstance(value, list):
-                    bridge_config.setdefault(key, []).extend(value)
-                    continue
-                bridge_config[key] = value
+            add_bridge_config(bridge_name, payload)
     except ValueError as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
@@ -0,0 +1,287 @@
+"""API router to add bridges, container interfaces and veth pairs in bulk.
+
+Every item is validated before anything is applied. The locks of all
+bridges and containers in the request are then taken once, and the items
+are applied concurrently against a single host snapshot. The response
+holds a status per item instead of failing the whole request.
+"""
+
+import asyncio
+from collections.abc import Callable, Hashable, Sequence
+from typing import TypeVar, cast
+
+from fastapi import APIRouter
+
+from app.orchestrator import (
+    add_iface_to_container,
+    create_veth_pair,
+    init_bridge,
+    snapshot_host,
+)
+from app.schemas import (
+    BridgeEntry,
+    ContainerIfaceEntry,
+    TopologyBatch,
+    VethPairEntry,
+)
+from app.store import validate_bridge, validate_container, validate_veth_pair
+from app.utils import (
+    BridgeInfoDict,
+    ContainerInfoDict,
+    add_bridge_config,
+    add_container_config,
+    add_veth_pair_config,
+    hold_locks,
+    run_item,
+)
+
+router = APIRouter()
+
+# Per item results of a section, in request order
+Results = list[dict[str, str]]
+E = TypeVar("E", BridgeEntry, ContainerIfaceEntry, VethPairEntry)
+
+
+def _status(key: str, name: str, error: str | None) -> dict[str, str]:
+    if error is None:
+        return {"status": "success", key: name}
+    return {"status": "failed", key: name, "detail": error}
+
+
+def _validate_section(
+    entries: Sequence[E],
+    key: Callable[[E], Hashable],
+    check: Callable[[E], bool],
+    invalid: str,
+) -> list[str | None]:
+    """Validate the items of a section, rejecting duplicates.
+
+    :param entries: items of the section
+    :type entries: Sequence[E]
+    :param key: returns what identifies an item
+    :type key: Callable[[E], Hashable]
+    :param check: store validation of an item
+    :type check: Callable[[E], bool]
+    :param invalid: error message for items failing the store validation
+    :type invalid: str
+    :return: error message per item, None for valid items
+    :rtype: list[str | None]
+    """
+    seen: set[Hashable] = set()
+    errors: list[str | None] = []
+    for entry in entries:
+        if key(entry) in seen:
+            errors.append("Duplicate item in request")
+        elif not check(entry):
+            errors.append(invalid)
+        else:
+            errors.append(None)
+        seen.add(key(entry))
+    return errors
+
+
+def _validate(batch: TopologyBatch) -> dict[str, list[str | None]]:
+    """Validate every item of a request against the store and each other.
+
+    :param batch: bulk request
+    :type batch: TopologyBatch
+    :return: error message per item and section, None for valid items
+    :rtype: dict[str, list[str | None]]
+    """
+    for veth in batch.veth_pairs:
+        if not veth.veth_pair_info.map:
+            veth.veth_pair_info.map = ":"
+    return {
+        "bridges": _validate_section(
+            batch.bridges,
+            lambda e: e.bridge_name,
+            lambda e: validate_bridge(
+                e.bridge_name, cast("BridgeInfoDict", e.bridge_info.model_dump())
+            ),
+            "Bridge already exists with the same parent details",
+        ),
+        "container_ifaces": _validate_section(
+            batch.container_ifaces,
+            lambda e: (e.container_id, e.container_info.bridge, e.container_info.iface),
+            lambda e: validate_container(
+                e.container_id, cast("ContainerInfoDict", e.container_info.model_dump())
+            ),
+            "Validation failed",
+        ),
+        "veth_pairs": _validate_section(
+            batch.veth_pairs,
+            lambda e: e.veth_pair_id,
+            lambda e: validate_veth_pair(e.veth_pair_id, e.veth_pair_info.model_dump()),
+            "Validation failed",
+        ),
+    }
+
+
+async def _apply_bridges(entries: list[BridgeEntry], errors: list[str | None]) -> None:
+    async def _one(index: int, entry: BridgeEntry) -> None:
+        payload = cast("BridgeInfoDict", entry.bridge_info.model_dump())
+        errors[index] = await run_item(init_bridge, entry.bridge_name, payload)
+        if errors[index] is None:
+            add_bridge_config(entry.bridge_name, payload)
+
+    await asyncio.gather(
+        *(_one(i, e) for i, e in enumerate(entries) if errors[i] is None)
+    )
+
+
+def _group(
+    entries: Sequence[E], errors: list[str | None], key: Callable[[E], str]
+) -> dict[str, list[tuple[int, E]]]:
+    """Group the valid items of a section, keeping their request index.
+
+    :param entries: items of the section
+    :type entries: Sequence[E]
+    :param errors: error message per item, None for valid items
+    :type errors: list[str | None]
+    :param key: returns the container or bridge of an item
+    :type key: Callable[[E], str]
+    :return: (index, item) pairs per container or bridge
+    :rtype: dict[str, list[tuple[int, E]]]
+    """
+    groups: dict[str, list[tuple[int, E]]] = {}
+    for index, entry in enumerate(entries):
+        if errors[index] is None:
+            groups.setdefault(key(entry), []).append((index, entry))
+    return groups
+
+
+async def _apply_ifaces_and_veths(
+    batch: TopologyBatch, errors: dict[str, list[str | None]]
+) -> None:
+    """Apply container interfaces per container and veth pairs per bridge.
+
+    Items sharing a container or a bridge run one after the other, as they
+    would under their per-key locks.
+
+    :param batch: bulk request
+    :type batch: TopologyBatch
+    :param errors: error message per item, updated in place
+    :type errors: dict[str, list[str | None]]
+    """
+    snap = await snapshot_host()
+    containers = _group(
+        batch.container_ifaces, errors["container_ifaces"], lambda e: e.container_id
+    )
+    veth_bridges = _group(
+        batch.veth_pairs, errors["veth_pairs"], lambda e: e.veth_pair_info.on
+    )
+
+    async def _container(items: list[tuple[int, ContainerIfaceEntry]]) -> None:
+        for index, cc in items:
+            payload = cast("ContainerInfoDict", cc.container_info.model_dump())
+            error = await run_item(
+                add_iface_to_container, cc.container_id, payload, snap
+            )
+            if error is None:
+                add_container_config(cc.container_id, payload)
+            errors["container_ifaces"][index] = error
+
+    async def _veth_pairs(items: list[tuple[int, VethPairEntry]]) -> None:
+        for index, veth in items:
+            info = veth.veth_pair_info
+            error = await run_item(
+                create_veth_pair, info.on, veth.veth_pair_id, info.map, info.trunk
+            )
+            if error is None:
+                add_veth_pair_config(veth.veth_pair_id, info.model_dump())
+            errors["veth_pairs"][index] = error
+
+    await asyncio.gather(
+        *(_container(items) for items in containers.values()),
+        *(_veth_pairs(items) for items in veth_bridges.values()),
+    )
+
+
+async def apply_batch(batch: TopologyBatch) -> dict[str, Results]:
+    """Validate and apply a bulk request.
+
+    :param batch: bulk request
+    :type batch: TopologyBatch
+    :return: per item status for each section, in request order
+    :rtype: dict[str, Results]
+    """
+    errors = _validate(batch)
+
+    bridges = {e.bridge_name for e in batch.bridges}
+    bridges |= {e.veth_pair_info.on for e in batch.veth_pairs}
+    containers = {e.container_id for e in batch.container_ifaces}
+    async with hold_locks(bridges, containers):
+        await _apply_bridges(batch.bridges, errors["bridges"])
+        await _apply_ifaces_and_veths(batch, errors)
+
+    return {
+        "bridges": [
+            _status("bridge_name", e.bridge_name, error)
+            for e, error in zip(batch.bridges, errors["bridges"], strict=True)
+        ],
+        "container_ifaces": [
+            _status("container_id", e.container_id, error)
+            for e, error in zip(
+                batch.container_ifaces, errors["container_ifaces"], strict=True
+            )
+        ],
+        "veth_pairs": [
+            _status("veth_pair_id", e.veth_pair_id, error)
+            for e, error in zip(batch.veth_pairs, errors["veth_pairs"], strict=True)
+        ],
+    }
+
+
+@router.post("/add_topology")
+async def add_topology_api(batch: TopologyBatch) -> dict[str, Results]:
+    """Add bridges, container interfaces and veth pairs in one request.
+
+    Bridges are set up first, then container interfaces and veth pairs.
+
+    :param batch: bridges, container interfaces and veth pairs to add
+    :type batch: TopologyBatch
+    :return: per item status for each section, in request order
+    :rtype: dict[str, Results]
+    """
+    return await apply_batch(batch)
+
+
+@router.post("/add_bridges")
+async def add_bridges_api(bridges: list[BridgeEntry]) -> dict[str, Results]:
+    """Add several Linux/OVS bridges.
+
+    :param bridges: bridges, each like the /add_bridge body
+    :type bridges: list[BridgeEntry]
+    :return: per bridge status, in request order
+    :rtype: dict[str, Results]
+    """
+    results = await apply_batch(TopologyBatch(bridges=bridges))
+    return {"bridges": results["bridges"]}
+
+
+@router.post("/add_container_ifaces")
+async def add_container_ifaces_api(
+    container_ifaces: list[ContainerIfaceEntry],
+) -> dict[str, Results]:
+    """Attach several OVS/Linux bridge links to their containers.
+
+    :param container_ifaces: interfaces, each like the /add_container_iface body
+    :type container_ifaces: list[ContainerIfaceEntry]
+    :return: per interface status, in request order
+    :rtype: dict[str, Results]
+    """
+    results = await apply_batch(TopologyBatch(container_ifaces=container_ifaces))
+    return {"container_ifaces": results["container_ifaces"]}
+
+
+@router.post("/add_veth_pairs")
+async def add_veth_pairs_api(veth_pairs: list[VethPairEntry]) -> dict[str, Results]:
+    """Add several VETH links onto their bridges.
+
+    :param veth_pairs: veth pairs, each like the /add_veth_pair body
+    :type veth_pairs: list[VethPairEntry]
+    :return: per veth pair status, in request order
+    :rtype: dict[str, Results]
+    """
+    results = await apply_batch(TopologyBatch(veth_pairs=veth_pairs))
+    return {"veth_pairs": results["veth_pairs"]}
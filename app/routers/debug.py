@@ -0,0 +1,81 @@
+"""API router to inspect the traced commands.
+
+Tracing is off unless TRACE_COMMANDS is set or it is switched on through
+``PUT /debug/commands/tracing``.
+"""
+
+from dataclasses import asdict
+from typing import Any
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.utils import get_tracer
+
+router = APIRouter()
+
+
+@router.get("/debug/commands")
+async def get_commands_api(
+    cycle: int | None = None, limit: int | None = None
+) -> dict[str, Any]:
+    """Return the traced commands, oldest first.
+
+    :param cycle: only return the commands of this reconcile cycle
+    :type cycle: int | None
+    :param limit: only return the most recent commands
+    :type limit: int | None
+    :return: tracing state and command records
+    :rtype: dict[str, Any]
+    """
+    tracer = get_tracer()
+    records = tracer.records(cycle)
+    if limit is not None:
+        records = records[-limit:] if limit > 0 else []
+    return {"enabled": tracer.enabled, "commands": [asdict(r) for r in records]}
+
+
+@router.get("/debug/commands/cycles")
+async def get_cycles_api() -> list[dict[str, Any]]:
+    """Return the traced reconcile cycles with their time spent per caller.
+
+    :return: per cycle totals, callers sorted by the time their commands took
+    :rtype: list[dict[str, Any]]
+    """
+    return get_tracer().cycles()
+
+
+@router.get("/debug/commands/trace")
+async def get_trace_api(cycle: int | None = None) -> JSONResponse:
+    """Download the traced commands as Chrome trace-event JSON.
+
+    The file opens in Perfetto (ui.perfetto.dev) or chrome://tracing.
+
+    :param cycle: only export this reconcile cycle
+    :type cycle: int | None
+    :return: trace document as a file download
+    :rtype: JSONResponse
+    """
+    name = f"raikou-cycle-{cycle}.json" if cycle is not None else "raikou-trace.json"
+    return JSONResponse(
+        get_tracer().chrome_trace(cycle),
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
+
+
+@router.put("/debug/commands/tracing")
+async def set_tracing_api(enabled: bool, clear: bool = False) -> dict[str, bool]:
+    """Switch command tracing on or off.
+
+    :param enabled: record commands from now on
+    :type enabled: bool
+    :param clear: drop the records collected so far
+    :type clear: bool
+    :return: tracing state
+    :rtype: dict[str, bool]
+    """
+    tracer = get_tracer()
+    tracer.enabled = enabled
+    if clear:
+        tracer.clear()
+    return {"enabled": tracer.enabled}
@@ -0,0 +1,62 @@
+"""API router to read or replace the whole topology."""
+
+from dataclasses import asdict
+from typing import Any
+
+from fastapi import APIRouter, HTTPException
+
+from app.schemas import Topology
+from app.topology import (
+    apply_topology,
+    check_topology,
+    normalize_topology,
+    plan_topology,
+)
+from app.utils import TOPOLOGY_LOCK, get_config
+
+router = APIRouter()
+
+
+@router.get("/topology")
+async def get_topology_api() -> dict[str, Any]:
+    """Return the current desired topology.
+
+    :return: bridges, container interfaces and veth pairs
+    :rtype: dict[str, Any]
+    """
+    return normalize_topology(get_config())
+
+
+@router.put("/topology")
+async def put_topology_api(topology: Topology, dry_run: bool = False) -> dict:
+    """Replace the desired topology, applying only what changed.
+
+    Bridges, parents, container interfaces and veth pairs missing from the
+    document are removed, new ones are added and changed ones are updated.
+    Objects the current and the new topology share are left untouched.
+
+    :param topology: complete desired topology
+    :type topology: Topology
+    :param dry_run: only return the plan, do not change anything
+    :type dry_run: bool
+    :raises HTTPException: error code 400, if the topology is inconsistent
+    :return: the plan, and the objects that failed to apply
+    :rtype: dict
+    """
+    desired = normalize_topology(topology.model_dump())
+    if errors := check_topology(desired):
+        raise HTTPException(status_code=400, detail=errors)
+
+    # Plan against the config the apply replaces, not one changed meanwhile.
+    async with TOPOLOGY_LOCK:
+        current = normalize_topology(get_config())
+        plan = plan_topology(current, desired)
+        if dry_run:
+            return {"status": "planned", "plan": asdict(plan)}
+
+        failed = await apply_topology(plan, current, desired)
+    return {
+        "status": "failed" if failed else "success",
+        "plan": asdict(plan),
+        "errors": failed,
+    }
@@ -5,10 +5,12 @@ from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 
+from app.metrics import render_metrics
 from app.orchestrator import main
-from app.routers import bridge, container, veth
-from app.utils import get_logger
+from app.routers import bridge, bulk, container, debug, topology, veth
+from app.utils import get_logger, run_blocking
 
 _LOGGER = get_logger("runner")
 
@@ -40,6 +42,9 @@ app = FastAPI(lifespan=app_lifespan)
 app.include_router(bridge.router)
 app.include_router(container.router)
 app.include_router(veth.router)
+app.include_router(bulk.router)
+app.include_router(topology.router)
+app.include_router(debug.router)
 
 
 @app.get("/")
@@ -50,3 +55,16 @@ async def root() -> dict[str, str]:
     :rtype: dict[str,str]
     """
     return {"message": "OVS Network Orchestrator API"}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Expose reconcile, command, lock and IP pool metrics to Prometheus.
+
+    :return: metrics in the Prometheus text format
+    :rtype: PlainTextResponse
+    """
+    return PlainTextResponse(
+        await run_blocking(render_metrics),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
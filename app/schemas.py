@@ -2,7 +2,9 @@
 
 from typing import Literal
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
+
+from app.vlans import parse_vlans
 
 
 # pylint: disable=E0213
@@ -19,7 +21,7 @@ class VlanBaseModel(BaseModel):
     )
     trunk: str | None = Field(
         None,
-        description="Comma-separated VLAN trunk (e.g., '100,200')",
+        description="Comma-separated VLAN trunk ids and ranges (e.g., '100,200-300')",
         title="Trunk VLAN",
     )
     native: str | None = Field(
@@ -29,25 +31,23 @@ class VlanBaseModel(BaseModel):
     )
 
     @field_validator("vlan", "trunk", "native", mode="before")
-    def validate_vlan_range(cls, value: str | None) -> str | None:
+    def validate_vlan_range(cls, value: str | None, info: ValidationInfo) -> str | None:
         """Validate the trunk and native VLAN id range.
 
+        A trunk may list VLAN ranges, e.g. "100,200-3000". Access and
+        native VLANs are single VLAN ids.
+
         :param value: Trunk or native VLAN as a string
+        :param info: Validation details, naming the field being validated
         :return: The validated value if valid, otherwise raises ValueError
         :raises ValueError: If trunk/native VLAN is out of range or not formatted correctly.
         """
-        vlan_range_limit = 4095
         if value is None:
             return value
-        # Split the trunk VLAN values by comma and validate
-        for vlan in value.split(","):
-            if not vlan.isdigit():
-                msg = f"VLAN {vlan} should be a numeric string"
-                raise ValueError(msg)
-            vlan_int = int(vlan)
-            if not 1 <= vlan_int <= vlan_range_limit:
-                msg = f"VLAN {vlan} should be between 1 and 4095"
-                raise ValueError(msg)
+        parse_vlans(value)
+        if info.field_name != "trunk" and not value.isdigit():
+            msg = f"VLAN {value} should be a single VLAN id"
+            raise ValueError(msg)
         return value
 
 
@@ -166,3 +166,74 @@ class VethPairInfo(BaseModel):
         description="Whether the veth pair is trunked ('yes' or 'no')",
         title="Trunk",
     )
+
+
+class BridgeEntry(BaseModel):
+    """A bridge of a bulk request, same fields as the /add_bridge body."""
+
+    bridge_name: str = Field(..., description="Bridge name", title="Bridge Name")
+    bridge_info: BridgeInfo
+
+
+class ContainerIfaceEntry(BaseModel):
+    """A container interface of a bulk request.
+
+    Same fields as the /add_container_iface body.
+    """
+
+    container_id: str = Field(..., description="Container name", title="Container Name")
+    container_info: ContainerInfo
+
+
+class VethPairEntry(BaseModel):
+    """A veth pair of a bulk request, same fields as the /add_veth_pair body."""
+
+    veth_pair_id: str = Field(
+        ..., description="VETH pair ID, used as prefix", title="VETH Pair ID"
+    )
+    veth_pair_info: VethPairInfo
+
+
+class TopologyBatch(BaseModel):
+    """Bridges, container interfaces and veth pairs applied in one request.
+
+    Bridges are set up first, then container interfaces and veth pairs.
+    """
+
+    bridges: list[BridgeEntry] = Field(
+        default_factory=list, description="Bridges to add", title="Bridges"
+    )
+    container_ifaces: list[ContainerIfaceEntry] = Field(
+        default_factory=list,
+        description="Container interfaces to attach",
+        title="Container Interfaces",
+    )
+    veth_pairs: list[VethPairEntry] = Field(
+        default_factory=list, description="VETH pairs to add", title="VETH Pairs"
+    )
+
+
+class TopologyBridgeInfo(BridgeInfo):
+    """Bridge of a topology document, parents may be left out."""
+
+    parents: list[IfaceInfo] | None = Field(
+        None,
+        description="List of parent interfaces to be attached to the bridge",
+        title="Parent Interfaces",
+    )
+
+
+class Topology(BaseModel):
+    """Complete desired state, in the same layout as the config file."""
+
+    bridge: dict[str, TopologyBridgeInfo] = Field(
+        default_factory=dict, description="Bridges by name", title="Bridges"
+    )
+    container: dict[str, list[ContainerInfo]] = Field(
+        default_factory=dict,
+        description="Interfaces by container name",
+        title="Container Interfaces",
+    )
+    veth_pairs: dict[str, VethPairInfo] = Field(
+        default_factory=dict, description="VETH pairs by ID", title="VETH Pairs"
+    )
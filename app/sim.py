@@ -0,0 +1,1188 @@
+"""Simulated host.
+
+An in-memory model of everything the orchestrator drives: the Open vSwitch
+database, network namespaces with their links, addresses, routes and
+bridge VLANs, and Docker containers. With SIMULATED_HOST set, the OVSDB,
+netlink and Docker API clients and run_command are answered by it, so the
+orchestrator runs without root, Open vSwitch or Docker, e.g. to benchmark
+how it scales.
+
+Requests still go through the real clients: netlink messages are encoded
+and decoded, OVSDB transactions are evaluated like ovsdb-server does, with
+garbage collection of unreferenced rows, and everything is counted and
+traced as usual. Host commands and API requests can be given a latency.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import errno
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass, field
+from functools import cache
+from itertools import count
+from subprocess import CompletedProcess
+from typing import Any
+from urllib.parse import urlsplit
+
+from app.docker_api import DockerClient, DockerError
+from app.model import lxbr_port_name
+from app.netlink import (
+    _IFADDRMSG,
+    _IFINFOMSG,
+    _RTMSG,
+    IFA_ADDRESS,
+    IFA_LOCAL,
+    IFF_UP,
+    IFLA_ADDRESS,
+    IFLA_BR_VLAN_FILTERING,
+    IFLA_IFNAME,
+    IFLA_INFO_DATA,
+    IFLA_INFO_KIND,
+    IFLA_LINKINFO,
+    IFLA_MASTER,
+    IFLA_MTU,
+    IFLA_NET_NS_FD,
+    NLM_F_DUMP,
+    RTA_GATEWAY,
+    RTM_DELADDR,
+    RTM_DELLINK,
+    RTM_GETADDR,
+    RTM_GETLINK,
+    RTM_NEWADDR,
+    RTM_NEWLINK,
+    RTM_NEWROUTE,
+    VETH_INFO_PEER,
+    Netlink,
+    NetlinkError,
+    _attr,
+    _name_attr,
+    _parse_attrs,
+)
+from app.ovsdb import OvsdbClient, OvsdbError
+from app.utils import SIMULATED_COMMAND_LATENCY, get_logger
+from app.vlans import parse_vlans, vlan_ids
+
+_LOGGER = get_logger("sim")
+
+HOST_NETNS = "/proc/1/ns/net"
+_PVID = "PVID Egress Untagged"
+_UNTAGGED = "Egress Untagged"
+
+# Columns holding sets of references, written as ["uuid", ...] atoms
+_REF_COLUMNS = frozenset({"bridges", "ports", "interfaces"})
+# Schema subset, a list default marks a set column, a dict a map column
+_TABLES: dict[str, dict[str, Any]] = {
+    "Open_vSwitch": {"bridges": [], "next_cfg": 0, "cur_cfg": 0},
+    "Bridge": {"name": "", "ports": [], "external_ids": {}},
+    "Port": {
+        "name": "",
+        "interfaces": [],
+        "tag": [],
+        "trunks": [],
+        "vlan_mode": [],
+        "external_ids": {},
+    },
+    "Interface": {"name": "", "type": "", "external_ids": {}},
+}
+
+
+_NetlinkHandler = Callable[["SimNamespace", int, bytes], list[bytes]]
+# (table, uuid) -> row before the transaction, None for inserted rows
+_Undo = dict[tuple[str, str], dict[str, Any] | None]
+_Operation = Callable[[dict[str, Any], dict[str, str], _Undo], dict[str, Any]]
+
+
+class _CommandFailed(Exception):
+    """Ends a simulated command with an exit status and an error message."""
+
+    def __init__(self, message: str, returncode: int = 1) -> None:
+        super().__init__(message)
+        self.returncode = returncode
+
+
+class _TransactionFailed(Exception):
+    """Aborts a simulated OVSDB transaction."""
+
+    def __init__(self, details: str, error: str = "constraint violation") -> None:
+        super().__init__(details)
+        self.result = {"error": error, "details": details}
+
+
+@dataclass(slots=True)
+class SimLink:
+    """Network device of a simulated namespace."""
+
+    index: int
+    name: str
+    kind: str = ""
+    flags: int = 0
+    mtu: int = 1500
+    master: int = 0
+    address: bytes = b""
+    peer: tuple[str, str] | None = None  # (namespace, name) of a veth peer
+    vlan_filtering: bool = False
+    ipv6: bool = False
+
+
+@dataclass(slots=True)
+class SimNamespace:
+    """Simulated network namespace."""
+
+    path: str
+    links: dict[str, SimLink] = field(default_factory=dict)
+    by_index: dict[int, SimLink] = field(default_factory=dict)
+    addresses: dict[int, list[tuple[int, str]]] = field(default_factory=dict)
+    routes: set[tuple[int, str]] = field(default_factory=set)  # default routes
+    vlans: dict[str, dict[int, str]] = field(default_factory=dict)  # port -> vid
+
+    def link(self, name: str) -> SimLink:
+        """Return a device by name.
+
+        :param name: device name
+        :type name: str
+        :return: the device
+        :rtype: SimLink
+        :raises NetlinkError: if the device does not exist
+        """
+        if (link := self.links.get(name)) is None:
+            raise NetlinkError(errno.ENODEV, os.strerror(errno.ENODEV))
+        return link
+
+
+@dataclass(slots=True)
+class SimContainer:
+    """Simulated Docker container."""
+
+    id: str
+    name: str
+    pid: int
+    state: str = "running"
+
+    @property
+    def netns(self) -> str:
+        """Return the network namespace file of the container.
+
+        :return: namespace file path
+        :rtype: str
+        """
+        return f"/proc/{self.pid}/ns/net"
+
+
+def _error(code: int) -> NetlinkError:
+    return NetlinkError(code, os.strerror(code))
+
+
+def _decode_atom(value: Any, named: dict[str, str]) -> Any:  # noqa: ANN401
+    if isinstance(value, list) and len(value) == 2:  # noqa: PLR2004
+        if value[0] == "named-uuid":
+            return named[value[1]]
+        if value[0] == "uuid":
+            return value[1]
+    return value
+
+
+def _decode(default: Any, value: Any, named: dict[str, str]) -> Any:  # noqa: ANN401
+    if isinstance(value, list) and value and value[0] == "set":
+        items = [_decode_atom(v, named) for v in value[1]]
+    elif isinstance(value, list) and value and value[0] == "map":
+        return dict(value[1])
+    else:
+        items = [_decode_atom(value, named)]
+    return items if isinstance(default, list) else items[0]
+
+
+def _encode(column: str, value: Any) -> Any:  # noqa: ANN401
+    if column == "_uuid":
+        return ["uuid", value]
+    if isinstance(value, dict):
+        return ["map", [[k, v] for k, v in value.items()]]
+    if isinstance(value, list):
+        atoms = [["uuid", v] for v in value] if column in _REF_COLUMNS else value
+        return atoms[0] if len(atoms) == 1 else ["set", list(atoms)]
+    return value
+
+
+class SimHost:
+    """In-memory host answering OVSDB, netlink, Docker and command requests.
+
+    Every request is served under one lock, like a single daemon would.
+    """
+
+    def __init__(
+        self, command_latency: float = 0.0, request_latency: float = 0.0
+    ) -> None:
+        """Create a host with a loopback device and an empty OVS database.
+
+        :param command_latency: seconds every host command takes
+        :type command_latency: float
+        :param request_latency: seconds every OVSDB, netlink and Docker API
+                                request takes, blocking the calling thread
+        :type request_latency: float
+        """
+        self.command_latency = command_latency
+        self.request_latency = request_latency
+        self._lock = threading.RLock()
+        self._indexes = count(1)
+        self._pids = count(1000)
+        self._netns_ids: dict[str, int] = {}
+        self._namespaces: dict[str, SimNamespace] = {}
+        self._containers: dict[str, SimContainer] = {}
+        self._tables: dict[str, dict[str, dict[str, Any]]] = {t: {} for t in _TABLES}
+        # (table, uuid) -> row in the OVSDB wire format, reused by selects
+        self._encoded: dict[tuple[str, str], dict[str, Any]] = {}
+        root = str(uuid.uuid4())
+        self._tables["Open_vSwitch"][root] = self._new_row("Open_vSwitch", root)
+        self._add_namespace(HOST_NETNS)
+        self._netlink_handlers: dict[int, _NetlinkHandler] = {
+            RTM_GETLINK: self._getlink,
+            RTM_NEWLINK: self._newlink,
+            RTM_DELLINK: self._dellink,
+            RTM_GETADDR: self._getaddr,
+            RTM_NEWADDR: self._newaddr,
+            RTM_DELADDR: self._deladdr,
+            RTM_NEWROUTE: self._newroute,
+        }
+        self._operations: dict[str, _Operation] = {
+            "insert": self._insert,
+            "select": self._select,
+            "update": self._update,
+            "mutate": self._mutate,
+        }
+        self._commands: dict[str, Callable[[list[str]], str]] = {
+            "ip": lambda args: self._ip(self._namespaces[HOST_NETNS], args),
+            "bridge": self._bridge,
+            "brctl": self._brctl,
+            "ovs-vsctl": self._ovs_vsctl,
+            "docker": self._docker,
+            "ovs-docker": self._ovs_docker,
+            "lxbr-docker": self._lxbr_docker,
+            "sysctl": lambda args: f"{' = '.join(args[-1].split('='))}\n",
+        }
+
+    # Model setup
+
+    def _add_namespace(self, path: str) -> SimNamespace:
+        ns = self._namespaces[path] = SimNamespace(path)
+        self._netns_ids[path] = len(self._netns_ids) + 1
+        self._new_link(ns, "lo", flags=IFF_UP, mtu=65536)
+        return ns
+
+    def _new_link(self, ns: SimNamespace, name: str, **details: Any) -> SimLink:  # noqa: ANN401
+        index = next(self._indexes)
+        details.setdefault("address", b"\x02\x00" + struct.pack("!I", index))
+        link = SimLink(index, name, **details)
+        ns.links[name] = ns.by_index[index] = link
+        return link
+
+    def _remove_link(self, ns: SimNamespace, link: SimLink) -> None:
+        del ns.links[link.name], ns.by_index[link.index]
+        ns.addresses.pop(link.index, None)
+        ns.vlans.pop(link.name, None)
+        for port in ns.links.values():
+            if port.master == link.index:
+                port.master = 0
+                ns.vlans.pop(port.name, None)
+        if link.peer is not None:
+            peer_ns = self._namespaces.get(link.peer[0])
+            if peer_ns is not None and (peer := peer_ns.links.get(link.peer[1])):
+                peer.peer = None
+                self._remove_link(peer_ns, peer)
+
+    def add_link(self, name: str, netns: str = HOST_NETNS, kind: str = "") -> None:
+        """Add a device, e.g. a physical NIC used as a bridge parent.
+
+        :param name: device name
+        :type name: str
+        :param netns: network namespace file
+        :type netns: str
+        :param kind: link kind, empty for a physical device
+        :type kind: str
+        """
+        with self._lock:
+            self._new_link(self._namespaces[netns], name, kind=kind)
+
+    def add_container(self, name: str) -> SimContainer:
+        """Start a container with a network namespace of its own.
+
+        :param name: container name
+        :type name: str
+        :return: the container
+        :rtype: SimContainer
+        """
+        with self._lock:
+            container = SimContainer(
+                id=uuid.uuid4().hex + uuid.uuid4().hex, name=name, pid=next(self._pids)
+            )
+            self._containers[name] = container
+            self._add_namespace(container.netns)
+            return container
+
+    def remove_container(self, name: str) -> None:
+        """Remove a container, its veth ends go away with its namespace.
+
+        :param name: container name
+        :type name: str
+        """
+        with self._lock:
+            container = self._containers.pop(name)
+            ns = self._namespaces.pop(container.netns)
+            self._netns_ids.pop(container.netns)
+            for link in list(ns.links.values()):
+                if link.name in ns.links:
+                    self._remove_link(ns, link)
+
+    def netns_id(self, path: str) -> int:
+        """Return a stand-in for a file descriptor of a network namespace.
+
+        :param path: network namespace file
+        :type path: str
+        :return: namespace ID
+        :rtype: int
+        :raises FileNotFoundError: if the namespace does not exist
+        """
+        with self._lock:
+            if (ns_id := self._netns_ids.get(path)) is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            return ns_id
+
+    def enable_ipv6(self, netns: str, name: str) -> None:
+        """Enable IPv6 on a device, like writing its disable_ipv6 sysctl.
+
+        :param netns: network namespace file
+        :type netns: str
+        :param name: device name
+        :type name: str
+        :raises FileNotFoundError: if the device does not exist
+        """
+        with self._lock:
+            if (link := self._namespaces[netns].links.get(name)) is None:
+                path = f"/proc/sys/net/ipv6/conf/{name}/disable_ipv6"
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            link.ipv6 = True
+
+    def _delay(self) -> None:
+        if self.request_latency:
+            time.sleep(self.request_latency)
+
+    # Netlink
+
+    def netlink(
+        self, netns: str, msg_type: int, flags: int, payload: bytes
+    ) -> list[bytes]:
+        """Serve a netlink request.
+
+        :param netns: network namespace file of the requesting socket
+        :type netns: str
+        :param msg_type: netlink message type, e.g. RTM_GETLINK
+        :type msg_type: int
+        :param flags: NLM_F_* flags
+        :type flags: int
+        :param payload: message body
+        :type payload: bytes
+        :return: bodies of the reply messages
+        :rtype: list[bytes]
+        :raises NetlinkError: if the request fails, like the kernel would
+        """
+        self._delay()
+        if (handler := self._netlink_handlers.get(msg_type)) is None:
+            raise _error(errno.EOPNOTSUPP)
+        with self._lock:
+            if (ns := self._namespaces.get(netns)) is None:
+                raise _error(errno.EINVAL)
+            return handler(ns, flags, payload)
+
+    @staticmethod
+    def _link_message(link: SimLink) -> bytes:
+        body = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, link.index, link.flags, 0)
+        body += _name_attr(IFLA_IFNAME, link.name)
+        body += _attr(IFLA_MTU, struct.pack("=I", link.mtu))
+        body += _attr(IFLA_ADDRESS, link.address)
+        if link.master:
+            body += _attr(IFLA_MASTER, struct.pack("=I", link.master))
+        if link.kind:
+            info = _name_attr(IFLA_INFO_KIND, link.kind)
+            if link.kind == "bridge":
+                data = struct.pack("=B", link.vlan_filtering)
+                info += _attr(IFLA_INFO_DATA, _attr(IFLA_BR_VLAN_FILTERING, data))
+            body += _attr(IFLA_LINKINFO, info)
+        return body
+
+    def _find_link(self, ns: SimNamespace, payload: bytes) -> SimLink:
+        _, _, index, _, _ = _IFINFOMSG.unpack_from(payload)
+        if index:
+            if (link := ns.by_index.get(index)) is None:
+                raise _error(errno.ENODEV)
+            return link
+        attrs = _parse_attrs(payload[_IFINFOMSG.size :])
+        return ns.link(attrs.get(IFLA_IFNAME, b"").rstrip(b"\0").decode())
+
+    def _getlink(self, ns: SimNamespace, flags: int, payload: bytes) -> list[bytes]:
+        if flags & NLM_F_DUMP == NLM_F_DUMP:
+            return [self._link_message(link) for link in ns.links.values()]
+        return [self._link_message(self._find_link(ns, payload))]
+
+    def _create_link(self, ns: SimNamespace, payload: bytes) -> None:
+        attrs = _parse_attrs(payload[_IFINFOMSG.size :])
+        name = attrs[IFLA_IFNAME].rstrip(b"\0").decode()
+        info = _parse_attrs(attrs[IFLA_LINKINFO])
+        kind = info[IFLA_INFO_KIND].rstrip(b"\0").decode()
+        if name in ns.links:
+            raise _error(errno.EEXIST)
+        if kind != "veth":
+            self._new_link(ns, name, kind=kind)
+            return
+
+        peer_msg = _parse_attrs(info[IFLA_INFO_DATA])[VETH_INFO_PEER]
+        peer_attrs = _parse_attrs(peer_msg[_IFINFOMSG.size :])
+        peer_name = peer_attrs[IFLA_IFNAME].rstrip(b"\0").decode()
+        peer_ns = ns
+        if IFLA_NET_NS_FD in peer_attrs:
+            (ns_id,) = struct.unpack("=I", peer_attrs[IFLA_NET_NS_FD])
+            path = next((p for p, i in self._netns_ids.items() if i == ns_id), None)
+            if path is None:
+                raise _error(errno.EBADF)
+            peer_ns = self._namespaces[path]
+        if peer_name in peer_ns.links or (peer_name == name and peer_ns is ns):
+            raise _error(errno.EEXIST)
+        peer_details: dict[str, Any] = {"kind": "veth", "peer": (ns.path, name)}
+        if IFLA_MTU in peer_attrs:
+            (peer_details["mtu"],) = struct.unpack("=I", peer_attrs[IFLA_MTU])
+        if IFLA_ADDRESS in peer_attrs:
+            peer_details["address"] = peer_attrs[IFLA_ADDRESS]
+        self._new_link(ns, name, kind="veth", peer=(peer_ns.path, peer_name))
+        self._new_link(peer_ns, peer_name, **peer_details)
+
+    def _newlink(self, ns: SimNamespace, _flags: int, payload: bytes) -> list[bytes]:
+        attrs = _parse_attrs(payload[_IFINFOMSG.size :])
+        _, _, index, link_flags, change = _IFINFOMSG.unpack_from(payload)
+        if not index and IFLA_LINKINFO in attrs:
+            self._create_link(ns, payload)
+            return []
+
+        link = self._find_link(ns, payload)
+        link.flags = (link.flags & ~change) | (link_flags & change)
+        if IFLA_LINKINFO in attrs:
+            info = _parse_attrs(attrs[IFLA_LINKINFO])
+            data = _parse_attrs(info.get(IFLA_INFO_DATA, b""))
+            if IFLA_BR_VLAN_FILTERING in data:
+                if link.kind != "bridge":
+                    raise _error(errno.EOPNOTSUPP)
+                link.vlan_filtering = data[IFLA_BR_VLAN_FILTERING][:1] == b"\1"
+        if IFLA_MASTER in attrs:
+            (master,) = struct.unpack("=I", attrs[IFLA_MASTER])
+            if master and master not in ns.by_index:
+                raise _error(errno.ENODEV)
+            ns.vlans.pop(link.name, None)
+            link.master = master
+            if master and ns.by_index[master].kind == "bridge":
+                # The kernel adds new bridge ports to the default VLAN.
+                ns.vlans[link.name] = {1: _PVID}
+        return []
+
+    def _dellink(self, ns: SimNamespace, _flags: int, payload: bytes) -> list[bytes]:
+        self._remove_link(ns, self._find_link(ns, payload))
+        return []
+
+    @staticmethod
+    def _address(family: int, raw: bytes, prefix: int) -> str:
+        return f"{socket.inet_ntop(family, raw)}/{prefix}"
+
+    def _getaddr(self, ns: SimNamespace, _flags: int, payload: bytes) -> list[bytes]:
+        family = _IFADDRMSG.unpack_from(payload)[0]
+        replies = []
+        for index, addresses in ns.addresses.items():
+            for addr_family, address in addresses:
+                if family not in (socket.AF_UNSPEC, addr_family):
+                    continue
+                ip, _, prefix = address.partition("/")
+                raw = socket.inet_pton(addr_family, ip)
+                replies.append(
+                    _IFADDRMSG.pack(addr_family, int(prefix), 0, 0, index)
+                    + _attr(IFA_LOCAL, raw)
+                    + _attr(IFA_ADDRESS, raw)
+                )
+        return replies
+
+    def _address_of(self, ns: SimNamespace, payload: bytes) -> tuple[int, str, int]:
+        family, prefix, _, _, index = _IFADDRMSG.unpack_from(payload)
+        if index not in ns.by_index:
+            raise _error(errno.ENODEV)
+        attrs = _parse_attrs(payload[_IFADDRMSG.size :])
+        raw = attrs.get(IFA_LOCAL) or attrs[IFA_ADDRESS]
+        return family, self._address(family, raw, prefix), index
+
+    def _newaddr(self, ns: SimNamespace, _flags: int, payload: bytes) -> list[bytes]:
+        family, address, index = self._address_of(ns, payload)
+        addresses = ns.addresses.setdefault(index, [])
+        if (family, address) in addresses:
+            raise _error(errno.EEXIST)
+        addresses.append((family, address))
+        return []
+
+    def _deladdr(self, ns: SimNamespace, _flags: int, payload: bytes) -> list[bytes]:
+        family, address, index = self._address_of(ns, payload)
+        addresses = ns.addresses.get(index, [])
+        if (family, address) not in addresses:
+            raise _error(errno.EADDRNOTAVAIL)
+        addresses.remove((family, address))
+        return []
+
+    def _newroute(self, ns: SimNamespace, _flags: int, payload: bytes) -> list[bytes]:
+        family = _RTMSG.unpack_from(payload)[0]
+        gateway = _parse_attrs(payload[_RTMSG.size :])[RTA_GATEWAY]
+        if any(route[0] == family for route in ns.routes):
+            raise _error(errno.EEXIST)
+        ns.routes.add((family, socket.inet_ntop(family, gateway)))
+        return []
+
+    # OVSDB
+
+    @staticmethod
+    def _new_row(table: str, row_uuid: str) -> dict[str, Any]:
+        row = {
+            column: type(default)(default)
+            if isinstance(default, list | dict)
+            else default
+            for column, default in _TABLES[table].items()
+        }
+        row["_uuid"] = row_uuid
+        return row
+
+    def _rows(self, op: dict[str, Any], named: dict[str, str]) -> list[dict[str, Any]]:
+        rows = list(self._tables[op["table"]].values())
+        for column, function, value in op.get("where", []):
+            if function != "==":
+                msg = f"function {function} is not simulated"
+                raise _TransactionFailed(msg, "syntax error")
+            default = _TABLES[op["table"]].get(column, "")
+            expected = _decode(default, value, named)
+            rows = [row for row in rows if row[column] == expected]
+        return rows
+
+    def _touch(self, undo: _Undo, table: str, row_uuid: str) -> None:
+        self._encoded.pop((table, row_uuid), None)
+        if (table, row_uuid) not in undo:
+            row = self._tables[table].get(row_uuid)
+            undo[table, row_uuid] = {**row} if row is not None else None
+
+    def _insert(
+        self, op: dict[str, Any], named: dict[str, str], undo: _Undo
+    ) -> dict[str, Any]:
+        table, row_uuid = op["table"], str(uuid.uuid4())
+        if "uuid-name" in op:
+            named[op["uuid-name"]] = row_uuid
+        self._touch(undo, table, row_uuid)
+        row = self._new_row(table, row_uuid)
+        for column, value in op["row"].items():
+            row[column] = _decode(_TABLES[table][column], value, named)
+        self._tables[table][row_uuid] = row
+        return {"uuid": ["uuid", row_uuid]}
+
+    def _select(
+        self, op: dict[str, Any], named: dict[str, str], _undo: _Undo
+    ) -> dict[str, Any]:
+        table = op["table"]
+        columns = op.get("columns") or ["_uuid", *_TABLES[table]]
+        rows = []
+        for row in self._rows(op, named):
+            if (encoded := self._encoded.get((table, row["_uuid"]))) is None:
+                encoded = {column: _encode(column, v) for column, v in row.items()}
+                self._encoded[table, row["_uuid"]] = encoded
+            rows.append({column: encoded[column] for column in columns})
+        return {"rows": rows}
+
+    def _update(
+        self, op: dict[str, Any], named: dict[str, str], undo: _Undo
+    ) -> dict[str, Any]:
+        table = op["table"]
+        rows = self._rows(op, named)
+        for row in rows:
+            self._touch(undo, table, row["_uuid"])
+            for column, value in op["row"].items():
+                row[column] = _decode(_TABLES[table][column], value, named)
+        return {"count": len(rows)}
+
+    def _mutate(
+        self, op: dict[str, Any], named: dict[str, str], undo: _Undo
+    ) -> dict[str, Any]:
+        rows = self._rows(op, named)
+        for row in rows:
+            self._touch(undo, op["table"], row["_uuid"])
+            for column, mutator, value in op["mutations"]:
+                current = row[column]
+                if mutator == "+=":
+                    row[column] = current + value
+                    continue
+                items = _decode([], value, named)
+                if mutator == "insert":
+                    row[column] = current + [i for i in items if i not in current]
+                elif mutator == "delete":
+                    row[column] = [i for i in current if i not in items]
+                else:
+                    msg = f"mutator {mutator} is not simulated"
+                    raise _TransactionFailed(msg, "syntax error")
+        return {"count": len(rows)}
+
+    def _collect_garbage(self, undo: _Undo) -> None:
+        referenced = {
+            ref
+            for row in self._tables["Open_vSwitch"].values()
+            for ref in row["bridges"]
+        }
+        for table, column in (
+            ("Bridge", "ports"),
+            ("Port", "interfaces"),
+            ("Interface", None),
+        ):
+            rows = self._tables[table]
+            for row_uuid in [u for u in rows if u not in referenced]:
+                undo.setdefault((table, row_uuid), rows.pop(row_uuid))
+            if column is not None:
+                referenced = {ref for row in rows.values() for ref in row[column]}
+
+        for table in ("Bridge", "Port", "Interface"):
+            names = [row["name"] for row in self._tables[table].values()]
+            if len(names) != len(set(names)):
+                msg = f"Transaction causes multiple rows in {table} with the same name"
+                raise _TransactionFailed(msg)
+
+    def _apply_vswitchd(self) -> None:
+        """Create and remove the devices of bridges, like ovs-vswitchd does."""
+        host = self._namespaces[HOST_NETNS]
+        internal = {
+            row["name"]
+            for row in self._tables["Interface"].values()
+            if row["type"] == "internal"
+        }
+        for link in [
+            link
+            for link in host.links.values()
+            if link.kind == "openvswitch" and link.name not in internal
+        ]:
+            self._remove_link(host, link)
+        for name in internal - host.links.keys():
+            self._new_link(host, name, kind="openvswitch")
+        for row_uuid, row in self._tables["Open_vSwitch"].items():
+            row["cur_cfg"] = row["next_cfg"]
+            self._encoded.pop(("Open_vSwitch", row_uuid), None)
+
+    def transact(self, operations: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Run an OVSDB transaction.
+
+        :param operations: OVSDB operations
+        :type operations: list[dict[str, Any]]
+        :return: per-operation results, ending with the error if one failed
+        :rtype: list[dict[str, Any]]
+        """
+        self._delay()
+        named: dict[str, str] = {}
+        undo: _Undo = {}
+        results: list[dict[str, Any]] = []
+        with self._lock:
+            try:
+                for op in operations:
+                    operate = self._operations.get(op["op"])
+                    if operate is None or op["table"] not in self._tables:
+                        msg = f"{op['op']} on {op['table']} is not simulated"
+                        raise _TransactionFailed(msg, "syntax error")  # noqa: TRY301
+                    results.append(operate(op, named, undo))
+                if undo:
+                    self._collect_garbage(undo)
+            except (_TransactionFailed, KeyError) as exc:
+                for (table, row_uuid), row in undo.items():
+                    self._encoded.pop((table, row_uuid), None)
+                    if row is None:
+                        self._tables[table].pop(row_uuid, None)
+                    else:
+                        self._tables[table][row_uuid] = row
+                error = (
+                    exc.result
+                    if isinstance(exc, _TransactionFailed)
+                    else {"error": "syntax error", "details": str(exc)}
+                )
+                return [*results, error]
+            for key in undo:
+                self._encoded.pop(key, None)
+            if undo:
+                self._apply_vswitchd()
+        return results
+
+    def _ovs_interface(self, container: str, iface: str) -> str:
+        for row in self._tables["Interface"].values():
+            ids = row["external_ids"]
+            if ids.get("container_id") == container and (
+                ids.get("container_iface") == iface
+            ):
+                return row["name"]
+        return ""
+
+    def _ovs_del_port(self, port: str) -> None:
+        port_uuid = next(
+            (u for u, row in self._tables["Port"].items() if row["name"] == port), None
+        )
+        if port_uuid is not None:
+            self._checked_transact(
+                {
+                    "op": "mutate",
+                    "table": "Bridge",
+                    "where": [],
+                    "mutations": [["ports", "delete", ["uuid", port_uuid]]],
+                }
+            )
+
+    def _checked_transact(self, *operations: dict[str, Any]) -> None:
+        results = self.transact(list(operations))
+        if errors := [r for r in results if "error" in r]:
+            msg = f"ovs-vsctl: transaction error: {errors}"
+            raise _CommandFailed(msg)
+
+    # Docker API
+
+    def docker(self, method: str, url: str) -> Any:  # noqa: ANN401
+        """Serve a Docker Engine API request.
+
+        :param method: HTTP method
+        :type method: str
+        :param url: API path including query string
+        :type url: str
+        :return: decoded response body
+        :rtype: Any
+        :raises DockerError: for unknown containers and unsupported requests
+        """
+        self._delay()
+        path = urlsplit(url).path.strip("/").split("/")
+        with self._lock:
+            if method == "GET" and path == ["containers", "json"]:
+                return [
+                    {"Id": c.id, "Names": [f"/{c.name}"], "State": c.state}
+                    for c in self._containers.values()
+                ]
+            if method == "GET" and len(path) == 3 and path[2] == "json":  # noqa: PLR2004
+                for container in self._containers.values():
+                    if path[1] in (container.id, container.name):
+                        return {
+                            "Id": container.id,
+                            "Name": f"/{container.name}",
+                            "State": {
+                                "Status": container.state,
+                                "Running": container.state == "running",
+                                "Pid": container.pid,
+                            },
+                        }
+                msg = f"{method} {url} failed with 404: No such container: {path[1]}"
+                raise DockerError(msg)
+        msg = f"{method} {url} failed with 404: page not found"
+        raise DockerError(msg)
+
+    # Host commands
+
+    async def execute(
+        self, args: list[str], stdin: str | None = None
+    ) -> CompletedProcess[str]:
+        """Run a host command, taking the simulated command latency.
+
+        :param args: command line
+        :type args: list[str]
+        :param stdin: text fed to the command
+        :type stdin: str | None
+        :return: exit status and output of the command
+        :rtype: CompletedProcess[str]
+        """
+        if self.command_latency:
+            await asyncio.sleep(self.command_latency)
+        return self.run(args, stdin)
+
+    def run(self, args: list[str], stdin: str | None = None) -> CompletedProcess[str]:
+        """Run a host command right away.
+
+        ip, bridge, brctl, ovs-vsctl, docker exec, sysctl and the
+        ovs-docker/lxbr-docker helpers are understood, as far as the
+        orchestrator uses them. ``-batch -`` runs the commands read from
+        stdin and stops at the first one failing, like iproute2 does.
+
+        :param args: command line
+        :type args: list[str]
+        :param stdin: text fed to the command
+        :type stdin: str | None
+        :return: exit status and output of the command
+        :rtype: CompletedProcess[str]
+        """
+        binary = args[0].rsplit("/", maxsplit=1)[-1] if args else ""
+        if (handler := self._commands.get(binary)) is None:
+            return CompletedProcess(args, 127, "", f"{binary}: command not found\n")
+        if args[1:] == ["-batch", "-"]:
+            lines = [line.split() for line in (stdin or "").splitlines()]
+        else:
+            lines = [args[1:]]
+        output = []
+        with self._lock:
+            for number, line in enumerate(lines, start=1):
+                try:
+                    output.append(handler(line))
+                except _CommandFailed as exc:
+                    error, returncode = f"{exc}\n", exc.returncode
+                except (IndexError, KeyError, ValueError, NetlinkError) as exc:
+                    error, returncode = f"{binary}: {exc}\n", 1
+                else:
+                    continue
+                if len(lines) > 1 or args[1:2] == ["-batch"]:
+                    error, returncode = f"{error}Command failed -:{number}\n", 1
+                return CompletedProcess(args, returncode, "".join(output), error)
+        return CompletedProcess(args, 0, "".join(output), "")
+
+    @staticmethod
+    def _options(args: list[str]) -> tuple[dict[str, str], set[str]]:
+        """Split ``key value`` pairs from flags, e.g. ``dev eth1 vid 10 pvid``."""
+        values: dict[str, str] = {}
+        flags: set[str] = set()
+        words = iter(args)
+        for word in words:
+            if word in ("dev", "vid"):
+                values[word] = next(words)
+            else:
+                flags.add(word)
+        return values, flags
+
+    def _ip(self, ns: SimNamespace, args: list[str]) -> str:
+        if args[:2] == ["link", "show"]:
+            if (link := ns.links.get(args[2])) is None:
+                msg = f'Device "{args[2]}" does not exist.'
+                raise _CommandFailed(msg)
+            state = "UP" if link.flags & IFF_UP else "DOWN"
+            return f"{link.index}: {link.name}: mtu {link.mtu} state {state}\n"
+        if args[:2] in (["link", "del"], ["link", "delete"]):
+            if (link := ns.links.get(args[2])) is None:
+                msg = f'Cannot find device "{args[2]}"'
+                raise _CommandFailed(msg)
+            self._remove_link(ns, link)
+            return ""
+        if args[:2] == ["link", "set"] and "vlan_filtering" in args:
+            if (link := ns.links.get(args[2])) is None:
+                msg = f'Cannot find device "{args[2]}"'
+                raise _CommandFailed(msg)
+            link.vlan_filtering = args[args.index("vlan_filtering") + 1] == "1"
+            return ""
+        msg = f"ip {' '.join(args)}: not simulated"
+        raise _CommandFailed(msg, 255)
+
+    @staticmethod
+    def _vlan_entries(vlans: list[tuple[int, str]], compress: bool) -> list[dict]:
+        """Return the VLANs of a port as ``bridge -j [-c] vlan show`` does."""
+        entries: list[dict[str, Any]] = []
+        for vid, flags in vlans:
+            words = ["PVID"] if flags.startswith("PVID") else []
+            if flags.endswith(_UNTAGGED):
+                words.append(_UNTAGGED)
+            last = entries[-1] if entries else None
+            if (
+                compress
+                and last is not None
+                and last.get("flags") == (words or None)
+                and last.get("vlanEnd", last["vlan"]) == vid - 1
+            ):
+                last["vlanEnd"] = vid
+                continue
+            entries.append({"vlan": vid, "flags": words} if words else {"vlan": vid})
+        return entries
+
+    def _bridge_vlan_show(
+        self, ns: SimNamespace, dev: str | None, json_: bool, compress: bool
+    ) -> str:
+        ports = [
+            (port, sorted(vlans.items()))
+            for port, vlans in ns.vlans.items()
+            if dev in (None, port) and vlans
+        ]
+        if json_:
+            return json.dumps(
+                [
+                    {"ifname": port, "vlans": self._vlan_entries(vlans, compress)}
+                    for port, vlans in ports
+                ]
+            )
+        lines = ["port              vlan-id  "]
+        for port, vlans in ports:
+            for i, (vid, flags) in enumerate(vlans):
+                name = port if i == 0 else ""
+                lines.append(f"{name:<17} {vid} {flags}".rstrip())
+        return "\n".join(lines) + "\n"
+
+    def _bridge(self, args: list[str]) -> str:
+        ns = self._namespaces[HOST_NETNS]
+        json_, compress = "-j" in args, "-c" in args
+        args = [arg for arg in args if arg not in ("-j", "-c")]
+        if args[:1] != ["vlan"] or len(args) < 2:  # noqa: PLR2004
+            msg = f"bridge {' '.join(args)}: not simulated"
+            raise _CommandFailed(msg, 255)
+        action = args[1]
+        values, flags = self._options(args[2:])
+        if action == "show":
+            return self._bridge_vlan_show(ns, values.get("dev"), json_, compress)
+        return self._bridge_vlan_change(ns, action, values, flags)
+
+    @staticmethod
+    def _bridge_vlan_change(
+        ns: SimNamespace, action: str, values: dict[str, str], flags: set[str]
+    ) -> str:
+        link = ns.links.get(values["dev"])
+        if link is None or not link.master:
+            msg = f'Cannot find bridge device "{values["dev"]}"'
+            raise _CommandFailed(msg, 255)
+        vlans = ns.vlans.setdefault(link.name, {})
+        first, _, last = values["vid"].partition("-")
+        vids = range(int(first), int(last or first) + 1)
+        if action == "add":
+            if "pvid" in flags:
+                if len(vids) > 1:
+                    msg = "pvid cannot be configured for a vlan range"
+                    raise _CommandFailed(msg, 255)
+                for other, value in vlans.items():
+                    vlans[other] = value.removeprefix("PVID").strip()
+            words = ["PVID"] if "pvid" in flags else []
+            if "untagged" in flags:
+                words.append(_UNTAGGED)
+            vlans.update(dict.fromkeys(vids, " ".join(words)))
+            return ""
+        if action in ("del", "delete"):
+            # The kernel ignores VLANs that are not configured.
+            for vid in vids:
+                vlans.pop(vid, None)
+            return ""
+        msg = f'Command "{action}" is unknown, try "bridge vlan help".'
+        raise _CommandFailed(msg, 255)
+
+    def _brctl(self, args: list[str]) -> str:
+        ns = self._namespaces[HOST_NETNS]
+        action, names = args[0], args[1:]
+        bridges = [link for link in ns.links.values() if link.kind == "bridge"]
+        if action == "show":
+            shown = [b for b in bridges if not names or b.name in names]
+            for name in names:
+                if name not in {b.name for b in bridges}:
+                    msg = f"bridge {name} does not exist!"
+                    raise _CommandFailed(msg)
+            lines = ["bridge name\tbridge id\t\tSTP enabled\tinterfaces"]
+            lines += [f"{b.name}\t\t8000.000000000000\tno\t\t" for b in shown]
+            return "\n".join(lines) + "\n"
+        name = names[0]
+        if action == "addbr":
+            if name in ns.links:
+                msg = f"device {name} already exists; can't create bridge with the same name"
+                raise _CommandFailed(msg)
+            self._new_link(ns, name, kind="bridge")
+            return ""
+        if action == "delbr":
+            if (link := ns.links.get(name)) is None or link.kind != "bridge":
+                msg = f"bridge {name} doesn't exist; can't delete it"
+                raise _CommandFailed(msg)
+            if link.flags & IFF_UP:
+                msg = f"bridge {name} is still up; can't delete it"
+                raise _CommandFailed(msg)
+            self._remove_link(ns, link)
+            return ""
+        msg = f"brctl {action}: not simulated"
+        raise _CommandFailed(msg)
+
+    def _ovs_vsctl(self, args: list[str]) -> str:
+        words = [arg for arg in args if not arg.startswith("--")]
+        if words[:1] != ["del-br"]:
+            msg = f"ovs-vsctl {' '.join(args)}: not simulated"
+            raise _CommandFailed(msg)
+        bridge = next(
+            (u for u, row in self._tables["Bridge"].items() if row["name"] == words[1]),
+            None,
+        )
+        if bridge is None:
+            if "--if-exists" in args:
+                return ""
+            msg = f"ovs-vsctl: no bridge named {words[1]}"
+            raise _CommandFailed(msg)
+        self._checked_transact(
+            {
+                "op": "mutate",
+                "table": "Open_vSwitch",
+                "where": [],
+                "mutations": [["bridges", "delete", ["uuid", bridge]]],
+            }
+        )
+        return ""
+
+    def _docker(self, args: list[str]) -> str:
+        if args[:1] != ["exec"]:
+            msg = f"docker {' '.join(args)}: not simulated"
+            raise _CommandFailed(msg)
+        container = self._containers.get(args[1])
+        if container is None or container.state != "running":
+            msg = f"Error response from daemon: No such container: {args[1]}"
+            raise _CommandFailed(msg)
+        if args[2:3] != ["ip"]:
+            msg = f"OCI runtime exec failed: {args[2]}: not simulated"
+            raise _CommandFailed(msg, 126)
+        return self._ip(self._namespaces[container.netns], args[3:])
+
+    def _ovs_docker(self, args: list[str]) -> str:
+        action = args[0]
+        if action == "get-port":
+            return self._ovs_interface(args[1], args[2]) + "\n"
+        if action not in ("del-port", "set-vlan", "set-trunk"):
+            msg = f"ovs-docker {action}: not simulated"
+            raise _CommandFailed(msg)
+        _, iface, container, *value = args[1:]
+        if not (port := self._ovs_interface(container, iface)):
+            msg = (
+                "ovs-docker: Failed to find any attached port for "
+                f"CONTAINER={container} and INTERFACE={iface}"
+            )
+            raise _CommandFailed(msg)
+        if action == "del-port":
+            self._ovs_del_port(port)
+            host = self._namespaces[HOST_NETNS]
+            if (link := host.links.get(port)) is None:
+                msg = f'Cannot find device "{port}"'
+                raise _CommandFailed(msg)
+            self._remove_link(host, link)
+            return ""
+        column, setting = (
+            ("tag", int(value[0]))
+            if action == "set-vlan"
+            else ("trunks", ["set", vlan_ids(parse_vlans(value[0]))])
+        )
+        self._checked_transact(
+            {
+                "op": "update",
+                "table": "Port",
+                "where": [["name", "==", port]],
+                "row": {column: setting},
+            }
+        )
+        return ""
+
+    def _lxbr_docker(self, args: list[str]) -> str:
+        action = args[0]
+        host = self._namespaces[HOST_NETNS]
+        if action == "get-port":
+            port = lxbr_port_name(args[1], args[2])
+            return f"{port}\n" if port in host.links else "\n"
+        if action not in ("del-port", "set-vlan", "set-trunk"):
+            msg = f"lxbr-docker {action}: not simulated"
+            raise _CommandFailed(msg)
+        _, iface, container, *value = args[1:]
+        port = lxbr_port_name(container, iface)
+        if port not in host.links:
+            msg = (
+                "lxbr-docker: Failed to find any attached port for "
+                f"CONTAINER={container} and INTERFACE={iface}"
+            )
+            raise _CommandFailed(msg)
+        if action == "del-port":
+            self._remove_link(host, host.links[port])
+            return ""
+        # The helper does not stop on errors, only the last command counts.
+        with suppress(_CommandFailed):
+            self._bridge(["vlan", "del", "vid", "1", "dev", port])
+        if action == "set-vlan":
+            self._bridge(
+                ["vlan", "add", "vid", value[0], "dev", port, "pvid", "untagged"]
+            )
+        else:
+            for vid in value[0].split(","):
+                self._bridge(["vlan", "add", "vid", vid, "dev", port])
+        return ""
+
+
+class SimNetlink(Netlink):
+    """rtnetlink client answered by the simulated host."""
+
+    def __init__(self, host: SimHost, netns: str = HOST_NETNS) -> None:
+        """Bind a client to a simulated network namespace.
+
+        :param host: simulated host
+        :type host: SimHost
+        :param netns: network namespace file
+        :type netns: str
+        """
+        super().__init__()
+        self._host = host
+        self._netns = netns
+
+    @contextmanager
+    def netns(self, path: str) -> Iterator[Netlink]:
+        """Return a client bound to another simulated namespace.
+
+        :param path: network namespace file
+        :type path: str
+        :yield: client for the namespace
+        """
+        self._host.netns_id(path)
+        yield SimNetlink(self._host, path)
+
+    @contextmanager
+    def _netns_fd(self, path: str) -> Iterator[int]:
+        yield self._host.netns_id(path)
+
+    def _request(self, msg_type: int, flags: int, payload: bytes) -> list[bytes]:
+        return self._host.netlink(self._netns, msg_type, flags, payload)
+
+    def enable_ipv6(self, name: str) -> None:
+        """Enable IPv6 on a link.
+
+        :param name: link name
+        :type name: str
+        """
+        self._host.enable_ipv6(self._netns, name)
+
+
+class SimOvsdbClient(OvsdbClient):
+    """OVSDB client answered by the simulated host."""
+
+    def __init__(self, host: SimHost) -> None:
+        """Attach a client to the simulated OVS database.
+
+        :param host: simulated host
+        :type host: SimHost
+        """
+        super().__init__(remote="sim:")
+        self._host = host
+
+    def _call(self, method: str, params: list[Any]) -> Any:  # noqa: ANN401
+        if method == "echo":
+            return params
+        if method == "transact":
+            return self._host.transact(params[1:])
+        msg = f"Unsupported OVSDB method: {method}"
+        raise OvsdbError(msg)
+
+
+class SimDockerClient(DockerClient):
+    """Docker Engine API client answered by the simulated host."""
+
+    def __init__(self, host: SimHost) -> None:
+        """Attach a client to the simulated containers.
+
+        :param host: simulated host
+        :type host: SimHost
+        """
+        super().__init__()
+        self._host = host
+
+    def _request(self, method: str, url: str) -> Any:  # noqa: ANN401
+        return self._host.docker(method, url)
+
+
+@cache
+def get_sim_host() -> SimHost:
+    """Return the shared simulated host.
+
+    :return: host with SIMULATED_COMMAND_LATENCY seconds per host command
+    :rtype: SimHost
+    """
+    return SimHost(command_latency=SIMULATED_COMMAND_LATENCY)
@@ -0,0 +1,578 @@
+"""Persistent orchestrator state.
+
+This part keeps the bridge IP ranges, address leases and the VLAN settings
+applied to bridge ports and container interfaces in an SQLite database in
+WAL mode. Every lookup the orchestrator makes is served by an index, and
+readers never wait for a writer.
+
+Each thread uses its own connection. Single mutations are committed on
+their own, ``transaction()`` groups several of them.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from collections.abc import ItemsView, Iterator, MutableMapping
+from contextlib import contextmanager
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+from app.utils import DB_PATH, BridgeInfoDict, ContainerInfoDict, get_logger
+
+_LOGGER = get_logger("store")
+
+# Owner of bridge level ports (parents and veth pair ends)
+BRIDGE_PORT = ""
+IFACE_COLUMNS = ("trunk", "native", "vlan", "vlan_mode")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ranges (
+    bridge TEXT NOT NULL,
+    family TEXT NOT NULL,
+    ip_range TEXT NOT NULL,
+    PRIMARY KEY (bridge, family)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    bridge TEXT NOT NULL,
+    family TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    address TEXT NOT NULL,
+    PRIMARY KEY (bridge, family, owner)
+);
+CREATE INDEX IF NOT EXISTS leases_address ON leases (bridge, family, address);
+CREATE TABLE IF NOT EXISTS ifaces (
+    bridge TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    iface TEXT NOT NULL,
+    trunk TEXT,
+    native TEXT,
+    vlan TEXT,
+    vlan_mode TEXT,
+    PRIMARY KEY (bridge, owner, iface)
+);
+CREATE INDEX IF NOT EXISTS ifaces_owner ON ifaces (owner, iface);
+CREATE INDEX IF NOT EXISTS ifaces_iface ON ifaces (iface);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class Store:
+    """SQLite backed state store."""
+
+    def __init__(self, path: Path = DB_PATH) -> None:
+        """Open the database and create the schema if needed.
+
+        :param path: database file
+        :type path: Path
+        """
+        self._path = path
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        if (conn := getattr(self._local, "conn", None)) is None:
+            conn = sqlite3.connect(self._path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Group mutations into one transaction.
+
+        Nested calls from the same thread join the outermost transaction,
+        which is committed when it exits cleanly and rolled back on error.
+
+        :yield: the connection of the calling thread
+        """
+        conn = self._conn()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.depth = 0
+
+    def _read(self, sql: str, *params: Any) -> list[tuple]:  # noqa: ANN401
+        return self._conn().execute(sql, params).fetchall()
+
+    def _write(self, sql: str, *params: Any) -> None:  # noqa: ANN401
+        with self.transaction() as conn:
+            conn.execute(sql, params)
+
+    def known_bridge(self, bridge: str) -> bool:
+        """Check if anything is recorded for a bridge.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :return: True if the bridge has a range or interfaces
+        :rtype: bool
+        """
+        return bool(
+            self._read("SELECT 1 FROM ranges WHERE bridge = ? LIMIT 1", bridge)
+            or self._read("SELECT 1 FROM ifaces WHERE bridge = ? LIMIT 1", bridge)
+        )
+
+    def get_range(self, bridge: str, family: str = "ip") -> str | None:
+        """Return the IP range of a bridge.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param family: "ip" for IPv4 or "ip6" for IPv6
+        :type family: str
+        :return: IP network or None if the bridge has no range
+        :rtype: str | None
+        """
+        rows = self._read(
+            "SELECT ip_range FROM ranges WHERE bridge = ? AND family = ?",
+            bridge,
+            family,
+        )
+        return rows[0][0] if rows else None
+
+    def set_range(self, bridge: str, family: str, ip_range: str | None) -> None:
+        """Change the IP range of a bridge and drop all leases of the old one.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param family: "ip" for IPv4 or "ip6" for IPv6
+        :type family: str
+        :param ip_range: IP network, None removes the range
+        :type ip_range: str | None
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                "DELETE FROM leases WHERE bridge = ? AND family = ?", (bridge, family)
+            )
+            if ip_range is None:
+                conn.execute(
+                    "DELETE FROM ranges WHERE bridge = ? AND family = ?",
+                    (bridge, family),
+                )
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ranges VALUES (?, ?, ?)",
+                    (bridge, family, ip_range),
+                )
+
+    def range_usage(self) -> list[tuple[str, str, str, int]]:
+        """Return every bridge range with its number of leases.
+
+        :return: (bridge, family, IP network, lease count) tuples
+        :rtype: list[tuple[str, str, str, int]]
+        """
+        return self._read(
+            "SELECT r.bridge, r.family, r.ip_range, COUNT(l.owner) FROM ranges r "
+            "LEFT JOIN leases l ON l.bridge = r.bridge AND l.family = r.family "
+            "GROUP BY r.bridge, r.family ORDER BY r.bridge, r.family"
+        )
+
+    def leases(self, bridge: str, family: str = "ip") -> LeaseMap:
+        """Return the address leases of a bridge range.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param family: "ip" for IPv4 or "ip6" for IPv6
+        :type family: str
+        :return: live mapping of owner to address
+        :rtype: LeaseMap
+        """
+        return LeaseMap(self, bridge, family)
+
+    def lease(self, bridge: str, family: str, owner: str) -> str | None:
+        """Return the address leased to an owner.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param family: "ip" for IPv4 or "ip6" for IPv6
+        :type family: str
+        :param owner: container or bridge name
+        :type owner: str
+        :return: address with prefix length, or None if there is no lease
+        :rtype: str | None
+        """
+        rows = self._read(
+            "SELECT address FROM leases WHERE bridge = ? AND family = ? AND owner = ?",
+            bridge,
+            family,
+            owner,
+        )
+        return rows[0][0] if rows else None
+
+    def set_lease(
+        self, bridge: str, family: str, owner: str, address: str | None
+    ) -> None:
+        """Lease an address to an owner, replacing its previous lease.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param family: "ip" for IPv4 or "ip6" for IPv6
+        :type family: str
+        :param owner: container or bridge name
+        :type owner: str
+        :param address: address with prefix length, None releases the lease
+        :type address: str | None
+        """
+        if address is None:
+            self._write(
+                "DELETE FROM leases WHERE bridge = ? AND family = ? AND owner = ?",
+                bridge,
+                family,
+                owner,
+            )
+        else:
+            self._write(
+                "INSERT OR REPLACE INTO leases VALUES (?, ?, ?, ?)",
+                bridge,
+                family,
+                owner,
+                address,
+            )
+
+    def all_leases(self, bridge: str, family: str = "ip") -> dict[str, str]:
+        """Return all leases of a bridge range.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param family: "ip" for IPv4 or "ip6" for IPv6
+        :type family: str
+        :return: owner to address
+        :rtype: dict[str, str]
+        """
+        return dict(
+            self._read(
+                "SELECT owner, address FROM leases WHERE bridge = ? AND family = ?",
+                bridge,
+                family,
+            )
+        )
+
+    def owner_of(self, bridge: str, family: str, address: str) -> str | None:
+        """Return the owner of a leased address.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param family: "ip" for IPv4 or "ip6" for IPv6
+        :type family: str
+        :param address: address with prefix length
+        :type address: str
+        :return: owner or None if the address is not leased
+        :rtype: str | None
+        """
+        rows = self._read(
+            "SELECT owner FROM leases WHERE bridge = ? AND family = ? AND address = ?",
+            bridge,
+            family,
+            address,
+        )
+        return rows[0][0] if rows else None
+
+    def iface(self, bridge: str, owner: str, iface: str) -> dict[str, str] | None:
+        """Return the VLAN settings recorded for an interface.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param owner: container name, or BRIDGE_PORT for bridge level ports
+        :type owner: str
+        :param iface: interface name
+        :type iface: str
+        :return: settings that are set, or None if the interface is unknown
+        :rtype: dict[str, str] | None
+        """
+        rows = self._read(
+            f"SELECT {', '.join(IFACE_COLUMNS)} FROM ifaces "  # noqa: S608
+            "WHERE bridge = ? AND owner = ? AND iface = ?",
+            bridge,
+            owner,
+            iface,
+        )
+        if not rows:
+            return None
+        return {
+            key: value
+            for key, value in zip(IFACE_COLUMNS, rows[0], strict=True)
+            if value is not None
+        }
+
+    def set_iface(self, bridge: str, owner: str, iface: str, **columns: str) -> None:
+        """Record an interface and update its VLAN settings.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param owner: container name, or BRIDGE_PORT for bridge level ports
+        :type owner: str
+        :param iface: interface name
+        :type iface: str
+        :param columns: settings to change, see IFACE_COLUMNS
+        :type columns: str
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO ifaces (bridge, owner, iface) VALUES (?, ?, ?)",
+                (bridge, owner, iface),
+            )
+            for key, value in columns.items():
+                if key not in IFACE_COLUMNS:
+                    msg = f"Unknown interface setting {key}"
+                    raise KeyError(msg)
+                conn.execute(
+                    f"UPDATE ifaces SET {key} = ? "  # noqa: S608
+                    "WHERE bridge = ? AND owner = ? AND iface = ?",
+                    (value, bridge, owner, iface),
+                )
+
+    def remove_iface(self, bridge: str, owner: str, iface: str) -> None:
+        """Forget an interface and its VLAN settings.
+
+        :param bridge: bridge name
+        :type bridge: str
+        :param owner: container name, or BRIDGE_PORT for bridge level ports
+        :type owner: str
+        :param iface: interface name
+        :type iface: str
+        """
+        self._write(
+            "DELETE FROM ifaces WHERE bridge = ? AND owner = ? AND iface = ?",
+            bridge,
+            owner,
+            iface,
+        )
+
+    def remove_bridge(self, bridge: str) -> None:
+        """Forget a bridge with its IP ranges, leases and interfaces.
+
+        :param bridge: bridge name
+        :type bridge: str
+        """
+        with self.transaction() as conn:
+            for table in ("ranges", "leases", "ifaces"):
+                conn.execute(f"DELETE FROM {table} WHERE bridge = ?", (bridge,))  # noqa: S608
+
+    def container_ifaces(self, container: str) -> list[tuple[str, str]]:
+        """Return the interfaces recorded for a container.
+
+        :param container: container name
+        :type container: str
+        :return: (bridge, interface) pairs
+        :rtype: list[tuple[str, str]]
+        """
+        return [
+            (bridge, iface)
+            for bridge, iface in self._read(
+                "SELECT bridge, iface FROM ifaces WHERE owner = ?", container
+            )
+        ]
+
+    def get_meta(self, key: str, default: str = "") -> str:
+        """Return a metadata value.
+
+        :param key: metadata key
+        :type key: str
+        :param default: value returned if the key is not set
+        :type default: str
+        :return: stored value
+        :rtype: str
+        """
+        rows = self._read("SELECT value FROM meta WHERE key = ?", key)
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key: str, value: str) -> None:
+        """Set a metadata value.
+
+        :param key: metadata key
+        :type key: str
+        :param value: value to store
+        :type value: str
+        """
+        self._write("INSERT OR REPLACE INTO meta VALUES (?, ?)", key, value)
+
+
+class LeaseMap(MutableMapping[str, str]):
+    """Owner to address view of the leases of one bridge range."""
+
+    def __init__(self, store: Store, bridge: str, family: str) -> None:
+        """Bind the view to a bridge range.
+
+        :param store: state store
+        :type store: Store
+        :param bridge: bridge name
+        :type bridge: str
+        :param family: "ip" for IPv4 or "ip6" for IPv6
+        :type family: str
+        """
+        self._store = store
+        self._bridge = bridge
+        self._family = family
+
+    def __getitem__(self, owner: str) -> str:
+        """Return the address leased to an owner.
+
+        :param owner: container or bridge name
+        :type owner: str
+        :return: address with prefix length
+        :rtype: str
+        :raises KeyError: if the owner holds no lease
+        """
+        if (address := self._store.lease(self._bridge, self._family, owner)) is None:
+            raise KeyError(owner)
+        return address
+
+    def __setitem__(self, owner: str, address: str) -> None:
+        """Lease an address to an owner.
+
+        :param owner: container or bridge name
+        :type owner: str
+        :param address: address with prefix length
+        :type address: str
+        """
+        self._store.set_lease(self._bridge, self._family, owner, address)
+
+    def __delitem__(self, owner: str) -> None:
+        """Release the lease of an owner.
+
+        :param owner: container or bridge name
+        :type owner: str
+        """
+        self._store.set_lease(self._bridge, self._family, owner, None)
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the owners.
+
+        :return: owner iterator
+        :rtype: Iterator[str]
+        """
+        return iter(self._store.all_leases(self._bridge, self._family))
+
+    def __len__(self) -> int:
+        """Return the number of leases.
+
+        :return: lease count
+        :rtype: int
+        """
+        return len(self._store.all_leases(self._bridge, self._family))
+
+    def items(self) -> ItemsView[str, str]:  # type: ignore[override]
+        """Return all leases with a single query.
+
+        :return: (owner, address) pairs
+        :rtype: ItemsView[str, str]
+        """
+        return self._store.all_leases(self._bridge, self._family).items()
+
+
+@cache
+def get_store() -> Store:
+    """Return the shared state store.
+
+    :return: store bound to DB_PATH
+    :rtype: Store
+    """
+    return Store()
+
+
+def validate_bridge(bridge_name: str, info: BridgeInfoDict) -> bool:
+    """Validate if a bridge already exists in the database.
+
+    If any of its parent interfaces are already part of the existing bridge,
+    then the validation fails
+
+    :param bridge_name: The name of the bridge to be validated.
+    :param info: A dictionary containing the bridge's information,
+                 including its parent interfaces.
+    :return: True if the bridge does not exist or
+             no parent interfaces are conflicting,
+             False otherwise.
+    """
+    store = get_store()
+    if store.known_bridge(bridge_name):
+        _LOGGER.debug("Bridge Already exists: %s", bridge_name)
+        for parent in info["parents"]:
+            if store.iface(bridge_name, BRIDGE_PORT, parent["iface"]) is not None:
+                _LOGGER.error(
+                    "iface %s exists in bridge: %s",
+                    parent["iface"],
+                    bridge_name,
+                )
+                return False
+    return True
+
+
+def validate_container(container_id: str, info: ContainerInfoDict) -> bool:
+    """Validate if the specified container's interface already exists.
+
+    This function checks whether the given container's interface (`iface`)
+    is already present for the specified container in the associated bridge.
+    If the interface exists, it logs an error and returns `False`.
+
+    :param container_id: container name
+    :type container_id: str
+    :param info: container's information, including its bridge and
+                 interface details.
+    :type info: ContainerInfoDict
+    :return: True if container interface does not exists.
+    """
+    if get_store().iface(info["bridge"], container_id, info["iface"]) is not None:
+        _LOGGER.error(
+            "iface %s already exists for container: %s",
+            info["iface"],
+            container_id,
+        )
+        return False
+    return True
+
+
+def validate_veth_pair(veth_pair_id: str, info: dict) -> bool:
+    """Validate the VETH pair ID.
+
+    This function performs two checks:
+
+    1. Ensures that the `veth_pair_id` does not exceed the
+       predefined length limit of 8 characters.
+    2. Checks if the VETH pair's interface name (e.g., `v0_{veth_pair_id}`)
+       already exists on the specified bridge.
+
+    If any validation fails, it logs an error and returns `False`.
+    Otherwise, it returns `True`.
+
+    :param veth_pair_id: The unique identifier for the VETH pair,
+                         which will be used as a prefix.
+    :type veth_pair_id: str
+    :param info: Dictionary containing details about the VETH pair,
+                 including the target bridge (`info["on"]`).
+    :type info: dict
+    :return: Returns `True` if the validation passes, otherwise `False`.
+    :rtype: bool
+    """
+    prefix_length_limit = 8
+    if len(veth_pair_id) > prefix_length_limit:
+        _LOGGER.error("VETH prefix ID: %s is more than 8 chars", veth_pair_id)
+        return False
+
+    veth_pair_end = f"v0_{veth_pair_id}"
+    if get_store().iface(info["on"], BRIDGE_PORT, veth_pair_end) is not None:
+        _LOGGER.error(
+            "iface %s exists in bridge: %s",
+            veth_pair_id,
+            info["on"],
+        )
+        return False
+    return True
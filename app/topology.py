@@ -0,0 +1,448 @@
+"""Declarative topology changes.
+
+This part compares a complete topology document with the current desired
+state and works out the smallest set of bridges, parents, container
+interfaces and veth pairs to add, change or remove. The plan is either
+returned as a dry run, or applied touching only the objects in it, so
+switching between topologies does not tear down what both have in common.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from app.orchestrator import (
+    add_iface_to_container,
+    create_veth_pair,
+    init_bridge,
+    remove_bridge,
+    remove_iface_from_container,
+    remove_parent,
+    remove_veth_pair,
+    snapshot_host,
+)
+from app.ovs_lib import configure_container_vlan
+from app.utils import (
+    USE_LINUX_BRIDGE,
+    ContainerInfoDict,
+    get_logger,
+    hold_locks,
+    run_item,
+    set_config,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+_LOGGER = get_logger("topology")
+
+# Longest veth pair prefix, see create_veth_pair()
+VETH_PREFIX_LIMIT = 8
+
+
+@dataclass(slots=True)
+class Changes:
+    """Names of the objects to add, change or remove."""
+
+    add: list[str] = field(default_factory=list)
+    change: list[str] = field(default_factory=list)
+    remove: list[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        """Return the number of changed objects.
+
+        :return: changed object count
+        :rtype: int
+        """
+        return len(self.add) + len(self.change) + len(self.remove)
+
+
+@dataclass(slots=True)
+class TopologyPlan:
+    """Minimal change set between two topologies.
+
+    Parents are named ``bridge:parent`` and container interfaces
+    ``container:iface``. Changed container interfaces are re-attached,
+    except those in ``vlans`` which keep their port and only get new VLANs.
+    """
+
+    bridges: Changes = field(default_factory=Changes)
+    parents: Changes = field(default_factory=Changes)
+    container_ifaces: Changes = field(default_factory=Changes)
+    vlans: list[str] = field(default_factory=list)
+    veth_pairs: Changes = field(default_factory=Changes)
+
+    def __len__(self) -> int:
+        """Return the number of changed objects.
+
+        :return: changed object count
+        :rtype: int
+        """
+        return (
+            len(self.bridges)
+            + len(self.parents)
+            + len(self.container_ifaces)
+            + len(self.vlans)
+            + len(self.veth_pairs)
+        )
+
+
+def _clean(value: Any) -> Any:  # noqa: ANN401
+    """Drop unset (None) fields, recursively.
+
+    :param value: config value
+    :type value: Any
+    :return: value without None fields
+    :rtype: Any
+    """
+    if isinstance(value, dict):
+        return {k: _clean(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_clean(v) for v in value]
+    return value
+
+
+def normalize_topology(config: dict[str, Any]) -> dict[str, Any]:
+    """Return a topology with unset fields and defaults spelled out the same way.
+
+    :param config: topology, as returned by get_config()
+    :type config: dict[str, Any]
+    :return: normalized copy of the topology
+    :rtype: dict[str, Any]
+    """
+    config = _clean(config)
+    bridges = {}
+    for name, info in config.get("bridge", {}).items():
+        bridges[name] = {k: v for k, v in info.items() if k != "parents" or v}
+    return {
+        "bridge": bridges,
+        "container": config.get("container", {}),
+        "veth_pairs": {
+            prefix: {"map": ":", "trunk": "no", **info}
+            for prefix, info in config.get("veth_pairs", {}).items()
+        },
+    }
+
+
+def container_ifaces(config: dict[str, Any]) -> dict[str, ContainerInfoDict]:
+    """Return the container interfaces of a topology by ``container:iface``.
+
+    :param config: topology, as returned by get_config()
+    :type config: dict[str, Any]
+    :return: container interface details
+    :rtype: dict[str, ContainerInfoDict]
+    """
+    return {
+        f"{container}:{info['iface']}": info
+        for container, ifaces in config.get("container", {}).items()
+        for info in ifaces
+    }
+
+
+def _diff(current: dict[str, Any], desired: dict[str, Any]) -> Changes:
+    return Changes(
+        add=sorted(desired.keys() - current.keys()),
+        change=sorted(
+            name
+            for name in desired.keys() & current.keys()
+            if current[name] != desired[name]
+        ),
+        remove=sorted(current.keys() - desired.keys()),
+    )
+
+
+def _merge(
+    entries: dict[str, Any], old: dict[str, Any], new: dict[str, Any]
+) -> dict[str, Any]:
+    changes = _diff(old, new)
+    merged = {k: v for k, v in entries.items() if k not in changes.remove}
+    merged.update({name: new[name] for name in changes.add + changes.change})
+    return merged
+
+
+def _parents(info: dict[str, Any]) -> dict[str, Any]:
+    return {parent["iface"]: parent for parent in info.get("parents", [])}
+
+
+def _vlan_only(current: ContainerInfoDict, desired: ContainerInfoDict) -> bool:
+    """Check if an interface can keep its port and only change VLANs.
+
+    OVS ports take a new tag or trunk in place. Clearing a VLAN, or any
+    change on a Linux bridge, needs the interface to be re-attached.
+
+    :param current: current interface details
+    :type current: ContainerInfoDict
+    :param desired: desired interface details
+    :type desired: ContainerInfoDict
+    :return: True if only vlan/trunk change to new non-empty values
+    :rtype: bool
+    """
+    changed = {
+        key
+        for key in current.keys() | desired.keys()
+        if current.get(key) != desired.get(key)
+    }
+    return (
+        not USE_LINUX_BRIDGE
+        and changed <= {"vlan", "trunk"}
+        and all(desired.get(key) for key in changed)
+    )
+
+
+def check_topology(config: dict[str, Any]) -> list[str]:
+    """Check that a topology is consistent on its own.
+
+    :param config: normalized topology
+    :type config: dict[str, Any]
+    :return: error messages, empty if the topology is valid
+    :rtype: list[str]
+    """
+    errors = []
+    bridges = config["bridge"]
+    for container, ifaces in config["container"].items():
+        names = [info["iface"] for info in ifaces]
+        errors += [
+            f"{container}:{iface}: listed more than once"
+            for iface in sorted(set(names))
+            if names.count(iface) > 1
+        ]
+        errors += [
+            f"{container}:{info['iface']}: unknown bridge {info.get('bridge')}"
+            for info in ifaces
+            if info.get("bridge") not in bridges
+        ]
+    for prefix, info in config["veth_pairs"].items():
+        if len(prefix) > VETH_PREFIX_LIMIT:
+            errors.append(f"{prefix}: more than {VETH_PREFIX_LIMIT} characters")
+        if info["on"] not in bridges:
+            errors.append(f"{prefix}: unknown bridge {info['on']}")
+    return errors
+
+
+def plan_topology(current: dict[str, Any], desired: dict[str, Any]) -> TopologyPlan:
+    """Work out the minimal change set from one topology to another.
+
+    :param current: normalized current topology
+    :type current: dict[str, Any]
+    :param desired: normalized desired topology
+    :type desired: dict[str, Any]
+    :return: objects to add, change or remove
+    :rtype: TopologyPlan
+    """
+    plan = TopologyPlan(bridges=_diff(current["bridge"], desired["bridge"]))
+    for bridge in plan.bridges.change:
+        parents = _diff(
+            _parents(current["bridge"][bridge]), _parents(desired["bridge"][bridge])
+        )
+        plan.parents.add += [f"{bridge}:{p}" for p in parents.add]
+        plan.parents.change += [f"{bridge}:{p}" for p in parents.change]
+        plan.parents.remove += [f"{bridge}:{p}" for p in parents.remove]
+
+    current_ifaces, desired_ifaces = (
+        container_ifaces(current),
+        container_ifaces(desired),
+    )
+    plan.container_ifaces = _diff(current_ifaces, desired_ifaces)
+    plan.vlans = [
+        key
+        for key in plan.container_ifaces.change
+        if _vlan_only(current_ifaces[key], desired_ifaces[key])
+    ]
+    plan.container_ifaces.change = [
+        key for key in plan.container_ifaces.change if key not in plan.vlans
+    ]
+
+    plan.veth_pairs = _diff(current["veth_pairs"], desired["veth_pairs"])
+    return plan
+
+
+def merge_topology(
+    base: dict[str, Any], old: dict[str, Any], new: dict[str, Any]
+) -> dict[str, Any]:
+    """Apply the difference between two topologies on top of a third one.
+
+    Bridges, container interfaces and veth pairs added or changed from old
+    to new are set in base, and those removed are dropped from it. Entries
+    of base that neither topology mentions are kept as they are.
+
+    :param base: normalized topology to change
+    :type base: dict[str, Any]
+    :param old: normalized topology the change starts from
+    :type old: dict[str, Any]
+    :param new: normalized topology the change ends at
+    :type new: dict[str, Any]
+    :return: normalized merged topology
+    :rtype: dict[str, Any]
+    """
+    containers: dict[str, list[ContainerInfoDict]] = {}
+    ifaces = _merge(
+        container_ifaces(base), container_ifaces(old), container_ifaces(new)
+    )
+    for key, info in ifaces.items():
+        containers.setdefault(key.split(":")[0], []).append(info)
+    return {
+        "bridge": _merge(base["bridge"], old["bridge"], new["bridge"]),
+        "container": containers,
+        "veth_pairs": _merge(base["veth_pairs"], old["veth_pairs"], new["veth_pairs"]),
+    }
+
+
+async def _in_order(steps: list[Awaitable[None]]) -> None:
+    for step in steps:
+        await step
+
+
+async def _grouped(groups: dict[str, list[Awaitable[None]]]) -> None:
+    """Run the steps of each group in order, and the groups concurrently.
+
+    :param groups: steps per container or bridge
+    :type groups: dict[str, list[Awaitable[None]]]
+    """
+    await asyncio.gather(*(_in_order(steps) for steps in groups.values()))
+
+
+class _Apply:
+    """One run of a plan, collecting the error of every failed object."""
+
+    def __init__(
+        self, plan: TopologyPlan, current: dict[str, Any], desired: dict[str, Any]
+    ) -> None:
+        self.plan = plan
+        self.current = current
+        self.desired = desired
+        self.current_ifaces = container_ifaces(current)
+        self.desired_ifaces = container_ifaces(desired)
+        self.errors: dict[str, str] = {}
+
+    async def _step(
+        self,
+        name: str,
+        func: Callable[..., Awaitable[None]],
+        *args: Any,  # noqa: ANN401
+    ) -> None:
+        if (error := await run_item(func, *args)) is not None:
+            self.errors[name] = error
+
+    def locks(self) -> tuple[set[str], set[str]]:
+        """Return the bridges and containers the plan touches.
+
+        :return: bridge names, container names
+        :rtype: tuple[set[str], set[str]]
+        """
+        plan, veth_pairs = self.plan, self.plan.veth_pairs
+        bridges = {*plan.bridges.add, *plan.bridges.change, *plan.bridges.remove}
+        bridges |= {
+            self.current["veth_pairs"][prefix]["on"]
+            for prefix in veth_pairs.change + veth_pairs.remove
+        }
+        bridges |= {
+            self.desired["veth_pairs"][prefix]["on"]
+            for prefix in veth_pairs.change + veth_pairs.add
+        }
+        ifaces = plan.container_ifaces
+        containers = {
+            key.split(":")[0]
+            for key in ifaces.add + ifaces.change + ifaces.remove + plan.vlans
+        }
+        return bridges, containers
+
+    async def detach(self) -> None:
+        """Detach container interfaces and veth pairs removed or re-created."""
+        snap = await snapshot_host()
+        ifaces, veth_pairs = self.plan.container_ifaces, self.plan.veth_pairs
+        groups: dict[str, list[Awaitable[None]]] = {}
+        for key in ifaces.remove + ifaces.change:
+            container = key.split(":")[0]
+            info = self.current_ifaces[key]
+            groups.setdefault(container, []).append(
+                self._step(key, remove_iface_from_container, container, info, snap)
+            )
+        for prefix in veth_pairs.remove + veth_pairs.change:
+            bridge = self.current["veth_pairs"][prefix]["on"]
+            groups.setdefault(f"bridge:{bridge}", []).append(
+                self._step(prefix, remove_veth_pair, bridge, prefix)
+            )
+        await _grouped(groups)
+
+    async def bridges(self) -> None:
+        """Remove, change or add bridges and their parents."""
+        plan = self.plan
+        groups: dict[str, list[Awaitable[None]]] = {}
+        for bridge in plan.bridges.remove:
+            groups[bridge] = [self._step(bridge, remove_bridge, bridge)]
+        for key in plan.parents.remove:
+            bridge, parent = key.split(":", 1)
+            groups.setdefault(bridge, []).append(
+                self._step(key, remove_parent, bridge, parent)
+            )
+        for bridge in plan.bridges.change + plan.bridges.add:
+            info = self.desired["bridge"][bridge]
+            groups.setdefault(bridge, []).append(
+                self._step(bridge, init_bridge, bridge, info)
+            )
+        await _grouped(groups)
+
+    async def attach(self) -> None:
+        """Attach new or re-created container interfaces and veth pairs."""
+        snap = await snapshot_host()
+        ifaces, veth_pairs = self.plan.container_ifaces, self.plan.veth_pairs
+        groups: dict[str, list[Awaitable[None]]] = {}
+        for key in ifaces.add + ifaces.change:
+            container = key.split(":")[0]
+            info = self.desired_ifaces[key]
+            groups.setdefault(container, []).append(
+                self._step(key, add_iface_to_container, container, info, snap)
+            )
+        for key in self.plan.vlans:
+            container = key.split(":")[0]
+            info = self.desired_ifaces[key]
+            groups.setdefault(container, []).append(
+                self._step(key, configure_container_vlan, container, info)
+            )
+        for prefix in veth_pairs.add + veth_pairs.change:
+            veth = self.desired["veth_pairs"][prefix]
+            groups.setdefault(f"bridge:{veth['on']}", []).append(
+                self._step(
+                    prefix,
+                    create_veth_pair,
+                    veth["on"],
+                    prefix,
+                    veth["map"],
+                    veth["trunk"],
+                )
+            )
+        await _grouped(groups)
+
+
+async def apply_topology(
+    plan: TopologyPlan, current: dict[str, Any], desired: dict[str, Any]
+) -> dict[str, str]:
+    """Apply a plan to the host and make the desired topology the config.
+
+    Container interfaces and veth pairs that are removed or re-created are
+    detached first, then bridges are removed, changed or added, and finally
+    the new container interfaces and veth pairs are attached. The caller
+    holds TOPOLOGY_LOCK from reading the current topology until this returns.
+
+    :param plan: plan from current to desired
+    :type plan: TopologyPlan
+    :param current: normalized current topology
+    :type current: dict[str, Any]
+    :param desired: normalized desired topology
+    :type desired: dict[str, Any]
+    :return: error message per failed object, empty if all succeeded
+    :rtype: dict[str, str]
+    """
+    run = _Apply(plan, current, desired)
+    bridges, containers = run.locks()
+    async with hold_locks(bridges, containers):
+        await run.detach()
+        await run.bridges()
+        await run.attach()
+        # The reconciler takes over from here, also retrying what failed.
+        set_config(desired)
+
+    _LOGGER.info("Applied topology: %d changes, %d failed", len(plan), len(run.errors))
+    return run.errors
@@ -0,0 +1,265 @@
+"""Command tracing.
+
+When enabled, every host command and every OVSDB, netlink and Docker API
+request is recorded into a bounded ring buffer: what ran, which function
+issued it, when, for how long, its return code and output size. Records
+are tagged with the reconcile cycle they belong to, so a cycle can be
+broken down per helper or exported as Chrome trace-event JSON and opened
+in Perfetto or chrome://tracing.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any
+
+# Modules issuing the commands on behalf of the real caller
+_PLUMBING = frozenset(
+    {
+        "app.utils",
+        "app.tracing",
+        "app.ovsdb",
+        "app.netlink",
+        "app.docker_api",
+        "contextlib",
+    }
+)
+_CYCLES_KEPT = 64
+
+
+@dataclass(slots=True)
+class CommandRecord:
+    """One traced command or API request."""
+
+    command: str
+    caller: str  # qualified name of the function that issued it
+    start: float  # seconds since the epoch
+    duration: float  # seconds
+    # exit status, negative if killed by a signal, 0 or 1 for API requests
+    returncode: int | None
+    output_size: int  # bytes of stdout and stderr, or of the reply if known
+    cycle: int | None  # reconcile cycle, None outside of cycles
+    thread: str  # asyncio task or worker thread
+
+
+@dataclass(slots=True)
+class CycleRecord:
+    """One traced reconcile cycle."""
+
+    cycle: int
+    scope: str
+    start: float  # seconds since the epoch
+    duration: float | None = None  # None while the cycle runs
+
+
+def _caller() -> str:
+    frame = sys._getframe(2)  # noqa: SLF001
+    while frame is not None and frame.f_globals.get("__name__") in _PLUMBING:
+        frame = frame.f_back
+    return frame.f_code.co_qualname if frame is not None else "?"
+
+
+def _thread() -> str:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return task.get_name() if task is not None else threading.current_thread().name
+
+
+class CommandTracer:
+    """Ring buffer of command records."""
+
+    def __init__(self, size: int, enabled: bool = False) -> None:
+        """Create an empty tracer.
+
+        :param size: number of command records kept
+        :type size: int
+        :param enabled: start recording right away
+        :type enabled: bool
+        """
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._records: deque[CommandRecord] = deque(maxlen=size)
+        self._cycles: deque[CycleRecord] = deque(maxlen=_CYCLES_KEPT)
+        self._cycle: CycleRecord | None = None
+        self._next_cycle = 1
+        # time.time() - time.perf_counter(), to date perf_counter samples
+        self._offset = time.time() - time.perf_counter()
+
+    def record(
+        self,
+        command: str,
+        start: float,
+        duration: float,
+        returncode: int | None,
+        output_size: int,
+    ) -> None:
+        """Record a command, the caller is taken from the stack.
+
+        Call this directly from the function running the command.
+
+        :param command: command line or request, e.g. "ovsdb transact"
+        :type command: str
+        :param start: time.perf_counter() when the command started
+        :type start: float
+        :param duration: seconds the command took
+        :type duration: float
+        :param returncode: exit status, 1 for a failed API request
+        :type returncode: int | None
+        :param output_size: bytes of output
+        :type output_size: int
+        """
+        cycle = self._cycle
+        record = CommandRecord(
+            command=command,
+            caller=_caller(),
+            start=start + self._offset,
+            duration=duration,
+            returncode=returncode,
+            output_size=output_size,
+            cycle=cycle.cycle if cycle is not None else None,
+            thread=_thread(),
+        )
+        with self._lock:
+            self._records.append(record)
+
+    @contextmanager
+    def cycle(self, scope: str) -> Iterator[None]:
+        """Tag the commands issued inside the block with a new cycle number.
+
+        :param scope: "full" for a sweep, "events" for a cycle scoped to events
+        :type scope: str
+        :yield: while the cycle runs
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        with self._lock:
+            self._cycle = cycle = CycleRecord(
+                self._next_cycle, scope, start + self._offset
+            )
+            self._next_cycle += 1
+            self._cycles.append(cycle)
+        try:
+            yield
+        finally:
+            cycle.duration = time.perf_counter() - start
+            self._cycle = None
+
+    def clear(self) -> None:
+        """Drop all records."""
+        with self._lock:
+            self._records.clear()
+            self._cycles.clear()
+
+    def records(self, cycle: int | None = None) -> list[CommandRecord]:
+        """Return the buffered command records, oldest first.
+
+        :param cycle: only return the records of this cycle
+        :type cycle: int | None
+        :return: command records
+        :rtype: list[CommandRecord]
+        """
+        with self._lock:
+            records = list(self._records)
+        if cycle is not None:
+            records = [r for r in records if r.cycle == cycle]
+        return records
+
+    def cycles(self) -> list[dict[str, Any]]:
+        """Aggregate the buffered records per cycle and per caller.
+
+        :return: per cycle totals, with callers sorted by time spent
+        :rtype: list[dict[str, Any]]
+        """
+        with self._lock:
+            cycles = [asdict(c) for c in self._cycles]
+            records = list(self._records)
+        callers: dict[int, dict[str, dict[str, Any]]] = {}
+        for record in records:
+            if record.cycle is None:
+                continue
+            entry = callers.setdefault(record.cycle, {}).setdefault(
+                record.caller,
+                {"caller": record.caller, "count": 0, "seconds": 0.0, "max": 0.0},
+            )
+            entry["count"] += 1
+            entry["seconds"] += record.duration
+            entry["max"] = max(entry["max"], record.duration)
+        for cycle in cycles:
+            per_caller = sorted(
+                callers.get(cycle["cycle"], {}).values(),
+                key=lambda e: e["seconds"],
+                reverse=True,
+            )
+            cycle["commands"] = sum(e["count"] for e in per_caller)
+            cycle["callers"] = per_caller
+        return cycles
+
+    def chrome_trace(self, cycle: int | None = None) -> dict[str, Any]:
+        """Export the buffered records in the Chrome trace-event format.
+
+        Every task or thread becomes a track, reconcile cycles get a track
+        of their own.
+
+        :param cycle: only export this cycle
+        :type cycle: int | None
+        :return: trace document, to be serialised as JSON
+        :rtype: dict[str, Any]
+        """
+        tids: dict[str, int] = {"reconcile": 0}
+        events: list[dict[str, Any]] = []
+        for info in self.cycles():
+            if cycle is not None and info["cycle"] != cycle:
+                continue
+            events.append(
+                {
+                    "name": f"reconcile #{info['cycle']} ({info['scope']})",
+                    "cat": "reconcile",
+                    "ph": "X",
+                    "ts": info["start"] * 1e6,
+                    "dur": (info["duration"] or 0.0) * 1e6,
+                    "pid": 1,
+                    "tid": 0,
+                    "args": {"commands": info["commands"]},
+                }
+            )
+        for record in self.records(cycle):
+            tid = tids.setdefault(record.thread, len(tids))
+            events.append(
+                {
+                    "name": record.command,
+                    "cat": record.command.split(maxsplit=1)[0],
+                    "ph": "X",
+                    "ts": record.start * 1e6,
+                    "dur": record.duration * 1e6,
+                    "pid": 1,
+                    "tid": tid,
+                    "args": {
+                        "caller": record.caller,
+                        "returncode": record.returncode,
+                        "output_size": record.output_size,
+                        "cycle": record.cycle,
+                    },
+                }
+            )
+        events += [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": 1,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for name, tid in tids.items()
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
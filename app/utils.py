@@ -8,22 +8,55 @@ from __future__ import annotations
 
 import asyncio
 import hashlib
-import ipaddress
 import json
 import logging
 import os
 import sys
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
 from functools import cache
 from pathlib import Path
-from subprocess import CalledProcessError, CompletedProcess, run
-from typing import Any, TypedDict, TypeVar
+from subprocess import (
+    DEVNULL,
+    PIPE,
+    CalledProcessError,
+    CompletedProcess,
+    TimeoutExpired,
+)
+from typing import Any, TypedDict, TypeVar, cast
+
+from app.metrics import (
+    LOCK_HOLD_SECONDS,
+    LOCK_WAIT_SECONDS,
+    command_type,
+    record_command,
+)
+from app.tracing import CommandTracer
 
 # Constants
-DB_JSON_PATH = Path("/tmp/db.json")  # noqa: S108
+CONFIG_PATH = Path("/root/config.json")
+DB_PATH = Path(os.environ.get("DB_PATH", "/tmp/db.sqlite"))  # noqa: S108
 MAX_FAIL_COUNT = 2
+# Seconds between full sweeps, events trigger targeted cycles in between.
+RECONCILE_INTERVAL = int(os.environ.get("RECONCILE_INTERVAL", "60"))
 DOCKER_SOCKET = Path("/var/run/docker.sock")
+OVSDB_REMOTE = os.environ.get("OVSDB_REMOTE", "unix:/var/run/openvswitch/db.sock")
 USE_LINUX_BRIDGE = os.environ.get("USE_LINUX_BRIDGE", "false") in ("true", "1")
-EVENT_LOCK = asyncio.Lock()
+# Keep what a previous run provisioned and adopt it instead of starting over
+WARM_RESTART = os.environ.get("WARM_RESTART", "false") in ("true", "1")
+# Number of bridges/container interfaces configured in parallel.
+MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", "16"))
+# Seconds before a host command is killed.
+COMMAND_TIMEOUT = float(os.environ.get("COMMAND_TIMEOUT", "30"))
+# Record every command into a ring buffer, see /debug/commands
+TRACE_COMMANDS = os.environ.get("TRACE_COMMANDS", "false") in ("true", "1")
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", "10000"))
+# Drive the in-memory host of app.sim instead of OVS, Docker and the kernel
+SIMULATED_HOST = os.environ.get("SIMULATED_HOST", "false") in ("true", "1")
+# Seconds every simulated host command takes
+SIMULATED_COMMAND_LATENCY = float(os.environ.get("SIMULATED_COMMAND_LATENCY", "0"))
 T = TypeVar("T")
 
 
@@ -33,7 +66,7 @@ class IfaceInfoDict(TypedDict, total=False):
 
     iface: str  # Optional, parent interface OVS speaks to
     native: str  # Optional, native VLAN for untagged packets
-    trunk: str  # Optional, Comma separated VLAN ids
+    trunk: str  # Optional, Comma separated VLAN ids and ranges
     vlan: str  # Optional, access VLAN
 
 
@@ -53,7 +86,7 @@ class ContainerInfoDict(TypedDict, total=False):
     iface: str  # Interface name inside of container.
     bridge: str  # Bridge name interface needs to be part of
     vlan: str  # Optional, VLAN ID interface should be part of
-    trunk: str  # Optional, Comma separated VLAN ids
+    trunk: str  # Optional, Comma separated VLAN ids and ranges
     ipaddress: str  # Optional, IPv4 address
     ip6address: str  # Optional, IPv6 address
     gateway: str  # Optional, IPv4 gateway address
@@ -92,32 +125,149 @@ def get_logger(name: str = __name__) -> logging.Logger:
 _LOGGER = get_logger("utils")
 
 
-# Cache function to get the OVS database from JSON file
+class TimedLock(asyncio.Lock):
+    """Asyncio lock reporting its wait and hold times as metrics."""
+
+    def __init__(self, kind: str) -> None:
+        """Create an unlocked lock.
+
+        :param kind: lock label, e.g. "bridge" or "container"
+        :type kind: str
+        """
+        super().__init__()
+        self._kind = kind
+        self._acquired = 0.0
+
+    async def acquire(self) -> bool:
+        """Acquire the lock, recording how long it took.
+
+        :return: True once the lock is held
+        :rtype: bool
+        """
+        start = time.perf_counter()
+        await super().acquire()
+        self._acquired = time.perf_counter()
+        LOCK_WAIT_SECONDS.observe(self._acquired - start, self._kind)
+        return True
+
+    def release(self) -> None:
+        """Release the lock, recording how long it was held."""
+        LOCK_HOLD_SECONDS.observe(time.perf_counter() - self._acquired, self._kind)
+        super().release()
+
+
+class KeyedLocks:
+    """Asyncio locks created on demand, one per key.
+
+    Operations on different bridges or containers do not depend on each
+    other and run concurrently, only operations on the same key are
+    serialised. Callers needing several locks take them all at once through
+    hold_locks(), so lock holders can never deadlock.
+    """
+
+    def __init__(self, kind: str) -> None:
+        """Initialise an empty lock table.
+
+        :param kind: lock label reported in the metrics
+        :type kind: str
+        """
+        self._kind = kind
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def __call__(self, key: str) -> asyncio.Lock:
+        """Return the lock for a key.
+
+        :param key: bridge or container name
+        :type key: str
+        :return: lock serialising operations on that key
+        :rtype: asyncio.Lock
+        """
+        if (lock := self._locks.get(key)) is None:
+            lock = self._locks[key] = TimedLock(self._kind)
+        return lock
+
+
+BRIDGE_LOCKS = KeyedLocks("bridge")
+CONTAINER_LOCKS = KeyedLocks("container")
+# Serialises replacing the whole desired topology, from planning to set_config
+TOPOLOGY_LOCK = TimedLock("topology")
+_COMMAND_SLOTS = asyncio.Semaphore(MAX_CONCURRENCY)
+
+
+@asynccontextmanager
+async def hold_locks(
+    bridges: Iterable[str] = (), containers: Iterable[str] = ()
+) -> AsyncIterator[None]:
+    """Hold the locks of several bridges and containers at once.
+
+    Bridge locks are taken before container locks, each in sorted order.
+
+    :param bridges: bridge names
+    :type bridges: Iterable[str]
+    :param containers: container names
+    :type containers: Iterable[str]
+    :yield: while all locks are held
+    """
+    async with AsyncExitStack() as stack:
+        for bridge in sorted(set(bridges)):
+            await stack.enter_async_context(BRIDGE_LOCKS(bridge))
+        for container in sorted(set(containers)):
+            await stack.enter_async_context(CONTAINER_LOCKS(container))
+        yield
+
+
+async def run_item(
+    func: Callable[..., Awaitable[None]],
+    *args: Any,  # noqa: ANN401
+) -> str | None:
+    """Run one item of a batch and turn its failure into an error message.
+
+    :param func: orchestrator function applying the item
+    :type func: Callable[..., Awaitable[None]]
+    :param args: positional arguments for the function
+    :type args: Any
+    :return: error message, or None on success
+    :rtype: str | None
+    """
+    try:
+        await func(*args)
+    except Exception as e:
+        _LOGGER.exception("Batch item %s failed", args[:2])
+        return str(e) or type(e).__name__
+    return None
+
+
+@cache
+def get_executor() -> ThreadPoolExecutor:
+    """Return the worker pool used for blocking host operations.
+
+    :return: thread pool limited to MAX_CONCURRENCY workers
+    :rtype: ThreadPoolExecutor
+    """
+    return ThreadPoolExecutor(MAX_CONCURRENCY, thread_name_prefix="raikou")
+
+
 @cache
-def _open_db() -> dict[str, Any]:
-    return json.load(DB_JSON_PATH.open(encoding="utf-8"))
+def get_tracer() -> CommandTracer:
+    """Return the command tracer.
 
+    :return: ring buffer of TRACE_BUFFER_SIZE records, enabled by TRACE_COMMANDS
+    :rtype: CommandTracer
+    """
+    return CommandTracer(TRACE_BUFFER_SIZE, TRACE_COMMANDS)
 
-def get_db(key: str = "", default: T | None = None) -> dict[str, Any] | T:
-    """Retrieve the OVS database cache or a specific section of it.
 
-    This function returns the full OVS database cache if no key is provided.
-    If a key is specified, it returns the corresponding section of the cache.
-    If the key does not exist in the database, the provided `default` value is used
-    (an empty dictionary by default).
+async def run_blocking(func: Callable[..., T], *args: Any) -> T:  # noqa: ANN401
+    """Run a blocking function in the worker pool without stalling the loop.
 
-    :param key: Optional. The key for a specific section of the database.
-    :type key: str
-    :param default: Optional. The default value to set if the key does not exist.
-    :type default: Any
-    :return: The full OVS database cache or the section specified by the key.
-    :rtype: dict[str, Any] | Any
+    :param func: function to call
+    :type func: Callable[..., T]
+    :param args: positional arguments for the function
+    :type args: Any
+    :return: function result
+    :rtype: T
     """
-    db = _open_db()
-    if key:
-        # Only set to an empty dict if `default` is not provided.
-        return db.setdefault(key, default if default is not None else {})
-    return db
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
 
 
 @cache
@@ -127,10 +277,59 @@ def get_config() -> dict[str, Any]:
     :return: The OVS config.
     :rtype: dict[str, Any]
     """
-    with Path("/root/config.json").open(encoding="UTF-8") as fp:
+    with CONFIG_PATH.open(encoding="UTF-8") as fp:
         return json.load(fp)
 
 
+def set_config(config: dict[str, Any]) -> None:
+    """Replace the runner config in place.
+
+    :param config: new desired state
+    :type config: dict[str, Any]
+    """
+    current = get_config()
+    current.clear()
+    current.update(config)
+
+
+def add_bridge_config(bridge_name: str, info: BridgeInfoDict) -> None:
+    """Merge a bridge into the runner config, appending to its parents.
+
+    :param bridge_name: bridge name
+    :type bridge_name: str
+    :param info: bridge details
+    :type info: BridgeInfoDict
+    """
+    bridge_config = get_config()["bridge"].setdefault(bridge_name, {})
+    for key, value in info.items():
+        if key in bridge_config and isinstance(value, list):
+            bridge_config.setdefault(key, []).extend(value)
+            continue
+        bridge_config[key] = value
+
+
+def add_container_config(container_name: str, info: ContainerInfoDict) -> None:
+    """Add a container interface to the runner config.
+
+    :param container_name: container name
+    :type container_name: str
+    :param info: container interface details
+    :type info: ContainerInfoDict
+    """
+    get_config()["container"].setdefault(container_name, []).append(info)
+
+
+def add_veth_pair_config(veth_pair_id: str, info: dict[str, Any]) -> None:
+    """Add a veth pair to the runner config.
+
+    :param veth_pair_id: veth pair prefix
+    :type veth_pair_id: str
+    :param info: veth pair details
+    :type info: dict[str, Any]
+    """
+    get_config()["veth_pairs"].setdefault(veth_pair_id, {}).update(info)
+
+
 def hash_string(string: str) -> str:
     """Hashes a string using the SHA-256 algorithm.
 
@@ -142,41 +341,129 @@ def hash_string(string: str) -> str:
     return hashlib.sha256(string.encode()).hexdigest()[:8]
 
 
-def check_container_exists(container_name: str) -> bool:
-    """Check if the container exists.
-
-    :param container_name: Name of the container.
-    :type container_name: str
-    :return: True if the container exists, False otherwise.
-    :rtype: bool
+def record_request(
+    backend: str, action: str, start: float, failed: bool, size: int = 0
+) -> None:
+    """Record the metrics and trace of an OVSDB, netlink or Docker API request.
+
+    :param backend: "ovsdb", "netlink" or "docker-api"
+    :type backend: str
+    :param action: request type, e.g. "transact"
+    :type action: str
+    :param start: time.perf_counter() when the request was sent
+    :type start: float
+    :param failed: True if the request raised
+    :type failed: bool
+    :param size: bytes of the reply, if known
+    :type size: int
     """
-    check = run_command(f"docker ps -f name={container_name}$ -q", check=False)
-    exists = bool(check.stdout.strip())
-    if not exists:
-        _LOGGER.debug("Container %s does not exist!", container_name)
-    else:
-        _LOGGER.debug("Container ID: %s", check.stdout.strip())
-    return exists
+    elapsed = time.perf_counter() - start
+    record_command(backend, action, elapsed)
+    if (tracer := get_tracer()).enabled:
+        tracer.record(f"{backend} {action}", start, elapsed, int(failed), size)
 
 
-def run_command(command: str, check: bool = True) -> CompletedProcess[str]:
-    """Run a command using subprocess and capture the output.
+async def run_command(
+    command: str,
+    check: bool = True,
+    timeout: float | None = COMMAND_TIMEOUT,  # noqa: ASYNC109
+    stdin: str | None = None,
+) -> CompletedProcess[str]:
+    """Run a command without blocking the event loop and capture the output.
+
+    At most MAX_CONCURRENCY commands run at the same time. The process is
+    killed if it exceeds the timeout or if the calling task is cancelled.
 
     :param command: The command to run.
     :type command: str
     :param check: Flag to raise an exception on command failure.
     :type check: bool
+    :param timeout: Seconds to wait for the command, None waits forever.
+    :type timeout: float | None
+    :param stdin: Text fed to the command, e.g. a ``bridge -batch -`` script.
+    :type stdin: str | None
     :return: The captured output of the command as a string.
     :rtype: CompletedProcess[str]
     :raises CalledProcessError: If the command execution fails.
+    :raises TimeoutExpired: If the command does not finish in time.
     """
-    try:
-        return run(command.split(), check=check, capture_output=True, text=True)
-    except CalledProcessError as exc:
-        _LOGGER.exception("Subprocess error:\nCommand failed: %s", exc.cmd)
-        stderr_output = exc.stderr if exc.stderr else None
-        _LOGGER.exception("Command stderr output:\n%s", stderr_output)
-        raise
+    args = command.split()
+    if SIMULATED_HOST:
+        return await _run_simulated(command, args, check, stdin)
+
+    stdout = stderr = b""
+    async with _COMMAND_SLOTS:
+        start = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=DEVNULL if stdin is None else PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+        )
+        data = None if stdin is None else stdin.encode()
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(data), timeout)
+        except (TimeoutError, asyncio.CancelledError) as exc:
+            with suppress(ProcessLookupError):
+                proc.kill()
+            await asyncio.shield(proc.wait())
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+            _LOGGER.warning("Command timed out after %ss: %s", timeout, command)
+            raise TimeoutExpired(args, cast("float", timeout)) from exc
+        finally:
+            elapsed = time.perf_counter() - start
+            record_command(*command_type(args), elapsed)
+            if (tracer := get_tracer()).enabled:
+                size = len(stdout) + len(stderr)
+                tracer.record(command, start, elapsed, proc.returncode, size)
+
+    result = CompletedProcess(
+        args, cast("int", proc.returncode), stdout.decode(), stderr.decode()
+    )
+    return _checked(command, result, check)
+
+
+def _checked(
+    command: str, result: CompletedProcess[str], check: bool
+) -> CompletedProcess[str]:
+    if check and result.returncode:
+        _LOGGER.error("Subprocess error:\nCommand failed: %s", command)
+        _LOGGER.error("Command stderr output:\n%s", result.stderr or None)
+        raise CalledProcessError(
+            result.returncode, result.args, result.stdout, result.stderr
+        )
+    return result
+
+
+async def _run_simulated(
+    command: str, args: list[str], check: bool, stdin: str | None
+) -> CompletedProcess[str]:
+    """Run a command on the simulated host, see run_command().
+
+    :param command: The command to run.
+    :type command: str
+    :param args: The command split into arguments.
+    :type args: list[str]
+    :param check: Flag to raise an exception on command failure.
+    :type check: bool
+    :param stdin: Text fed to the command.
+    :type stdin: str | None
+    :return: The captured output of the command as a string.
+    :rtype: CompletedProcess[str]
+    """
+    # app.sim builds on this module, import it on demand
+    from app.sim import get_sim_host  # noqa: PLC0415
+
+    async with _COMMAND_SLOTS:
+        start = time.perf_counter()
+        result = await get_sim_host().execute(args, stdin)
+        elapsed = time.perf_counter() - start
+        record_command(*command_type(args), elapsed)
+        if (tracer := get_tracer()).enabled:
+            size = len(result.stdout) + len(result.stderr)
+            tracer.record(command, start, elapsed, result.returncode, size)
+    return _checked(command, result, check)
 
 
 def get_usb_interface(usb_port: str) -> str:
@@ -192,9 +479,13 @@ def get_usb_interface(usb_port: str) -> str:
     :rtype: str
     :raises ValueError: If multiple or no interfaces are found for the specified USB port.
     """
-    devs = run_command("ls -l /sys/class/net", check=False)
-
-    usb_info = [dev for dev in devs.stdout.splitlines() if usb_port in dev]
+    # Each /sys/class/net entry links to its device path, which for USB
+    # devices contains the USB bus and port.
+    usb_info = [
+        dev.name
+        for dev in Path("/sys/class/net").iterdir()
+        if usb_port in f"{dev.name} -> {dev.readlink()}"
+    ]
     if len(usb_info) > 1:
         msg = f"Identified more than one interface for USB bus: {usb_port}"
         raise ValueError(msg)
@@ -202,128 +493,4 @@ def get_usb_interface(usb_port: str) -> str:
         err = f"No network interface found for USB port: {usb_port}"
         raise ValueError(err)
 
-    # Assumption 8th section of split of each line shows the interface name.
-    return usb_info[0].split()[8]
-
-
-def auto_allocate_ip(bridge_name: str, container_name: str, family: str = "ip") -> str:
-    """Automatically allocate an IP address from the bridge's IP range.
-
-    :param bridge_name: The brigde name to allocate IP from for the container.
-    :type bridge_name: str
-    :param container_name: Name of the container to assign the IP to.
-    :type container_name: str
-    :param family: The IP family to allocate from ("ip" for IPv4 or "ip6" for IPv6).
-                   Default is "ip".
-    :type family: str
-    :raises IndexError: If no available IP addresses remain in the range.
-    :return: The allocated IP address with the correct prefix.
-    :rtype: str
-    """
-    db_cache = get_db(bridge_name)
-    ip_range = db_cache.get(f"{family}range", "/24")
-    hosts = db_cache.get(f"{family}range_hosts", {})
-
-    network_hosts = ipaddress.ip_network(str(ip_range)).hosts()
-    _ = [next(network_hosts) for _ in range(5)]  # Skip first 5 addresses
-
-    for host in network_hosts:
-        ipaddr = f"{host}/{ip_range.split('/')[-1]}"
-        if ipaddr not in hosts.values():
-            _LOGGER.debug(
-                "Automatic IP allocation (%s) to container: %s", ipaddr, container_name
-            )
-            hosts[container_name] = ipaddr
-            return ipaddr
-
-    msg = f"Failed to automatically allocate an IP to container: {container_name}"
-    raise IndexError(msg)
-
-
-def validate_bridge(bridge_name: str, info: BridgeInfoDict) -> bool:
-    """Validate if a bridge already exists in the database.
-
-    If any of its parent interfaces are already part of the existing bridge,
-    then the validation fails
-
-    :param bridge_name: The name of the bridge to be validated.
-    :param info: A dictionary containing the bridge's information,
-                 including its parent interfaces.
-    :return: True if the bridge does not exist or
-             no parent interfaces are conflicting,
-             False otherwise.
-    """
-    if bridge := get_db(bridge_name):
-        _LOGGER.debug("Bridge Already exists: %s", bridge_name)
-        for parent in info["parents"]:
-            if parent["iface"] in bridge:
-                _LOGGER.error(
-                    "iface %s exists in bridge: %s",
-                    parent["iface"],
-                    bridge_name,
-                )
-                return False
-    return True
-
-
-def validate_container(container_id: str, info: ContainerInfoDict) -> bool:
-    """Validate if the specified container's interface already exists.
-
-    This function checks whether the given container's interface (`iface`)
-    is already present for the specified container in the associated bridge.
-    If the interface exists, it logs an error and returns `False`.
-
-    :param container_id: container name
-    :type container_id: str
-    :param info: container's information, including its bridge and
-                 interface details.
-    :type info: ContainerInfoDict
-    :return: True if container interface does not exists.
-    """
-    db = get_db(info["bridge"])
-    if (cc_cache := db.get(container_id, {})) and info["iface"] in cc_cache:
-        _LOGGER.error(
-            "iface %s already exists for container: %s",
-            info["iface"],
-            container_id,
-        )
-        return False
-    return True
-
-
-def validate_veth_pair(veth_pair_id: str, info: dict) -> bool:
-    """Validate the VETH pair ID.
-
-    This function performs two checks:
-
-    1. Ensures that the `veth_pair_id` does not exceed the
-       predefined length limit of 8 characters.
-    2. Checks if the VETH pair's interface name (e.g., `v0_{veth_pair_id}`)
-       already exists on the specified bridge.
-
-    If any validation fails, it logs an error and returns `False`.
-    Otherwise, it returns `True`.
-
-    :param veth_pair_id: The unique identifier for the VETH pair,
-                         which will be used as a prefix.
-    :type veth_pair_id: str
-    :param info: Dictionary containing details about the VETH pair,
-                 including the target bridge (`info["on"]`).
-    :type info: dict
-    :return: Returns `True` if the validation passes, otherwise `False`.
-    :rtype: bool
-    """
-    prefix_length_limit = 8
-    if len(veth_pair_id) > prefix_length_limit:
-        _LOGGER.error("VETH prefix ID: %s is more than 8 chars", veth_pair_id)
-        return False
-
-    veth_pair_end = f"v0_{veth_pair_id}"
-    if (bridge := get_db(info["on"])) and veth_pair_end in bridge:
-        _LOGGER.error(
-            "iface %s exists in bridge: %s",
-            veth_pair_id,
-            info["on"],
-        )
-        return False
-    return True
+    return usb_info[0]
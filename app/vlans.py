@@ -0,0 +1,147 @@
+"""VLAN id sets as sorted intervals.
+
+Trunks are written in the config as comma separated VLAN ids and ranges,
+e.g. ``"100,200-3000"``. They are held as sorted, disjoint and
+non-adjacent ``(first, last)`` intervals, so comparing, diffing and
+formatting them costs one step per range rather than one per VLAN. Only
+OVSDB, whose ``trunks`` column is a plain set of integers, gets the
+expanded VLAN ids.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+VLAN_MIN = 1
+VLAN_MAX = 4095
+
+# Sorted, disjoint and non-adjacent (first, last) intervals
+VlanRanges = tuple[tuple[int, int], ...]
+
+
+def merge_ranges(ranges: Iterable[tuple[int, int]]) -> VlanRanges:
+    """Sort intervals and merge the overlapping or adjacent ones.
+
+    :param ranges: (first, last) intervals in any order
+    :type ranges: Iterable[tuple[int, int]]
+    :return: normalised intervals
+    :rtype: VlanRanges
+    """
+    merged: list[tuple[int, int]] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return tuple(merged)
+
+
+def vlan_ranges(vids: Iterable[int]) -> VlanRanges:
+    """Compress VLAN ids into intervals.
+
+    :param vids: VLAN ids in any order
+    :type vids: Iterable[int]
+    :return: intervals covering exactly the VLAN ids
+    :rtype: VlanRanges
+    """
+    return merge_ranges((vid, vid) for vid in vids)
+
+
+def _vlan(value: str) -> int:
+    if not value.isdigit():
+        msg = f"VLAN {value} should be a numeric string"
+        raise ValueError(msg)
+    if not VLAN_MIN <= (vid := int(value)) <= VLAN_MAX:
+        msg = f"VLAN {value} should be between {VLAN_MIN} and {VLAN_MAX}"
+        raise ValueError(msg)
+    return vid
+
+
+def parse_vlans(value: str | None) -> VlanRanges:
+    """Parse comma separated VLAN ids and ranges.
+
+    :param value: VLANs, e.g. "100,200-3000", None or "" for none
+    :type value: str | None
+    :return: intervals covering the VLANs
+    :rtype: VlanRanges
+    :raises ValueError: if a VLAN is not numeric, out of range or a range
+        is reversed
+    """
+    ranges = []
+    for item in (value or "").split(","):
+        if not item:
+            continue
+        first, sep, last = item.partition("-")
+        start, end = _vlan(first), _vlan(last) if sep else _vlan(first)
+        if start > end:
+            msg = f"VLAN range {item} should be ascending"
+            raise ValueError(msg)
+        ranges.append((start, end))
+    return merge_ranges(ranges)
+
+
+def format_range(first: int, last: int) -> str:
+    """Return an interval as "first-last", or as a single VLAN id.
+
+    :param first: first VLAN id
+    :type first: int
+    :param last: last VLAN id
+    :type last: int
+    :return: VLAN id or range
+    :rtype: str
+    """
+    return str(first) if first == last else f"{first}-{last}"
+
+
+def format_vlans(ranges: VlanRanges) -> str:
+    """Format intervals the way the config writes them.
+
+    :param ranges: intervals
+    :type ranges: VlanRanges
+    :return: comma separated VLAN ids and ranges, e.g. "100,200-3000"
+    :rtype: str
+    """
+    return ",".join(format_range(first, last) for first, last in ranges)
+
+
+def vlan_ids(ranges: VlanRanges) -> list[int]:
+    """Expand intervals into VLAN ids.
+
+    :param ranges: intervals
+    :type ranges: VlanRanges
+    :return: sorted VLAN ids
+    :rtype: list[int]
+    """
+    return [vid for first, last in ranges for vid in range(first, last + 1)]
+
+
+def subtract_ranges(ranges: VlanRanges, other: VlanRanges) -> VlanRanges:
+    """Return the VLANs of one set that are not in another.
+
+    :param ranges: intervals to subtract from
+    :type ranges: VlanRanges
+    :param other: intervals to remove
+    :type other: VlanRanges
+    :return: intervals of ranges minus other
+    :rtype: VlanRanges
+    """
+    result: list[tuple[int, int]] = []
+    index = 0
+    for first, last in ranges:
+        start = first
+        # Skip the intervals of other ending before this one
+        while index < len(other) and other[index][1] < start:
+            index += 1
+        cursor = index
+        while cursor < len(other) and other[cursor][0] <= last:
+            cut_first, cut_last = other[cursor]
+            if cut_first > start:
+                result.append((start, cut_first - 1))
+            start = max(start, cut_last + 1)
+            if cut_last >= last:
+                break
+            cursor += 1
+        if start <= last:
+            result.append((start, last))
+    return tuple(result)
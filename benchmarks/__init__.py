@@ -0,0 +1 @@
+"""Benchmarks for the network orchestrator, run with python -m benchmarks.<name>."""
@@ -0,0 +1,80 @@
+"""Benchmark the bridge IP allocator.
+
+Allocates 10k leases from an IPv4 /16 and an IPv6 /64, releases every
+other one and allocates them again. The linear scan the allocator replaced
+is timed on a smaller IPv4 workload for comparison, since its cost grows
+with the square of the lease count.
+
+Run from the repository root::
+
+    python -m benchmarks.ipam_bench [--leases N] [--linear-leases N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import time
+
+from app.ipam import RESERVED_HOSTS, IpPool
+
+
+def _linear_allocate(ip_range: str, hosts: dict[str, str], owner: str) -> str:
+    network_hosts = ipaddress.ip_network(ip_range).hosts()
+    for _ in range(RESERVED_HOSTS):
+        next(network_hosts)
+    prefix = ip_range.rsplit("/", maxsplit=1)[-1]
+    for host in network_hosts:
+        ipaddr = f"{host}/{prefix}"
+        if ipaddr not in hosts.values():
+            hosts[owner] = ipaddr
+            return ipaddr
+    raise IndexError(owner)
+
+
+def _bench_pool(ip_range: str, leases: int) -> dict[str, float]:
+    pool = IpPool(ip_range, {})
+    start = time.perf_counter()
+    for i in range(leases):
+        pool.allocate(f"c{i}")
+    allocated = time.perf_counter()
+    for i in range(0, leases, 2):
+        pool.release(f"c{i}")
+    released = time.perf_counter()
+    for i in range(0, leases, 2):
+        pool.allocate(f"c{i}")
+    reallocated = time.perf_counter()
+    return {
+        "allocate": (allocated - start) / leases,
+        "release": (released - allocated) / (leases // 2),
+        "reallocate": (reallocated - released) / (leases // 2),
+    }
+
+
+def _bench_linear(ip_range: str, leases: int) -> dict[str, float]:
+    hosts: dict[str, str] = {}
+    start = time.perf_counter()
+    for i in range(leases):
+        _linear_allocate(ip_range, hosts, f"c{i}")
+    return {"allocate": (time.perf_counter() - start) / leases}
+
+
+def main() -> None:
+    """Run the benchmark and print the mean cost per operation."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--leases", type=int, default=10_000)
+    parser.add_argument("--linear-leases", type=int, default=1_000)
+    args = parser.parse_args()
+
+    for name, ip_range, bench, leases in (
+        ("IpPool IPv4 /16", "10.0.0.0/16", _bench_pool, args.leases),
+        ("IpPool IPv6 /64", "fd00::/64", _bench_pool, args.leases),
+        ("linear IPv4 /16", "10.0.0.0/16", _bench_linear, args.linear_leases),
+    ):
+        results = bench(ip_range, leases)
+        timings = ", ".join(f"{op} {t * 1e6:.2f} us" for op, t in results.items())
+        print(f"{name:16} {leases} leases: {timings}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
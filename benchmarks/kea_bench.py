@@ -0,0 +1,346 @@
+"""Benchmark the KEA reservation API under concurrent boards.
+
+Every board posts a few DHCPv4 and DHCPv6 reservation updates, all boards
+at the same time, through the FastAPI app of the dhcp component. A client
+that gets 503 "Service busy" retries after a short pause, like the test
+runs do, so the API can be compared with versions that reject concurrent
+updates. The control agent is a stand-in running in a thread of its own:
+it serialises commands like KEA does, a config-reload costs a fixed time
+plus a time per loaded board file, a host command a fixed time. Like the
+shipped image, which loads no host_cmds hook, it answers reservation-add
+and reservation-del with "not supported", unless ``--host-cmds`` is given.
+keactrl is a stand-in script taking ``--keactrl-latency`` seconds, its runs
+are counted with the commands.
+
+Reported per board count: wall time, updates per second, latency
+percentiles, 503 retries, commands seen by the control agent and the
+longest stall of the event loop serving the API. With ``--bulk`` every
+update round sends all boards in one ``/update_dhcp_bulk`` request, and the
+latencies are those of the bulk requests.
+
+Run from the repository root::
+
+    python -m benchmarks.kea_bench [--boards 1,8,32] [--updates 3]
+        [--reload-latency 0.05] [--reload-per-board 0.002]
+        [--command-latency 0.002] [--keactrl-latency 0.02] [--host-cmds]
+        [--bulk]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from types import ModuleType
+
+_KEA_API = Path(__file__).parents[1] / "components/dhcp/resources/kea_api.py"
+# Pause of a client before retrying a 503
+_RETRY_DELAY = 0.05
+_PROBE_INTERVAL = 0.005
+# Commands of the host_cmds hook library
+_HOST_CMDS = ("reservation-add", "reservation-del", "reservation-get")
+
+
+class StandInAgent:
+    """KEA control agent stand-in, serving HTTP/1.1 with keep-alive."""
+
+    def __init__(self, config_dir: Path, args: argparse.Namespace) -> None:
+        """Create the stand-in.
+
+        :param config_dir: directory holding the board files
+        :type config_dir: Path
+        :param args: latencies from the command line
+        :type args: argparse.Namespace
+        """
+        self.config_dir = config_dir
+        self.args = args
+        self.commands: Counter[str] = Counter()
+        self.port = 0
+        self._ready = threading.Event()
+
+    def start(self) -> None:
+        """Serve from a thread of its own."""
+        threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True).start()
+        self._ready.wait()
+
+    async def _serve(self) -> None:
+        self._busy = asyncio.Lock()
+        server = await asyncio.start_server(self._client, "127.0.0.1", 0)
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with server:
+            await server.serve_forever()
+
+    async def _client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        with contextlib.suppress(ConnectionError, asyncio.IncompleteReadError):
+            while request := await reader.readuntil(b"\r\n\r\n"):
+                headers = dict(
+                    line.lower().split(": ", 1)
+                    for line in request.decode().split("\r\n")[1:]
+                    if ": " in line
+                )
+                length = int(headers.get("content-length", 0))
+                body = json.loads(await reader.readexactly(length))
+                reply = json.dumps(await self._command(body)).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(reply)}\r\n\r\n".encode()
+                    + reply
+                )
+                await writer.drain()
+        writer.close()
+
+    async def _command(self, body: dict[str, Any]) -> list[dict[str, Any]]:
+        command = body["command"]
+        async with self._busy:
+            self.commands[command] += 1
+            if command == "config-reload":
+                boards = sum(1 for _ in self.config_dir.glob("board-*.json"))
+                delay = self.args.reload_latency + self.args.reload_per_board * boards
+            else:
+                delay = self.args.command_latency
+            await asyncio.sleep(delay)
+        if command in _HOST_CMDS and not self.args.host_cmds:
+            return [{"result": 2, "text": f"'{command}' command not supported."}]
+        return [{"result": 0, "text": f"{command} done"}]
+
+
+def _load_api(config_dir: Path, agent: StandInAgent, bin_dir: Path) -> ModuleType:
+    """Import kea_api pointed at the stand-ins.
+
+    :param config_dir: directory holding the board files
+    :type config_dir: Path
+    :param agent: running control agent stand-in
+    :type agent: StandInAgent
+    :param bin_dir: directory holding the keactrl stand-in
+    :type bin_dir: Path
+    :return: the kea_api module
+    :rtype: ModuleType
+    """
+    os.environ["KEA_CONFIG_DIR"] = str(config_dir)
+    os.environ["KEA_CTRL_AGENT_URL"] = f"http://127.0.0.1:{agent.port}"
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+    spec = importlib.util.spec_from_file_location("kea_api", _KEA_API)
+    module = importlib.util.module_from_spec(spec)  # type: ignore[arg-type]
+    spec.loader.exec_module(module)  # type: ignore[union-attr]
+    return module
+
+
+def _reservations(board: int, update: int, mode: str) -> dict[str, Any]:
+    """Return the reservation data of a board, a new host per update.
+
+    :param board: board number
+    :type board: int
+    :param update: update number
+    :type update: int
+    :param mode: "4" or "6"
+    :type mode: str
+    :return: reservation data with one subnet block per pool
+    :rtype: dict[str, Any]
+    """
+    key = "hw-address" if mode == "4" else "duid"
+    return {
+        pool: {
+            "id": board * 10 + index,
+            "subnet": f"10.{board}.{index}.0/24"
+            if mode == "4"
+            else f"fd{board:x}:{index}::/64",
+            "pools": [{"pool": f"10.{board}.{index}.10 - 10.{board}.{index}.50"}],
+            "reservations": [
+                {key: f"02:00:00:{board:02x}:{index:02x}:{u:02x}"}
+                for u in range(update + 1)
+            ],
+        }
+        for index, pool in enumerate(("data", "voice", "oam"))
+    }
+
+
+async def _probe(stop: asyncio.Event) -> float:
+    """Measure the longest stall of the event loop.
+
+    :param stop: set to end the measurement
+    :type stop: asyncio.Event
+    :return: longest delay of a wakeup past its due time, in seconds
+    :rtype: float
+    """
+    worst = 0.0
+    while not stop.is_set():
+        due = time.perf_counter() + _PROBE_INTERVAL
+        await asyncio.sleep(_PROBE_INTERVAL)
+        worst = max(worst, time.perf_counter() - due)
+    return worst
+
+
+async def _run(
+    api: ModuleType, boards: int, updates: int, *, bulk: bool = False
+) -> dict[str, Any]:
+    """Drive every board at the same time through the API.
+
+    :param api: the kea_api module
+    :type api: ModuleType
+    :param boards: number of boards
+    :type boards: int
+    :param updates: updates per board and family
+    :type updates: int
+    :param bulk: send every board in one bulk request per update instead
+    :type bulk: bool
+    :return: measurements
+    :rtype: dict[str, Any]
+    """
+    import httpx  # noqa: PLC0415
+
+    latencies: list[float] = []
+    done = Counter[str]()
+    retries = Counter[int]()
+    failures = Counter[int]()
+    transport = httpx.ASGITransport(app=api.APP)
+
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://kea-api", timeout=300
+    ) as client:
+
+        async def _board(board: int, mode: str) -> None:
+            url = "/update_dhcp" if mode == "4" else "/update_dhcp6"
+            for update in range(updates):
+                payload = {
+                    "board_id": f"b{board}",
+                    "reservation_data": _reservations(board, update, mode),
+                }
+                start = time.perf_counter()
+                while (
+                    response := await client.post(url, json=payload)
+                ).status_code == HTTPStatus.SERVICE_UNAVAILABLE:
+                    retries[board] += 1
+                    await asyncio.sleep(_RETRY_DELAY)
+                if response.status_code != HTTPStatus.OK:
+                    failures[response.status_code] += 1
+                latencies.append(time.perf_counter() - start)
+                done["updates"] += 1
+
+        async def _bulk() -> None:
+            for update in range(updates):
+                payload = {
+                    f"dhcp{mode}": [
+                        {
+                            "board_id": f"b{board}",
+                            "reservation_data": _reservations(board, update, mode),
+                        }
+                        for board in range(boards)
+                    ]
+                    for mode in ("4", "6")
+                }
+                start = time.perf_counter()
+                response = await client.post("/update_dhcp_bulk", json=payload)
+                if response.status_code != HTTPStatus.OK:
+                    failures[response.status_code] += 1
+                latencies.append(time.perf_counter() - start)
+                done["updates"] += 2 * boards
+
+        # Build the pooled client up front, loading its SSL context stalls
+        api.get_client()
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_probe(stop))
+        start = time.perf_counter()
+        if bulk:
+            await _bulk()
+        else:
+            await asyncio.gather(
+                *(_board(b, mode) for b in range(boards) for mode in ("4", "6"))
+            )
+        wall = time.perf_counter() - start
+        stop.set()
+        stall = await probe
+
+    latencies.sort()
+    return {
+        "seconds": wall,
+        "updates": done["updates"],
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0],
+        "retries": sum(retries.values()),
+        "failures": dict(failures),
+        "stall": stall,
+    }
+
+
+def _prepare(config_dir: Path, boards: int) -> None:
+    for board in range(boards):
+        for mode in ("4", "6"):
+            (config_dir / f"board-v{mode}-b{board}.json").write_text(
+                "", encoding="utf-8"
+            )
+
+
+def main() -> None:
+    """Run the benchmark and print the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boards", default="1,8,32")
+    parser.add_argument("--updates", type=int, default=3)
+    parser.add_argument("--reload-latency", type=float, default=0.05)
+    parser.add_argument("--reload-per-board", type=float, default=0.002)
+    parser.add_argument("--command-latency", type=float, default=0.002)
+    parser.add_argument("--keactrl-latency", type=float, default=0.02)
+    parser.add_argument("--host-cmds", action="store_true")
+    parser.add_argument("--bulk", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_dir, bin_dir = Path(tmp, "etc"), Path(tmp, "bin")
+        config_dir.mkdir()
+        bin_dir.mkdir()
+        keactrl = bin_dir / "keactrl"
+        keactrl.write_text(
+            "#!/bin/sh\n"
+            f'echo "$1" >> {tmp}/keactrl.log\n'
+            f"sleep {args.keactrl_latency}\n"
+            'echo "DHCPv4 server: active"\n'
+            'echo "DHCPv6 server: active"\n',
+            encoding="utf-8",
+        )
+        keactrl.chmod(0o755)
+        agent = StandInAgent(config_dir, args)
+        agent.start()
+        api = _load_api(config_dir, agent, bin_dir)
+
+        for boards in map(int, args.boards.split(",")):
+            for path in config_dir.iterdir():
+                path.unlink()
+            _prepare(config_dir, boards)
+            agent.commands.clear()
+            Path(tmp, "keactrl.log").write_text("", encoding="utf-8")
+            result = asyncio.run(_run(api, boards, args.updates, bulk=args.bulk))
+            api.get_client.cache_clear()
+            api.get_queue.cache_clear()
+            api.get_monitor.cache_clear()
+            forks = Path(tmp, "keactrl.log").read_text(encoding="utf-8").split()
+            agent.commands.update(f"keactrl {action}" for action in forks)
+            commands = ", ".join(f"{c} {n}" for c, n in sorted(agent.commands.items()))
+            print(  # noqa: T201
+                f"{boards:4} boards {result['seconds'] * 1e3:9.1f} ms "
+                f"{result['updates'] / result['seconds']:7.1f} updates/s "
+                f"p50 {result['p50'] * 1e3:7.1f} ms p95 {result['p95'] * 1e3:7.1f} ms "
+                f"retries {result['retries']:5} "
+                f"stall {result['stall'] * 1e3:6.1f} ms ({commands})"
+                + (f" failures {result['failures']}" if result["failures"] else "")
+            )
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
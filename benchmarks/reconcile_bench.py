@@ -0,0 +1,321 @@
+"""Benchmark the orchestrator against the simulated host.
+
+For 10, 100 and 1000 containers, drives ``init_bridge``,
+``add_iface_to_container`` and ``create_veth_pair`` one call at a time,
+then runs a reconcile cycle over the same config, which should find
+nothing to do. Every phase reports its wall time and the host commands
+and OVSDB, netlink and Docker API requests it issued. A second scenario
+attaches 200 containers in one cold reconcile cycle while every host
+command takes ``--latency`` seconds, to show how much of that latency the
+concurrent reconciler hides.
+
+Each run starts from an empty simulated host and state store in a process
+of its own. ``--save FILE`` writes the results as a baseline. With
+``--baseline FILE`` the benchmark fails if a phase issues more commands
+than the baseline, or takes longer than the baseline plus ``--tolerance``.
+
+Run from the repository root::
+
+    python -m benchmarks.reconcile_bench [--sizes 10,100,1000] [--modes ovs,linux]
+        [--concurrent 200] [--latency 0.02] [--baseline FILE] [--save FILE]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+# Phases of a run: wall time in seconds and commands per binary or backend
+Results = dict[str, dict[str, Any]]
+
+_PARENTS = ("eth1", "eth2")
+# Requests served in-process, the others are host commands
+_API_BACKENDS = ("ovsdb", "netlink", "docker-api")
+# Seconds a phase may exceed the baseline by, on top of the tolerance
+_SLACK = 0.005
+
+
+def _config(containers: int, veth_pairs: int) -> dict[str, Any]:
+    """Return a config with two bridges, the containers and the veth pairs.
+
+    :param containers: number of containers, one interface each
+    :type containers: int
+    :param veth_pairs: number of veth pairs
+    :type veth_pairs: int
+    :return: desired state, as returned by get_config()
+    :rtype: dict[str, Any]
+    """
+    return {
+        "bridge": {
+            "lan": {
+                "iprange": "10.0.0.0/16",
+                "ipaddress": "10.0.0.1/16",
+                "ip6range": "fd00::/64",
+                "ip6address": "fd00::1/64",
+                "parents": [{"iface": _PARENTS[0], "trunk": "100,200"}],
+            },
+            "wan": {"parents": [{"iface": _PARENTS[1], "vlan": "300"}]},
+        },
+        "container": {
+            f"c{i}": [
+                {
+                    "iface": "eth1",
+                    "bridge": "lan",
+                    "vlan": str(100 + i % 100),
+                    "gateway": "10.0.0.1",
+                }
+            ]
+            for i in range(containers)
+        },
+        "veth_pairs": {
+            f"p{i}": {"on": "wan", "map": f"{300 + i % 100}:{400 + i % 100}"}
+            for i in range(veth_pairs)
+        },
+    }
+
+
+async def _phase(results: Results, name: str, step: Any) -> None:  # noqa: ANN401
+    """Run one phase, counting its commands.
+
+    :param results: results to add the phase to
+    :type results: Results
+    :param name: phase name
+    :type name: str
+    :param step: coroutine to run
+    :type step: Any
+    """
+    from app.metrics import reconcile_cycle  # noqa: PLC0415
+
+    start = time.perf_counter()
+    with reconcile_cycle("bench") as tally:
+        await step
+    results[name] = {
+        "seconds": time.perf_counter() - start,
+        "commands": dict(sorted(tally.items())),
+    }
+
+
+async def _run_sequential(containers: int) -> Results:
+    """Drive the orchestrator entry points one call at a time.
+
+    :param containers: number of containers and veth pairs
+    :type containers: int
+    :return: results per phase
+    :rtype: Results
+    """
+    # Read the environment set up by the parent process first
+    from app.orchestrator import (  # noqa: PLC0415
+        add_iface_to_container,
+        create_veth_pair,
+        init_bridge,
+        reconcile,
+    )
+    from app.sim import get_sim_host  # noqa: PLC0415
+
+    config = _config(containers, containers)
+    host = get_sim_host()
+    for parent in _PARENTS:
+        host.add_link(parent)
+    for container in config["container"]:
+        host.add_container(container)
+
+    async def _bridges() -> None:
+        for bridge, info in config["bridge"].items():
+            await init_bridge(bridge, info)
+
+    async def _containers() -> None:
+        for container, ifaces in config["container"].items():
+            for info in ifaces:
+                await add_iface_to_container(container, info)
+
+    async def _veth_pairs() -> None:
+        for prefix, pair in config["veth_pairs"].items():
+            await create_veth_pair(pair["on"], prefix, pair["map"])
+
+    results: Results = {}
+    await _phase(results, "init_bridge", _bridges())
+    await _phase(results, "add_iface_to_container", _containers())
+    await _phase(results, "create_veth_pair", _veth_pairs())
+    await _phase(results, "reconcile (in sync)", reconcile(config))
+    return results
+
+
+async def _run_concurrent(containers: int) -> Results:
+    """Attach every container in one cold reconcile cycle.
+
+    :param containers: number of containers
+    :type containers: int
+    :return: results of the cycle
+    :rtype: Results
+    """
+    from app.orchestrator import reconcile  # noqa: PLC0415
+    from app.sim import get_sim_host  # noqa: PLC0415
+
+    config = _config(containers, 0)
+    host = get_sim_host()
+    for parent in _PARENTS:
+        host.add_link(parent)
+    for container in config["container"]:
+        host.add_container(container)
+
+    results: Results = {}
+    await _phase(results, "reconcile (cold)", reconcile(config))
+    return results
+
+
+def _child(run: str, containers: int, output: Path) -> None:
+    """Run one benchmark inside the child process and save its results.
+
+    :param run: "sequential" or "concurrent"
+    :type run: str
+    :param containers: number of containers
+    :type containers: int
+    :param output: file to write the results to, as JSON
+    :type output: Path
+    """
+    logging.disable(logging.WARNING)
+    bench = _run_sequential if run == "sequential" else _run_concurrent
+    results = asyncio.run(bench(containers))
+    output.write_text(json.dumps(results), encoding="utf-8")
+
+
+def _spawn(run: str, containers: int, mode: str, latency: float = 0.0) -> Results:
+    """Run one benchmark on a fresh simulated host and state store.
+
+    :param run: "sequential" or "concurrent"
+    :type run: str
+    :param containers: number of containers
+    :type containers: int
+    :param mode: "ovs" or "linux" bridges
+    :type mode: str
+    :param latency: seconds every host command takes
+    :type latency: float
+    :return: results per phase
+    :rtype: Results
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp, "results.json")
+        env = {
+            **os.environ,
+            "SIMULATED_HOST": "true",
+            "SIMULATED_COMMAND_LATENCY": str(latency),
+            "USE_LINUX_BRIDGE": "true" if mode == "linux" else "false",
+            "DB_PATH": str(Path(tmp, "db.sqlite")),
+        }
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.reconcile_bench",
+                "--child",
+                run,
+                str(containers),
+                str(output),
+            ],
+            env=env,
+            check=True,
+        )
+        return json.loads(output.read_text(encoding="utf-8"))
+
+
+def _report(key: str, result: dict[str, Any]) -> None:
+    commands = result["commands"]
+    total = sum(commands.values())
+    detail = ", ".join(f"{binary} {n}" for binary, n in commands.items())
+    print(  # noqa: T201
+        f"{key:44} {result['seconds'] * 1e3:10.1f} ms {total:7} commands"
+        + (f" ({detail})" if detail else "")
+    )
+
+
+def _regressions(results: Results, baseline: Results, tolerance: float) -> list[str]:
+    """Compare results with a baseline.
+
+    :param results: results keyed by "<mode>/<containers>/<phase>"
+    :type results: Results
+    :param baseline: earlier results, keyed the same way
+    :type baseline: Results
+    :param tolerance: allowed relative increase of the wall time
+    :type tolerance: float
+    :return: description of every regression
+    :rtype: list[str]
+    """
+    found = []
+    for key, result in results.items():
+        if (base := baseline.get(key)) is None:
+            continue
+        for binary, count in result["commands"].items():
+            if count > base["commands"].get(binary, 0):
+                found.append(
+                    f"{key}: {count} {binary} commands, "
+                    f"baseline {base['commands'].get(binary, 0)}"
+                )
+        limit = base["seconds"] * (1 + tolerance) + _SLACK
+        if result["seconds"] > limit:
+            found.append(
+                f"{key}: {result['seconds'] * 1e3:.1f} ms, "
+                f"baseline {base['seconds'] * 1e3:.1f} ms"
+            )
+    return found
+
+
+def main() -> None:
+    """Run the benchmarks, print the results and check them."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000")
+    parser.add_argument("--modes", default="ovs,linux")
+    parser.add_argument("--concurrent", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--save", type=Path)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run, containers, output = args.child
+        _child(run, int(containers), Path(output))
+        return
+
+    results: Results = {}
+    for mode in args.modes.split(","):
+        for size in map(int, args.sizes.split(",")):
+            for phase, result in _spawn("sequential", size, mode).items():
+                results[f"{mode}/{size}/{phase}"] = result
+                _report(f"{mode}/{size}/{phase}", result)
+        if args.concurrent:
+            runs = _spawn("concurrent", args.concurrent, mode, args.latency)
+            for phase, result in runs.items():
+                key = f"{mode}/{args.concurrent}/{phase}"
+                results[key] = result
+                _report(key, result)
+                serial = args.latency * sum(
+                    n
+                    for binary, n in result["commands"].items()
+                    if binary not in _API_BACKENDS
+                )
+                print(  # noqa: T201
+                    f"{'':44} {serial * 1e3:10.1f} ms of command latency "
+                    f"at {args.latency * 1e3:g} ms each"
+                )
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if found := _regressions(results, baseline, args.tolerance):
+            print("Regressions against the baseline:", *found, sep="\n  ")  # noqa: T201
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
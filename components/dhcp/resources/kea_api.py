@@ -3,12 +3,19 @@
 # pylint: disable=import-error
 # pylint: disable=W0622
 # pylint: disable=too-few-public-methods
+import asyncio
 import json
 import logging
+import os
 import subprocess
 from asyncio import Lock, wait_for
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from functools import cache
 from pathlib import Path
-from typing import Literal
+from typing import Any, Literal
 
 import httpx
 import uvicorn
@@ -17,8 +24,27 @@ from fastapi.exceptions import HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
-_LOCK = Lock()
-APP = FastAPI()
+# Hardcoding the defaults, since it runs on a Debian Image.
+KEA_CONFIG_DIR = Path(os.environ.get("KEA_CONFIG_DIR", "/etc/kea"))
+KEA_CTRL_AGENT_URL = os.environ.get("KEA_CTRL_AGENT_URL", "http://localhost:8000")
+# Seconds an update request may take, rollback included
+UPDATE_TIMEOUT = float(os.environ.get("KEA_UPDATE_TIMEOUT", "15"))
+# Seconds updates of other boards are collected to be loaded together
+COALESCE_WINDOW = float(os.environ.get("KEA_COALESCE_WINDOW", "0.05"))
+# Seconds between two checks of the DHCP services by the health monitor
+HEALTH_INTERVAL = float(os.environ.get("KEA_HEALTH_INTERVAL", "10"))
+_SERVICES: tuple[Literal["dhcp4", "dhcp6"], ...] = ("dhcp4", "dhcp6")
+# status-get attempts, and seconds between them, confirming a started service
+_START_CHECKS = 5
+_START_CHECK_DELAY = 0.2
+# Reservation data keyed by these pools holds one subnet block per pool
+_POOLS = ("data", "voice", "oam")
+# Host reservation identifiers understood by the host_cmds hook
+_IDENTIFIERS = ("hw-address", "duid", "client-id", "circuit-id", "flex-id")
+# Result of a command no loaded hook library provides
+_RESULT_UNSUPPORTED = 2
+# Error of the control agent when the server does not answer
+_UNREACHABLE = "unable to forward command"
 
 LOG_CONFIG = uvicorn.config.LOGGING_CONFIG
 LOG_HANDLERS = {
@@ -39,6 +65,37 @@ LOG_HANDLERS = {
 }
 
 
+@cache
+def get_client() -> httpx.AsyncClient:
+    """Return the HTTP client shared by all requests.
+
+    Connections to the KEA control agent are kept alive between requests.
+
+    :return: client for the KEA control agent
+    :rtype: httpx.AsyncClient
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(UPDATE_TIMEOUT),
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=8),
+    )
+
+
+@asynccontextmanager
+async def _lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    monitor = asyncio.create_task(get_monitor().run())
+    yield
+    monitor.cancel()
+    if get_client.cache_info().currsize:
+        await get_client().aclose()
+
+
+APP = FastAPI(lifespan=_lifespan)
+
+
+class UnsupportedCommandError(ValueError):
+    """Raised when the DHCP server does not know a command."""
+
+
 class DHCPData(BaseModel):
     """DHCP Config Data."""
 
@@ -46,36 +103,45 @@ class DHCPData(BaseModel):
     reservation_data: dict
 
 
-def check_and_start_service(service: Literal["dhcp4", "dhcp6"]) -> None:
-    """Check the status of the specified DHCP service and start it if inactive.
+class BulkDHCPData(BaseModel):
+    """DHCP Config Data of many boards."""
 
-    This function runs the `keactrl status` command to check if the specified
-    DHCP service (dhcp4 or dhcp6) is active. If the service is inactive, it
-    calls `start_service` to start the service.
+    dhcp4: list[DHCPData] = []
+    dhcp6: list[DHCPData] = []
 
-    :param service: The DHCP service to check and start if inactive.
-                    Must be either "dhcp4" or "dhcp6".
-    :type service: Literal["dhcp4", "dhcp6"]
-    """
-    try:
-        # Run the `keactrl status` command and capture the output
-        result = subprocess.run(
-            ["keactrl", "status"], capture_output=True, text=True, check=True
-        )
-        output = result.stdout
 
-        # Check the status of the specified service
-        service_status = f"DHCPv{service[-1]} server: active" in output
+async def _keactrl(*args: str) -> str:
+    """Run keactrl without blocking the event loop.
 
-        # If the specified service is inactive, start it
-        if not service_status:
-            start_service(service)
+    keactrl is killed if the calling task is cancelled, e.g. on timeout.
 
-    except subprocess.CalledProcessError as e:
-        logging.exception("Error checking status: %s", e.stderr)
+    :param args: keactrl arguments
+    :type args: str
+    :return: standard output
+    :rtype: str
+    :raises subprocess.CalledProcessError: if keactrl fails
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "keactrl",
+        *args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await asyncio.shield(proc.wait())
+        raise
+    if proc.returncode:
+        raise subprocess.CalledProcessError(
+            proc.returncode, ["keactrl", *args], stdout.decode(), stderr.decode()
+        )
+    return stdout.decode()
 
 
-def start_service(service: Literal["dhcp4", "dhcp6"]) -> None:
+async def start_service(service: Literal["dhcp4", "dhcp6"]) -> bool:
     """Start the specified DHCP service.
 
     This function runs the `keactrl start -s <service>` command to start the
@@ -83,82 +149,694 @@ def start_service(service: Literal["dhcp4", "dhcp6"]) -> None:
 
     :param service: The DHCP service to start. Must be either "dhcp4" or "dhcp6".
     :type service: Literal["dhcp4", "dhcp6"]
+    :return: False if keactrl failed to start the service
+    :rtype: bool
     """
     try:
         # Start the specified service (dhcp4 or dhcp6)
-        subprocess.run(
-            ["keactrl", "start", "-s", service],
-            capture_output=True,
-            text=True,
-            check=True,
-        )
+        await _keactrl("start", "-s", service)
     except subprocess.CalledProcessError as e:
         logging.exception("Error starting %s service: %s", service, e.stderr)
+        return False
+    return True
 
 
-def _update_reservation(data: DHCPData, mode: str) -> None:
-    """Use to update DHCPv4/v6 reservation data for a board.
+class ServiceMonitor:
+    """Keep the state of the DHCP services cached.
 
-    :param data: DHCP options data per service pool
-    :type data: DHCPData
+    The services are checked every HEALTH_INTERVAL seconds, and as soon as
+    a command to the control agent fails. A check asks the control agent
+    for the status-get of each service, which forks nothing; keactrl
+    status is only run if the control agent does not answer. Services
+    found inactive are started right away.
+    """
+
+    def __init__(self) -> None:
+        """Create the monitor, the state of every service is unknown."""
+        self.active: dict[str, bool] = {}
+        self._check_task: asyncio.Task[set[str]] | None = None
+        self._wake = asyncio.Event()
+
+    async def _status(self, service: str) -> bool | None:
+        """Ask the control agent whether a service is up.
+
+        :param service: "dhcp4" or "dhcp6"
+        :type service: str
+        :return: whether the service answers, None if the agent does not
+        :rtype: bool | None
+        """
+        try:
+            response = await get_client().post(
+                url=KEA_CTRL_AGENT_URL,
+                json={"command": "status-get", "service": [service]},
+            )
+            response.raise_for_status()
+            # The agent answers with an error if it cannot reach the service
+            return response.json()[0]["result"] == 0
+        except (httpx.HTTPError, ValueError, LookupError):
+            return None
+
+    async def _check(self) -> set[str]:
+        """Check every service and start the inactive ones.
+
+        :return: the services started, which so loaded the current files
+        :rtype: set[str]
+        """
+        states = await asyncio.gather(*(self._status(s) for s in _SERVICES))
+        if None in states:
+            try:
+                output = await _keactrl("status")
+            except subprocess.CalledProcessError as e:
+                logging.exception("Error checking status: %s", e.stderr)
+                self.active = {}
+                return set()
+            states = [f"DHCPv{s[-1]} server: active" in output for s in _SERVICES]
+
+        started = set()
+        active = {}
+        for service, up in zip(_SERVICES, states, strict=True):
+            active[service] = bool(up)
+            if not up:
+                logging.warning("DHCP service %s is inactive, starting it", service)
+                if await start_service(service) and await self._started(service):
+                    active[service] = True
+                    started.add(service)
+        self.active = active
+        return started
+
+    async def _started(self, service: str) -> bool:
+        """Wait for a service just started to answer the control agent.
+
+        :param service: "dhcp4" or "dhcp6"
+        :type service: str
+        :return: False if the service does not answer
+        :rtype: bool
+        """
+        for attempt in range(_START_CHECKS):
+            if attempt:
+                await asyncio.sleep(_START_CHECK_DELAY)
+            if await self._status(service):
+                return True
+        logging.error("DHCP service %s does not answer after starting it", service)
+        return False
+
+    async def refresh(self) -> set[str]:
+        """Check the services now, joining a check already running.
+
+        :return: the services started by this call
+        :rtype: set[str]
+        """
+        if self._check_task is not None and not self._check_task.done():
+            # Files written meanwhile may have missed the start, reload them
+            await asyncio.shield(self._check_task)
+            return set()
+        self._check_task = asyncio.create_task(self._check())
+        return await asyncio.shield(self._check_task)
+
+    async def ensure(self, *services: str) -> set[str]:
+        """Make sure services are active, from the cached state if known.
+
+        A service that failed to start is not reported as started, so the
+        caller still reloads, and learns about the failure from the reload.
+
+        :param services: "dhcp4" or "dhcp6"
+        :type services: str
+        :return: the services started, which so loaded the current files
+        :rtype: set[str]
+        """
+        if all(self.active.get(service) for service in services):
+            return set()
+        return await self.refresh() & set(services)
+
+    def report_failure(self) -> None:
+        """Forget the cached state and check the services right away."""
+        self.active = {}
+        self._wake.set()
+
+    async def run(self) -> None:
+        """Check the services every HEALTH_INTERVAL seconds, until cancelled."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logging.exception("Checking the DHCP services failed")
+            with suppress(TimeoutError):
+                await wait_for(self._wake.wait(), timeout=HEALTH_INTERVAL)
+            self._wake.clear()
+
+
+@cache
+def get_monitor() -> ServiceMonitor:
+    """Return the health monitor of the DHCP services.
+
+    :return: monitor shared by all requests
+    :rtype: ServiceMonitor
+    """
+    return ServiceMonitor()
+
+
+async def check_and_start_services(
+    *services: Literal["dhcp4", "dhcp6"],
+) -> set[str]:
+    """Check the status of DHCP services and start the inactive ones.
+
+    The cached state of the health monitor is used while it is known, so
+    this usually costs nothing.
+
+    :param services: The DHCP services to check and start if inactive.
+    :type services: Literal["dhcp4", "dhcp6"]
+    :return: the services started, which so loaded the current files
+    :rtype: set[str]
+    """
+    return await get_monitor().ensure(*services)
+
+
+async def check_and_start_service(service: Literal["dhcp4", "dhcp6"]) -> bool:
+    """Check the status of the specified DHCP service and start it if inactive.
+
+    :param service: The DHCP service to check and start if inactive.
+                    Must be either "dhcp4" or "dhcp6".
+    :type service: Literal["dhcp4", "dhcp6"]
+    :return: True if the service was started, and so loaded the current files
+    :rtype: bool
+    """
+    return service in await check_and_start_services(service)
+
+
+def _board_file(board_id: str, mode: str) -> Path:
+    """Return the reservation file of a board.
+
+    :param board_id: board identifier
+    :type board_id: str
     :param mode: IP address family, Can be either v4/v6
     :type mode: str
-    :raises ValueError: In case DHCP settings do not get applied
+    :return: path of the file included by the Kea server config
+    :rtype: Path
+    """
+    return KEA_CONFIG_DIR / f"board-v{mode}-{board_id}.json"
+
+
+def _render(reservation_data: dict) -> str:
+    """Render reservation data the way the Kea server config includes it.
+
+    :param reservation_data: DHCP options data per service pool
+    :type reservation_data: dict
+    :return: a comma separated list of subnet blocks, one per pool, or a
+             single JSON document
+    :rtype: str
+    """
+    if any(pool in reservation_data for pool in _POOLS):
+        blocks = [json.dumps(i, indent=4) for i in reservation_data.values()]
+        return ",\n".join(blocks)
+    return json.dumps(reservation_data, indent=4)
+
+
+def _subnet_blocks(text: str) -> list[dict[str, Any]] | None:
+    """Parse a reservation file written as a list of subnet blocks.
+
+    :param text: content of the reservation file
+    :type text: str
+    :return: the subnet blocks, or None if the file holds something else
+    :rtype: list[dict[str, Any]] | None
     """
-    # Hardcoding the path, since it runs on a Debian Image.
-    fpath = f"/etc/kea/board-v{mode}-{data.board_id}.json"
-
-    path = Path(fpath)
-    Path(f"{fpath}.old").write_text(path.read_text(encoding="UTF-8"), encoding="UTF-8")
-
-    # write new config
-    if (
-        "data" in data.reservation_data
-        or "voice" in data.reservation_data
-        or "oam" in data.reservation_data
-    ):
-        blocks = [json.dumps(i, indent=4) for i in data.reservation_data.values()]
-        path.write_text(",\n".join(blocks), encoding="UTF-8")
-    else:
-        json.dump(data.reservation_data, path.open("w", encoding="UTF-8"), indent=4)
-
-    # check if DHCPv4 is running before updating reservation
-    if mode == "4":
-        check_and_start_service("dhcp4")
-    else:
-        check_and_start_service("dhcp6")
-
-    # reload the DHCP server via KEA Backend API.
-    response = httpx.post(
-        url="http://localhost:8000",
-        json={"command": "config-reload", "service": [f"dhcp{mode}"]},
+    try:
+        blocks = json.loads(f"[{text}]")
+    except json.JSONDecodeError:
+        return None
+    if not all(isinstance(block, dict) and "id" in block for block in blocks):
+        return None
+    return blocks
+
+
+def _host_key(host: dict[str, Any]) -> tuple[str, str] | None:
+    return next(
+        ((kind, str(host[kind])) for kind in _IDENTIFIERS if kind in host), None
     )
-    response.raise_for_status()
+
+
+def _reservation_changes(old_text: str, new_text: str) -> list[dict] | None:
+    """Plan the host commands turning the loaded reservations into new ones.
+
+    Only the reservations of a subnet may change. Added, removed or
+    renumbered subnets, or any change to a subnet other than its
+    reservations, like its pools or options, need a full reload.
+
+    :param old_text: reservation file loaded by the server
+    :type old_text: str
+    :param new_text: reservation file to load
+    :type new_text: str
+    :return: reservation-del and reservation-add arguments, deletions first,
+             or None if the server config must be reloaded
+    :rtype: list[dict] | None
+    """
+    old_blocks, new_blocks = _subnet_blocks(old_text), _subnet_blocks(new_text)
+    if old_blocks is None or new_blocks is None:
+        return None
+    if [b["id"] for b in old_blocks] != [b["id"] for b in new_blocks]:
+        return None
+
+    deletions: list[dict] = []
+    additions: list[dict] = []
+    for old, new in zip(old_blocks, new_blocks, strict=True):
+        if (changes := _subnet_changes(old, new)) is None:
+            return None
+        deletions += changes[0]
+        additions += changes[1]
+    return [
+        *({"command": "reservation-del", "arguments": d} for d in deletions),
+        *({"command": "reservation-add", "arguments": a} for a in additions),
+    ]
+
+
+def _subnet_changes(
+    old: dict[str, Any], new: dict[str, Any]
+) -> tuple[list[dict], list[dict]] | None:
+    """Diff the host reservations of a subnet block.
+
+    :param old: loaded subnet block
+    :type old: dict[str, Any]
+    :param new: subnet block to load
+    :type new: dict[str, Any]
+    :return: reservation-del and reservation-add arguments, or None if
+             something else than the reservations changed
+    :rtype: tuple[list[dict], list[dict]] | None
+    """
+    old_hosts = old.pop("reservations", [])
+    new_hosts = new.pop("reservations", [])
+    if old != new:
+        return None
+    old_keys = {_host_key(host): host for host in old_hosts}
+    new_keys = {_host_key(host): host for host in new_hosts}
+    if None in old_keys or None in new_keys:
+        return None
+    if len(old_keys) != len(old_hosts) or len(new_keys) != len(new_hosts):
+        return None
+    deletions = [
+        {
+            "subnet-id": old["id"],
+            "identifier-type": key[0],
+            "identifier": key[1],
+            "operation-target": "memory",
+        }
+        for key, host in old_keys.items()
+        if key is not None and new_keys.get(key) != host
+    ]
+    additions = [
+        {"reservation": {**host, "subnet-id": new["id"]}, "operation-target": "memory"}
+        for key, host in new_keys.items()
+        if old_keys.get(key) != host
+    ]
+    return deletions, additions
+
+
+async def _kea_command(command: str, mode: str, arguments: dict | None = None) -> None:
+    """Send a command to the DHCP server through the KEA control agent.
+
+    :param command: command name, e.g. "config-reload"
+    :type command: str
+    :param mode: IP address family, Can be either v4/v6
+    :type mode: str
+    :param arguments: command arguments
+    :type arguments: dict | None
+    :raises UnsupportedCommandError: if no hook library provides the command
+    :raises ValueError: if the server reports an error
+    """
+    body: dict[str, Any] = {"command": command, "service": [f"dhcp{mode}"]}
+    if arguments is not None:
+        body["arguments"] = arguments
+    try:
+        response = await get_client().post(url=KEA_CTRL_AGENT_URL, json=body)
+        response.raise_for_status()
+    except httpx.HTTPError:
+        get_monitor().report_failure()
+        raise
     # Turns out error messages on KEA don't throw an error code.
     output = response.json()
     if output[0]["result"] != 0:
+        if _UNREACHABLE in output[0]["text"]:
+            get_monitor().report_failure()
+        if output[0]["result"] == _RESULT_UNSUPPORTED:
+            raise UnsupportedCommandError(output[0]["text"])
         raise ValueError(output[0]["text"])
 
 
-def rollback(data: DHCPData, mode: str) -> None:
-    """Rollback DHCPv4/v6 configurations.
+def _write_atomic(path: Path, text: str) -> None:
+    """Replace a file, so the server never loads a partly written one.
+
+    :param path: file to write
+    :type path: Path
+    :param text: new content
+    :type text: str
+    """
+    tmp = Path(f"{path}.tmp")
+    tmp.write_text(text, encoding="UTF-8")
+    tmp.replace(path)
+
+
+def _write_board_file(path: Path, new_text: str) -> str:
+    """Back up a reservation file and write its new content.
+
+    :param path: reservation file
+    :type path: Path
+    :param new_text: new content
+    :type new_text: str
+    :return: previous content
+    :rtype: str
+    """
+    old_text = path.read_text(encoding="UTF-8")
+    Path(f"{path}.old").write_text(old_text, encoding="UTF-8")
+    _write_atomic(path, new_text)
+    return old_text
+
+
+def _restore_board_file(path: Path) -> str:
+    """Restore a reservation file from its backup.
+
+    :param path: reservation file
+    :type path: Path
+    :return: restored content
+    :rtype: str
+    """
+    old_text = Path(f"{path}.old").read_text(encoding="UTF-8")
+    _write_atomic(path, old_text)
+    return old_text
+
+
+def _new_future() -> asyncio.Future[None]:
+    return asyncio.get_running_loop().create_future()
+
+
+@dataclass(eq=False)
+class _Change:
+    """A board file to write and load, written by the queue worker."""
+
+    board_id: str
+    path: Path
+    # None to restore the file from its backup
+    new_text: str | None
+    # Load with a config-reload even if only host reservations changed
+    reload: bool = False
+    # The caller checked the service already
+    checked: bool = False
+    # Content replaced, known once written
+    old_text: str = ""
+    result: asyncio.Future[None] = field(default_factory=_new_future)
+
+    def write(self) -> None:
+        """Write the board file, keeping its previous content as backup."""
+        if self.new_text is None:
+            self.new_text = _restore_board_file(self.path)
+        else:
+            self.old_text = _write_board_file(self.path, self.new_text)
+
+    def resolve(self, exc: Exception | None = None) -> None:
+        """Hand the caller its result, unless it gave up waiting.
+
+        :param exc: error to raise in the caller, None on success
+        :type exc: Exception | None
+        """
+        if self.result.done():
+            return
+        if exc is None:
+            self.result.set_result(None)
+        else:
+            self.result.set_exception(exc)
+
+
+def _write_changes(changes: list[_Change]) -> None:
+    for change in changes:
+        change.write()
+
+
+class ReservationQueue:
+    """Load the reservation changes of one address family in batches.
+
+    Updates of a board queue behind each other, see ``board_lock``. Changes
+    of any board submitted within COALESCE_WINDOW are loaded together: one
+    service check, host commands where they suffice and at most one
+    config-reload for the rest. Every caller still gets its own result.
+
+    Only the worker writes board files, right before loading them, so a
+    config-reload reads the files already loaded plus those of its batch.
+    """
+
+    def __init__(self, mode: str) -> None:
+        """Create the queue of an address family.
+
+        :param mode: IP address family, Can be either v4/v6
+        :type mode: str
+        """
+        self.mode = mode
+        self._boards: defaultdict[str, Lock] = defaultdict(Lock)
+        self._pending: list[_Change] = []
+        self._worker: asyncio.Task[None] | None = None
+        # Cleared once the server turns out not to load the host_cmds hook
+        self.host_cmds = True
+
+    def board_lock(self, board_id: str) -> Lock:
+        """Return the lock serialising the updates of a board.
+
+        :param board_id: board identifier
+        :type board_id: str
+        :return: lock to hold from submitting a change until loaded
+        :rtype: Lock
+        """
+        return self._boards[board_id]
+
+    async def submit(self, change: _Change) -> None:
+        """Queue a change and wait for the server to load it.
+
+        :param change: board file to write and load
+        :type change: _Change
+        :raises ValueError: if the server rejects the board file, which is
+            then restored from its backup
+        """
+        self._pending.append(change)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        try:
+            # The batch carries on for the other callers if this one leaves
+            await asyncio.shield(change.result)
+        except asyncio.CancelledError:
+            change.result.cancel()
+            raise
+
+    def withdraw(self, change: _Change) -> bool:
+        """Drop a change that is not written yet.
+
+        :param change: change submitted
+        :type change: _Change
+        :return: False if the worker took the change already
+        :rtype: bool
+        """
+        if change in self._pending:
+            self._pending.remove(change)
+            return True
+        return False
+
+    async def _run(self) -> None:
+        await asyncio.sleep(COALESCE_WINDOW)
+        # Changes submitted while a batch is loading make up the next one
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                await self._apply(batch)
+            except Exception as exc:  # noqa: BLE001
+                for change in batch:
+                    change.resolve(exc)
+
+    async def _apply(self, batch: list[_Change]) -> None:
+        """Load a batch of changes.
+
+        :param batch: changes of any boards, in submission order
+        :type batch: list[_Change]
+        """
+        await asyncio.to_thread(_write_changes, batch)
+        checked = all(change.checked for change in batch)
+        if not checked and await check_and_start_service(f"dhcp{self.mode}"):
+            # Freshly started, the server loaded every file already
+            for change in batch:
+                change.resolve()
+            return
+
+        changed = []
+        for change in batch:
+            if change.reload or change.new_text != change.old_text:
+                changed.append(change)
+            else:
+                change.resolve()
+        plans = [
+            None
+            if change.reload or not self.host_cmds
+            else _reservation_changes(change.old_text, change.new_text)
+            for change in changed
+        ]
+        if any(plan is None for plan in plans):
+            # One reload loads the host reservations of the others as well
+            await self._reload(changed)
+            return
+
+        reload = []
+        for change, plan in zip(changed, plans, strict=True):
+            if self.host_cmds and await self._host_commands(change, plan or []):
+                change.resolve()
+            else:
+                reload.append(change)
+        if reload:
+            await self._reload(reload)
+
+    async def _host_commands(self, change: _Change, plan: list[dict]) -> bool:
+        """Apply the host reservation changes of a board in memory.
+
+        :param change: change of a board
+        :type change: _Change
+        :param plan: host commands from _reservation_changes
+        :type plan: list[dict]
+        :return: False if a command failed and the file must be reloaded
+        :rtype: bool
+        """
+        try:
+            for command in plan:
+                await _kea_command(command["command"], self.mode, command["arguments"])
+        except UnsupportedCommandError:
+            logging.info(
+                "DHCPv%s server has no host_cmds hook, reloading on every change",
+                self.mode,
+            )
+            self.host_cmds = False
+            return False
+        except (ValueError, httpx.HTTPError):
+            logging.warning(
+                "Host commands failed for board %s, reloading DHCPv%s",
+                change.board_id,
+                self.mode,
+                exc_info=True,
+            )
+            return False
+        return True
+
+    async def _reload(self, changes: list[_Change]) -> None:
+        """Load changed board files with one config-reload.
+
+        If the server rejects the files of several boards, they are loaded
+        one board at a time to find the faulty ones. Only those are rolled
+        back, and their callers get the error.
+
+        :param changes: changes of any boards
+        :type changes: list[_Change]
+        """
+        try:
+            await _kea_command("config-reload", self.mode)
+        except (ValueError, httpx.HTTPError) as exc:
+            failed = (
+                [(changes[0], exc)]
+                if len(changes) == 1
+                else await self._isolate(changes)
+            )
+        else:
+            failed = []
+
+        faulty = {change for change, _exc in failed}
+        for change in changes:
+            if change not in faulty:
+                change.resolve()
+        if not failed:
+            return
+
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(_restore_board_file, change.path)
+                for change, _exc in failed
+            )
+        )
+        try:
+            # Drops any host reservation applied in memory before the failure
+            await _kea_command("config-reload", self.mode)
+        except (ValueError, httpx.HTTPError):
+            logging.exception("Reloading DHCPv%s after a rollback failed", self.mode)
+        for change, exc in failed:
+            change.resolve(exc)
+
+    async def _isolate(self, changes: list[_Change]) -> list[tuple[_Change, Exception]]:
+        """Load the board files of a failed reload one board at a time.
+
+        :param changes: changes loaded by the failed reload
+        :type changes: list[_Change]
+        :return: the changes the server rejects, with its error
+        :rtype: list[tuple[_Change, Exception]]
+        """
+        await asyncio.gather(
+            *(asyncio.to_thread(_restore_board_file, change.path) for change in changes)
+        )
+        failed: list[tuple[_Change, Exception]] = []
+        for change in changes:
+            await asyncio.to_thread(_write_atomic, change.path, change.new_text or "")
+            try:
+                await _kea_command("config-reload", self.mode)
+            except (ValueError, httpx.HTTPError) as exc:
+                await asyncio.to_thread(_restore_board_file, change.path)
+                failed.append((change, exc))
+        return failed
+
+
+@cache
+def get_queue(mode: str) -> ReservationQueue:
+    """Return the reservation queue of an address family.
+
+    :param mode: IP address family, Can be either v4/v6
+    :type mode: str
+    :return: queue shared by all requests of the family
+    :rtype: ReservationQueue
+    """
+    return ReservationQueue(mode)
+
+
+async def _update_reservation(
+    data: DHCPData, mode: str, *, checked: bool = False
+) -> None:
+    """Use to update DHCPv4/v6 reservation data for a board.
+
+    The board file is queued for writing and loading, see ReservationQueue.
+    When only host reservations changed, they are added and removed through
+    the host_cmds hook of the running server. Any other change, or a
+    failing host command, falls back to a config-reload. An update that
+    gets cancelled, e.g. on timeout, is rolled back.
 
     :param data: DHCP options data per service pool
     :type data: DHCPData
-    :param mode: IP address family, can be either v4/v6
+    :param mode: IP address family, Can be either v4/v6
     :type mode: str
+    :param checked: the service was checked already, defaults to False
+    :type checked: bool
+    :raises ValueError: In case DHCP settings do not get applied
     """
-    fpath = f"/etc/kea/board-v{mode}-{data.board_id}.json"
+    queue = get_queue(mode)
+    path = _board_file(data.board_id, mode)
+    new_text = _render(data.reservation_data)
+    change = _Change(data.board_id, path, new_text, checked=checked)
+    async with queue.board_lock(data.board_id):
+        try:
+            await queue.submit(change)
+        except asyncio.CancelledError:
+            if not queue.withdraw(change):
+                await rollback(data, mode)
+            raise
 
-    Path(fpath).write_text(
-        Path(f"{fpath}.old").read_text(encoding="UTF-8"), encoding="UTF-8"
-    )
 
-    response = httpx.post(
-        url="http://localhost:8000",
-        json={"command": "config-reload", "service": [f"dhcp{mode}"]},
-    )
-    response.raise_for_status()
+async def rollback(data: DHCPData, mode: str) -> None:
+    """Rollback DHCPv4/v6 configurations.
+
+    The server config is reloaded in full, which also drops any host
+    reservation applied in memory before the failure.
+
+    :param data: DHCP options data per service pool
+    :type data: DHCPData
+    :param mode: IP address family, can be either v4/v6
+    :type mode: str
+    """
+    path = _board_file(data.board_id, mode)
+    # The queue worker restores the file from its backup
+    await get_queue(mode).submit(_Change(data.board_id, path, None, reload=True))
 
 
 async def update_dhcp_reservations(data: DHCPData) -> None:
@@ -167,7 +845,7 @@ async def update_dhcp_reservations(data: DHCPData) -> None:
     :param data: DHCPv4 options data per service pool
     :type data: DHCPData
     """
-    _update_reservation(data=data, mode="4")
+    await _update_reservation(data=data, mode="4")
 
 
 async def update_dhcp6_reservations(data: DHCPData) -> None:
@@ -176,16 +854,15 @@ async def update_dhcp6_reservations(data: DHCPData) -> None:
     :param data: DHCPv6 options data per service pool
     :type data: DHCPData
     """
-    _update_reservation(data=data, mode="6")
+    await _update_reservation(data=data, mode="6")
 
 
 @APP.post("/update_dhcp")
 async def update_dhcp_with_lock(data: DHCPData) -> JSONResponse:
-    """Update DHCPv4 server only if you have a lock.
+    """Update DHCPv4 server, after the pending updates of the same board.
 
     :param data: DHCPv4 options data per service pool
     :type data: DHCPData
-    :raises HTTPException: 503, if lock to update is acquired by another request
     :raises HTTPException: 500, if configuration update times out
     :raises HTTPException: 512, if invalid configuration
     :return: KEA Server update response
@@ -193,38 +870,29 @@ async def update_dhcp_with_lock(data: DHCPData) -> JSONResponse:
     """
     output = JSONResponse(content={"detail": "Success"})
 
-    if _LOCK.locked():
+    try:
+        await wait_for(update_dhcp_reservations(data), timeout=UPDATE_TIMEOUT)
+    except TimeoutError as exc:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Service busy"
-        )
-
-    async with _LOCK:
-        try:
-            await wait_for(update_dhcp_reservations(data), timeout=15)
-        except TimeoutError as exc:
-            rollback(data, mode="4")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Update request timed Out!!",
-                headers={"exc-msg": f"{exc}"},
-            ) from exc
-        except ValueError as exc:
-            rollback(data, mode="4")
-            raise HTTPException(
-                status_code=512,
-                detail="Failed to update DHCP reservation.",
-                headers={"kea-error": f"{exc}"},
-            ) from exc
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Update request timed Out!!",
+            headers={"exc-msg": f"{exc}"},
+        ) from exc
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=512,
+            detail="Failed to update DHCP reservation.",
+            headers={"kea-error": f"{exc}"},
+        ) from exc
     return output
 
 
 @APP.post("/update_dhcp6")
 async def update_dhcp6_with_lock(data: DHCPData) -> JSONResponse:
-    """Update DHCPv6 server only if you have a lock.
+    """Update DHCPv6 server, after the pending updates of the same board.
 
     :param data: DHCPv6 options data per service pool
     :type data: DHCPData
-    :raises HTTPException: 503, if lock to update is acquired by another request
     :raises HTTPException: 500, if configuration update times out
     :raises HTTPException: 512, if invalid configuration
     :return: KEA Server update response
@@ -232,30 +900,94 @@ async def update_dhcp6_with_lock(data: DHCPData) -> JSONResponse:
     """
     output = JSONResponse(content={"detail": "Success"})
 
-    if _LOCK.locked():
+    try:
+        await wait_for(update_dhcp6_reservations(data), timeout=UPDATE_TIMEOUT)
+    except TimeoutError as exc:
         raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Service busy"
-        )
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Update request timed Out!!",
+            headers={"exc-msg": f"{exc}"},
+        ) from exc
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=512,
+            detail="Failed to update DHCP reservation.",
+            headers={"kea-error": f"{exc}"},
+        ) from exc
 
-    async with _LOCK:
-        try:
-            await wait_for(update_dhcp6_reservations(data), timeout=15)
-        except TimeoutError as exc:
-            rollback(data, mode="6")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Update request timed Out!!",
-                headers={"exc-msg": f"{exc}"},
-            ) from exc
-        except ValueError as exc:
-            rollback(data, mode="6")
+    return output
+
+
+async def _update_bulk(data: BulkDHCPData) -> dict[str, dict[str, str]]:
+    """Update the DHCPv4/v6 reservations of many boards.
+
+    The services are checked once, then every board file is queued at
+    the same time, so each family gets at most one config-reload.
+
+    :param data: reservation data per board and family
+    :type data: BulkDHCPData
+    :return: "Success" or the KEA error, per family and board
+    :rtype: dict[str, dict[str, str]]
+    """
+    families = {"4": data.dhcp4, "6": data.dhcp6}
+    started = await check_and_start_services(
+        *(f"dhcp{mode}" for mode, boards in families.items() if boards)
+    )
+    updates = [(mode, board) for mode, boards in families.items() for board in boards]
+    outcomes = await asyncio.gather(
+        *(
+            _update_reservation(board, mode, checked=f"dhcp{mode}" not in started)
+            for mode, board in updates
+        ),
+        return_exceptions=True,
+    )
+    results: dict[str, dict[str, str]] = {"dhcp4": {}, "dhcp6": {}}
+    for (mode, board), outcome in zip(updates, outcomes, strict=True):
+        if isinstance(outcome, BaseException) and not isinstance(outcome, ValueError):
+            raise outcome
+        results[f"dhcp{mode}"][board.board_id] = str(outcome or "Success")
+    return results
+
+
+@APP.post("/update_dhcp_bulk")
+async def update_dhcp_bulk(data: BulkDHCPData) -> JSONResponse:
+    """Update DHCPv4 and DHCPv6 servers for many boards at once.
+
+    Boards rejected by the server are rolled back, the others are kept.
+
+    :param data: reservation data per board and family
+    :type data: BulkDHCPData
+    :raises HTTPException: 422, if a board is listed twice for a family
+    :raises HTTPException: 500, if configuration update times out
+    :return: result per family and board, status 512 if any board failed
+    :rtype: JSONResponse
+    """
+    for boards in (data.dhcp4, data.dhcp6):
+        if len({board.board_id for board in boards}) != len(boards):
             raise HTTPException(
-                status_code=512,
-                detail="Failed to update DHCP reservation.",
-                headers={"kea-error": f"{exc}"},
-            ) from exc
+                status_code=422,
+                detail="Duplicate board_id.",
+            )
 
-    return output
+    try:
+        results = await wait_for(_update_bulk(data), timeout=UPDATE_TIMEOUT)
+    except TimeoutError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Update request timed Out!!",
+            headers={"exc-msg": f"{exc}"},
+        ) from exc
+
+    failed = any(
+        result != "Success" for family in results.values() for result in family.values()
+    )
+    return JSONResponse(
+        status_code=512 if failed else status.HTTP_200_OK,
+        content={
+            "detail": "Failed to update DHCP reservation." if failed else "Success",
+            **results,
+        },
+    )
 
 
 if __name__ == "__main__":